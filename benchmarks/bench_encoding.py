@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""Micro-benchmark di sanitize_ascii / format_number_ascii (shared.encoding_utils).
+
+Confronta le implementazioni attuali (short-circuit ASCII, tabella di
+traduzione per i caratteri di controllo, format spec ``,``) con quelle precedenti, riportate qui
+come riferimento, su righe di report realistiche. Fallisce (exit 1) se un
+qualsiasi risultato differisce.
+
+Uso:
+    python benchmarks/bench_encoding.py --lines 20000
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import timeit
+import unicodedata
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.append(str(REPO_ROOT))
+
+from shared.encoding_utils import format_number_ascii, sanitize_ascii
+
+
+def reference_sanitize_ascii(text: str) -> str:
+    """Implementazione storica (solo per confronto)."""
+    if not isinstance(text, str):
+        text = str(text)
+    text = text.replace('\ufeff', '').replace('\u200b', '').replace('\u200c', '').replace('\u200d', '')
+    normalized = unicodedata.normalize("NFKD", text)
+    cleaned = ''.join(c for c in normalized if ord(c) < 128 or c in '\t\n\r')
+    result = cleaned.encode("ascii", "ignore").decode("ascii")
+    result = ''.join(c if ord(c) < 128 and (c.isprintable() or c in '\t\n\r') else ' ' for c in result)
+    return result
+
+
+def reference_format_number_ascii(num: int | float) -> str:
+    """Implementazione storica (solo per confronto)."""
+    if isinstance(num, float):
+        num = int(num)
+    sign = '-' if num < 0 else ''
+    num = abs(num)
+    num_str = str(num)
+    parts = []
+    for i, digit in enumerate(reversed(num_str)):
+        if i > 0 and i % 3 == 0:
+            parts.append(',')
+        parts.append(digit)
+    return sign + ''.join(reversed(parts))
+
+
+def report_lines(count: int, seed: int = 7) -> list[str]:
+    """Righe nel formato di auto_report.py; ~5% con caratteri non ASCII."""
+    rng = random.Random(seed)
+    names = ["EUR", "JPY", "GOLD", "S&P 500", "E-MINI S&P 500", "Russell 2000"]
+    lines = []
+    for i in range(count):
+        name = rng.choice(names)
+        if i % 20 == 0:
+            name = "\ufeffCAF\u00c9 \u2013 \u00c9CHANGE"
+        delta, bias = rng.randint(-20000, 20000), rng.randint(-200000, 200000)
+        lines.append(
+            f"{name}: DELTA settimana {delta:+d} (Long: +{rng.randint(0, 9999)}, "
+            f"Short: -{rng.randint(0, 9999)}); BIAS aperto {bias:+d} "
+            f"(Long: {rng.randint(0, 300000)}, Short: {rng.randint(0, 300000)}) (allineato)"
+        )
+    return lines
+
+
+def _per_call_us(func, items, repeat: int) -> float:
+    """Miglior tempo per elemento, in microsecondi."""
+    best = min(timeit.repeat(lambda: [func(x) for x in items], number=1, repeat=repeat))
+    return best / len(items) * 1e6
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark encoding utils")
+    parser.add_argument("--lines", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    lines = report_lines(args.lines)
+    ascii_lines = [line for line in lines if line.isascii()]
+    numbers = [random.Random(1).randint(-10**9, 10**9) for _ in range(args.lines)]
+
+    mismatched = [
+        line for line in lines if sanitize_ascii(line) != reference_sanitize_ascii(line)
+    ]
+    mismatched += [
+        str(n) for n in numbers if format_number_ascii(n) != reference_format_number_ascii(n)
+    ]
+
+    print(f"Righe: {len(lines):,} ({len(ascii_lines):,} solo ASCII)")
+    rows = [
+        ("sanitize_ascii (righe ASCII)", reference_sanitize_ascii, sanitize_ascii, ascii_lines),
+        ("sanitize_ascii (tutte le righe)", reference_sanitize_ascii, sanitize_ascii, lines),
+        ("format_number_ascii", reference_format_number_ascii, format_number_ascii, numbers),
+    ]
+    for label, before, after, items in rows:
+        old_us = _per_call_us(before, items, args.repeat)
+        new_us = _per_call_us(after, items, args.repeat)
+        print(f"{label:32s} prima {old_us:7.2f}us  dopo {new_us:7.2f}us  ({old_us / new_us:.1f}x)")
+
+    report = "\n".join(lines)
+    old_s = min(timeit.repeat(lambda: reference_sanitize_ascii(report), number=1, repeat=args.repeat))
+    new_s = min(timeit.repeat(lambda: sanitize_ascii(report), number=1, repeat=args.repeat))
+    print(f"{'sanitize_ascii (report intero)':32s} prima {old_s * 1e3:7.2f}ms  dopo {new_s * 1e3:7.2f}ms  "
+          f"({old_s / new_s:.1f}x)")
+
+    if mismatched:
+        print(f"[ERROR] Parita' fallita su {len(mismatched)} input, es: {mismatched[0]!r}")
+        return 1
+    print("[OK] Parita' verificata")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
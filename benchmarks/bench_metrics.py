@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""Parita' e benchmark del calcolo metriche di normalize_legacy_cot.py.
+
+Confronta ``_compute_metrics`` (``groupby().rolling()`` vettorizzato) con la
+vecchia implementazione ``groupby().apply(_group_metrics)``, riportata qui
+come riferimento, su un frame sintetico con ~400 mercati. Fallisce (exit 1)
+se una qualsiasi colonna metrica differisce.
+
+Uso:
+    python benchmarks/bench_metrics.py --markets 400 --weeks 1040
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.append(str(REPO_ROOT))
+
+from scripts.cot.normalize_legacy_cot import _compute_metrics
+
+METRIC_COLUMNS = [
+    "noncommercial_net",
+    "commercial_net",
+    "noncommercial_cot_index_156w",
+    "noncommercial_net_zscore_52w",
+    "noncommercial_net_change_wow",
+    "commercial_net_change_wow",
+]
+
+
+def reference_compute_metrics(df: pd.DataFrame) -> pd.DataFrame:
+    """Implementazione storica: apply Python per mercato (solo per confronto)."""
+    df = df.sort_values(["contract_market_code", "report_date"]).reset_index(drop=True)
+
+    df["noncommercial_net"] = df["noncommercial_long"] - df["noncommercial_short"]
+    df["commercial_net"] = df["commercial_long"] - df["commercial_short"]
+
+    def _group_metrics(group: pd.DataFrame) -> pd.DataFrame:
+        net = group["noncommercial_net"]
+
+        rolling_max = net.rolling(window=156, min_periods=1).max()
+        rolling_min = net.rolling(window=156, min_periods=1).min()
+        denominator = rolling_max - rolling_min
+        cot_index = (net - rolling_min) / denominator.replace(0, pd.NA)
+        group["noncommercial_cot_index_156w"] = (cot_index * 100).fillna(50.0)
+
+        mean_52 = net.rolling(window=52, min_periods=1).mean()
+        std_52 = net.rolling(window=52, min_periods=1).std(ddof=0)
+        group["noncommercial_net_zscore_52w"] = (net - mean_52) / std_52.replace(0, pd.NA)
+
+        group["noncommercial_net_change_wow"] = net.diff()
+        group["commercial_net_change_wow"] = group["commercial_net"].diff()
+        return group
+
+    return df.groupby("contract_market_code", group_keys=False).apply(_group_metrics)
+
+
+def synthetic_frame(markets: int, weeks: int, seed: int = 7) -> pd.DataFrame:
+    """Frame Legacy normalizzato con mercati di lunghezza diversa e casi limite."""
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2000-01-04", periods=weeks, freq="7D")
+    frames = []
+    for i in range(markets):
+        # Storie di lunghezza variabile: alcuni mercati nascono dopo
+        start = int(rng.integers(0, weeks // 2)) if i % 5 == 0 else 0
+        n = weeks - start
+        long_ = rng.integers(1_000, 250_000, n).astype(float)
+        short = rng.integers(1_000, 250_000, n).astype(float)
+        if i % 50 == 0:
+            short = long_.copy()  # net costante -> denominatori a zero
+        if i % 7 == 0:
+            long_[rng.integers(0, n, max(1, n // 100))] = np.nan
+        frames.append(pd.DataFrame({
+            "report_date": dates[start:],
+            "contract_market_code": f"{i:06d}",
+            "noncommercial_long": long_,
+            "noncommercial_short": short,
+            "commercial_long": rng.integers(1_000, 250_000, n).astype(float),
+            "commercial_short": rng.integers(1_000, 250_000, n).astype(float),
+        }))
+    # Ordine mescolato come dopo la concatenazione di piu' file
+    return pd.concat(frames, ignore_index=True).sample(frac=1, random_state=seed)
+
+
+def _timed(func, frame: pd.DataFrame, repeat: int) -> tuple[float, pd.DataFrame]:
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(frame.copy())
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def check_parity(expected: pd.DataFrame, actual: pd.DataFrame) -> list[str]:
+    """Colonne metriche non identiche bit a bit (NaN == NaN)."""
+    mismatched = []
+    for column in METRIC_COLUMNS:
+        left = pd.to_numeric(expected[column], errors="coerce").to_numpy(dtype=float)
+        right = pd.to_numeric(actual[column], errors="coerce").to_numpy(dtype=float)
+        if not np.array_equal(left, right, equal_nan=True):
+            mismatched.append(column)
+    return mismatched
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark rolling metrics engine")
+    parser.add_argument("--markets", type=int, default=400)
+    parser.add_argument("--weeks", type=int, default=520)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    frame = synthetic_frame(args.markets, args.weeks)
+    print(f"Frame sintetico: {len(frame):,} righe, {args.markets} mercati, {args.weeks} settimane")
+
+    ref_time, expected = _timed(reference_compute_metrics, frame, args.repeat)
+    new_time, actual = _timed(_compute_metrics, frame, args.repeat)
+
+    mismatched = check_parity(expected, actual)
+    print(f"groupby().apply (riferimento): {ref_time:8.3f}s")
+    print(f"groupby().rolling (vettoriale): {new_time:8.3f}s")
+    print(f"Speedup: {ref_time / new_time:.1f}x")
+    if mismatched:
+        print(f"[ERROR] Parita' fallita per: {', '.join(mismatched)}")
+        return 1
+    print("[OK] Parita' verificata su tutte le colonne metriche")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""Benchmark layout Parquet: file annuali monolitici vs dataset partizionato.
+
+Dai CSV in ``data/cot/csv`` genera (in una directory temporanea) CSV
+ingranditi con ``--scale`` copie di ogni mercato (codici sintetici), poi li
+converte nei due layout:
+
+- vecchio: ``legacy_futures_YYYY.parquet`` in ordine di arrivo, row group da
+  ``DEFAULT_ROW_GROUP_SIZE`` righe (``csv_to_parquet``)
+- nuovo: ``legacy_futures/year=YYYY/`` ordinato per market code e data, row
+  group da ``DATASET_ROW_GROUP_SIZE`` righe (``csv_to_dataset``)
+
+e misura con DuckDB e ``pyarrow.dataset`` lo storico di un singolo mercato e
+la lettura dell'ultima settimana. Per ogni query riporta anche quanti row
+group non possono essere scartati dalle statistiche min/max. Fallisce
+(exit 1) se i due layout restituiscono risultati diversi.
+
+Uso:
+    python benchmarks/bench_parquet_layout.py --scale 30 --repeat 5
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.append(str(REPO_ROOT))
+
+import duckdb
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from shared.config import COT_CSV_DIR
+from shared.cot_convert import DATASET_ROW_GROUP_SIZE, csv_to_dataset, csv_to_parquet, dataset_files
+from shared.cot_schema import LEGACY_SCHEMA, MARKET_CODE, REPORT_DATE
+
+CODE_COLUMN = MARKET_CODE
+DATE_COLUMN = REPORT_DATE
+MARKET = "099741"  # EURO FX
+COLUMNS = [DATE_COLUMN, CODE_COLUMN, "noncommercial_long", "noncommercial_short"]
+
+
+def scale_csv(source: Path, target: Path, scale: int) -> None:
+    """Copia ``source`` con ``scale`` repliche di ogni riga (market code sintetici)."""
+    with open(source, "r", encoding="utf-8-sig", newline="") as f_in, \
+            open(target, "w", encoding="utf-8", newline="") as f_out:
+        reader = csv.reader(f_in, delimiter="\t")
+        writer = csv.writer(f_out, delimiter="\t")
+        header = next(reader)
+        writer.writerow(header)
+        code_index = [name.strip() for name in header].index(LEGACY_SCHEMA.by_name[CODE_COLUMN].sources[0])
+        rows = list(reader)
+        for copy in range(scale):
+            for row in rows:
+                if copy:
+                    row = row.copy()
+                    row[code_index] = f"{row[code_index]}S{copy:03d}"
+                writer.writerow(row)
+
+
+def build_layouts(csv_dir: Path, workdir: Path, scale: int,
+                  row_group_size: int) -> tuple[list[Path], list[Path]]:
+    old_dir = workdir / "old"
+    new_dir = workdir / "new" / "legacy_futures"
+    old_files = []
+    for source in sorted(csv_dir.glob("cot_legacy_*.txt")):
+        year = source.stem.split("_")[-1]
+        scaled = workdir / source.name
+        scale_csv(source, scaled, scale)
+        old_path = old_dir / f"legacy_futures_{year}.parquet"
+        csv_to_parquet(scaled, old_path)
+        csv_to_dataset(scaled, new_dir, year, row_group_size=row_group_size)
+        old_files.append(old_path)
+    return old_files, dataset_files(new_dir)
+
+
+def candidate_row_groups(files: list[Path], column: str, value) -> tuple[int, int]:
+    """(row group non scartabili con min/max su ``column``, row group totali)."""
+    kept = total = 0
+    for path in files:
+        metadata = pq.ParquetFile(path).metadata
+        names = [metadata.schema.column(i).name for i in range(metadata.num_columns)]
+        index = names.index(column)
+        for rg in range(metadata.num_row_groups):
+            total += 1
+            stats = metadata.row_group(rg).column(index).statistics
+            if stats is None or not stats.has_min_max or stats.min <= value <= stats.max:
+                kept += 1
+    return kept, total
+
+
+def best_ms(fn, repeat: int) -> tuple[float, object]:
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, (time.perf_counter() - started) * 1000)
+    return best, result
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark layout Parquet vecchio vs partizionato")
+    parser.add_argument("--csv-dir", type=Path, default=COT_CSV_DIR)
+    parser.add_argument("--scale", type=int, default=30,
+                        help="Repliche di ogni mercato (30 ~ dimensione reale Legacy)")
+    parser.add_argument("--row-group-size", type=int, default=DATASET_ROW_GROUP_SIZE,
+                        help="Righe per row group nel layout nuovo")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        old_files, new_files = build_layouts(args.csv_dir, workdir, args.scale, args.row_group_size)
+        if not old_files:
+            print(f"[ERROR] Nessun CSV cot_legacy_*.txt in {args.csv_dir}")
+            return 1
+
+        con = duckdb.connect()
+        old_src = f"read_parquet('{workdir / 'old'}/*.parquet')"
+        new_src = f"read_parquet('{workdir / 'new' / 'legacy_futures'}/*/*.parquet', hive_partitioning=true)"
+        rows = con.execute(f"SELECT COUNT(*) FROM {old_src}").fetchone()[0]
+        latest = con.execute(f'SELECT MAX("{DATE_COLUMN}") FROM {new_src}').fetchone()[0]
+        select = ", ".join(f'"{c}"' for c in COLUMNS)
+        print(f"Righe: {rows:,} in {len(old_files)} anni (scale={args.scale}), ultima settimana {latest}")
+
+        market_sql = f"""SELECT {select} FROM {{src}} WHERE "{CODE_COLUMN}" = '{MARKET}'
+                         ORDER BY "{DATE_COLUMN}" """
+        latest_sql = f"""SELECT {select} FROM {{src}} WHERE "{DATE_COLUMN}" = DATE '{latest}' {{extra}}
+                         ORDER BY "{CODE_COLUMN}" """
+        market_filter = ds.field(CODE_COLUMN) == MARKET
+        latest_filter = ds.field(DATE_COLUMN) == latest
+        old_ds = ds.dataset([str(p) for p in old_files], format="parquet")
+        new_ds = ds.dataset(str(workdir / "new" / "legacy_futures"), format="parquet", partitioning="hive")
+
+        cases = [
+            ("duckdb mercato singolo",
+             lambda: con.execute(market_sql.format(src=old_src)).fetchall(),
+             lambda: con.execute(market_sql.format(src=new_src)).fetchall(),
+             (CODE_COLUMN, MARKET)),
+            ("duckdb ultima settimana",
+             lambda: con.execute(latest_sql.format(src=old_src, extra="")).fetchall(),
+             lambda: con.execute(latest_sql.format(src=new_src, extra=f"AND year = {latest.year}")).fetchall(),
+             (DATE_COLUMN, latest)),
+            ("pyarrow mercato singolo",
+             lambda: old_ds.to_table(columns=COLUMNS, filter=market_filter).sort_by(DATE_COLUMN).to_pylist(),
+             lambda: new_ds.to_table(columns=COLUMNS, filter=market_filter).sort_by(DATE_COLUMN).to_pylist(),
+             (CODE_COLUMN, MARKET)),
+            ("pyarrow ultima settimana",
+             lambda: old_ds.to_table(columns=COLUMNS, filter=latest_filter).sort_by(CODE_COLUMN).to_pylist(),
+             lambda: new_ds.to_table(
+                 columns=COLUMNS, filter=latest_filter & (ds.field("year") == latest.year)
+             ).sort_by(CODE_COLUMN).to_pylist(),
+             (DATE_COLUMN, latest)),
+        ]
+
+        print(f"{'query':26s} {'vecchio':>10s} {'nuovo':>10s} {'speedup':>8s}  row group letti (vecchio -> nuovo)")
+        mismatched = []
+        for label, run_old, run_new, (column, value) in cases:
+            old_ms, old_result = best_ms(run_old, args.repeat)
+            new_ms, new_result = best_ms(run_new, args.repeat)
+            if old_result != new_result:
+                mismatched.append(label)
+            old_kept, old_total = candidate_row_groups(old_files, column, value)
+            new_files_read = [p for p in new_files if column != DATE_COLUMN
+                              or p.parent.name == f"year={latest.year}"]
+            new_kept, _ = candidate_row_groups(new_files_read, column, value)
+            _, new_total = candidate_row_groups(new_files, column, value)
+            print(f"{label:26s} {old_ms:8.2f}ms {new_ms:8.2f}ms {old_ms / new_ms:7.1f}x  "
+                  f"{old_kept}/{old_total} -> {new_kept}/{new_total}")
+        con.close()
+
+    if mismatched:
+        print(f"[ERROR] Risultati diversi tra i layout: {', '.join(mismatched)}")
+        return 1
+    print("[OK] Risultati identici tra i layout")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
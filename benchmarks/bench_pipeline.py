@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""Benchmark end-to-end della pipeline su dati sintetici multi-decennali.
+
+Genera con ``benchmarks/synthetic.py`` i CSV Legacy di ``--years`` anni x
+``--markets`` mercati in una directory temporanea (oppure riusa
+``--fixtures-dir``) e misura ogni stadio della pipeline:
+
+- ``convert``: CSV -> dataset Parquet partizionato (``csv_to_dataset``)
+- ``normalize``: ``normalize()`` sul dataset Parquet (pool di processi,
+  un file per mercato)
+- ``sync``: full sync del dataset in un DuckDB nuovo (``sync_complete.sync``)
+- ``sync_noop``: sync incrementale senza file modificati
+- ``report``: report DELTA/BIAS come ``generate_report`` (risoluzione
+  simboli a cache vuota, query, formattazione)
+- ``query``: ``query.py`` con export Parquet di ``cot_metrics``
+
+Ogni stadio gira in un processo separato, cosi' il picco RSS e' quello del
+singolo stadio; con ``--repeat`` si tengono tempo minimo e mediano. Il
+risultato (tempo, picco RSS, righe/s per stadio, commit, parametri) viene
+scritto in JSON; ``--compare`` lo confronta con quello di un altro commit.
+
+Uso:
+    python benchmarks/bench_pipeline.py --years 1995 2024 --markets 400 --repeat 3
+    python benchmarks/bench_pipeline.py --compare benchmarks/results/pipeline_abc1234.json
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.append(str(REPO_ROOT))
+
+RESULTS_DIR = REPO_ROOT / "benchmarks" / "results"
+STAGES = ("convert", "normalize", "sync", "sync_noop", "report", "query")
+# Stadio che produce l'input di ogni stadio (dataset Parquet, database)
+REQUIRES = {"normalize": "convert", "sync": "convert", "sync_noop": "sync", "report": "sync", "query": "sync"}
+
+
+def _csv_files(workdir: Path) -> list[Path]:
+    return sorted((workdir / "csv").glob("cot_legacy_*.txt"))
+
+
+def stage_convert(workdir: Path) -> int:
+    from shared.cot_convert import csv_to_dataset
+
+    return sum(
+        csv_to_dataset(path, workdir / "legacy_futures", path.stem.split("_")[-1])
+        for path in _csv_files(workdir)
+    )
+
+
+def stage_normalize(workdir: Path) -> int:
+    import pyarrow.parquet as pq
+
+    from scripts.cot.normalize_legacy_cot import normalize
+    from shared.cot_convert import dataset_files
+
+    output = normalize(dataset_files(workdir / "legacy_futures"), workdir / "legacy_normalized")
+    return sum(pq.ParquetFile(path).metadata.num_rows for path in output.glob("market=*/*.parquet"))
+
+
+def _sync(workdir: Path, **kwargs) -> int:
+    import duckdb
+
+    from scripts.cot.sync_complete import sync
+
+    database = workdir / "cot.db"
+    if sync(database=database, dataset_dir=workdir / "legacy_futures", snapshot=False, **kwargs) != 0:
+        raise RuntimeError("sync fallito")
+    con = duckdb.connect(str(database), read_only=True)
+    try:
+        return con.execute("SELECT COUNT(*) FROM cot_disagg").fetchone()[0]
+    finally:
+        con.close()
+
+
+def stage_sync(workdir: Path) -> int:
+    (workdir / "cot.db").unlink(missing_ok=True)
+    return _sync(workdir, full=True, mode="table")
+
+
+def stage_sync_noop(workdir: Path) -> int:
+    return _sync(workdir)
+
+
+def stage_report(workdir: Path) -> int:
+    import duckdb
+
+    from scripts.cot.auto_report import build_report, fetch_report_rows, resolve_instruments
+    from shared.encoding_utils import ReportSink
+
+    cache_path = workdir / "market_resolver.json"
+    cache_path.unlink(missing_ok=True)
+    con = duckdb.connect(str(workdir / "cot.db"), read_only=True)
+    try:
+        rows = fetch_report_rows(con, codes=resolve_instruments(con, cache_path=cache_path))
+        lines, _ = build_report(rows)
+        with ReportSink(ascii_only=True, tee_file_utf8=workdir / "report.txt") as sink:
+            sink.writelines(lines)
+    finally:
+        con.close()
+    return int(rows["available"].sum())
+
+
+def stage_query(workdir: Path) -> int:
+    import pyarrow.parquet as pq
+
+    from scripts.cot import query
+
+    output = workdir / "metrics.parquet"
+    query.DB_PATH = workdir / "cot.db"
+    if query.main(["SELECT * FROM cot_metrics", "--format", "parquet", "--output", str(output)]) != 0:
+        raise RuntimeError("query fallita")
+    return pq.ParquetFile(output).metadata.num_rows
+
+
+def run_stage(stage: str, workdir: Path) -> dict:
+    """Esegue uno stadio nel processo corrente (output soppresso)."""
+    from shared.run_metrics import peak_rss_mb
+
+    runner = globals()[f"stage_{stage}"]
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        rows = runner(workdir)
+    wall = time.perf_counter() - started
+    return {"wall_s": wall, "rows": rows, "peak_rss_mb": peak_rss_mb()}
+
+
+def measure(stage: str, workdir: Path, repeat: int) -> dict:
+    """Esegue ``stage`` ``repeat`` volte, ognuna in un processo nuovo."""
+    runs = []
+    for _ in range(repeat):
+        proc = subprocess.run(
+            [sys.executable, str(Path(__file__).resolve()), "--stage", stage, "--workdir", str(workdir)],
+            capture_output=True, text=True, encoding="utf-8", errors="replace",
+        )
+        if proc.returncode != 0:
+            raise RuntimeError(f"stadio {stage} fallito:\n{proc.stdout}{proc.stderr}")
+        runs.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    walls = [run["wall_s"] for run in runs]
+    peaks = [run["peak_rss_mb"] for run in runs if run["peak_rss_mb"] is not None]
+    best = min(walls)
+    rows = runs[-1]["rows"]
+    return {
+        "wall_s_min": round(best, 4),
+        "wall_s_median": round(statistics.median(walls), 4),
+        "peak_rss_mb": round(max(peaks), 1) if peaks else None,
+        "rows": rows,
+        "rows_per_s": round(rows / best) if best > 0 else None,
+    }
+
+
+def git_commit() -> str:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_ROOT,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return f"{commit}-dirty" if dirty else commit
+
+
+def print_results(results: dict) -> None:
+    print(f"{'stadio':10s} {'min':>9s} {'mediana':>9s} {'picco RSS':>10s} {'righe':>10s} {'righe/s':>11s}")
+    for stage, stats in results["stages"].items():
+        peak = f"{stats['peak_rss_mb']:.1f}MB" if stats["peak_rss_mb"] is not None else "n/a"
+        rate = f"{stats['rows_per_s']:,}" if stats["rows_per_s"] is not None else "n/a"
+        print(f"{stage:10s} {stats['wall_s_min']:8.3f}s {stats['wall_s_median']:8.3f}s {peak:>10s} "
+              f"{stats['rows']:>10,} {rate:>11s}")
+
+
+def compare(base: dict, new: dict) -> None:
+    """Tabella di confronto tra due risultati (tempo minimo e picco RSS)."""
+    print(f"Confronto {base['commit']} -> {new['commit']}")
+    if base["params"] != new["params"]:
+        print(f"[WARN] Parametri diversi: {base['params']} vs {new['params']}")
+    print(f"{'stadio':10s} {'prima':>9s} {'dopo':>9s} {'speedup':>8s} {'RSS prima':>10s} {'RSS dopo':>10s}")
+    for stage, stats in new["stages"].items():
+        old = base["stages"].get(stage)
+        if old is None:
+            print(f"{stage:10s} {'-':>9s} {stats['wall_s_min']:8.3f}s")
+            continue
+        speedup = old["wall_s_min"] / stats["wall_s_min"] if stats["wall_s_min"] else float("inf")
+        print(f"{stage:10s} {old['wall_s_min']:8.3f}s {stats['wall_s_min']:8.3f}s {speedup:7.2f}x "
+              f"{old['peak_rss_mb'] or 0:8.1f}MB {stats['peak_rss_mb'] or 0:8.1f}MB")
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark end-to-end della pipeline COT")
+    parser.add_argument("--years", type=int, nargs=2, default=(1995, 2024), metavar=("FROM", "TO"))
+    parser.add_argument("--markets", type=int, default=400)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES),
+                        help="Stadi da misurare (nell'ordine della pipeline)")
+    parser.add_argument("--fixtures-dir", type=Path,
+                        help="CSV sintetici gia' generati da riusare (cot_legacy_YYYY.txt)")
+    parser.add_argument("--output", type=Path,
+                        help="File JSON dei risultati (default benchmarks/results/pipeline_<commit>.json)")
+    parser.add_argument("--compare", type=Path, metavar="BASE_JSON",
+                        help="Confronta i risultati con quelli di un altro commit")
+    parser.add_argument("--stage", choices=STAGES, help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.stage:
+        # Processo figlio: un solo stadio, risultato come ultima riga JSON
+        print(json.dumps(run_stage(args.stage, args.workdir)))
+        return 0
+
+    from benchmarks.synthetic import write_fixtures
+
+    # Gli stadi richiesti dagli stadi selezionati girano una volta senza misura
+    needed = set(args.stages)
+    for stage in reversed(STAGES):
+        if stage in needed and stage in REQUIRES:
+            needed.add(REQUIRES[stage])
+    commit = git_commit()
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        csv_dir = workdir / "csv"
+        if args.fixtures_dir:
+            csv_dir.symlink_to(args.fixtures_dir.resolve(), target_is_directory=True)
+        else:
+            started = time.perf_counter()
+            write_fixtures(csv_dir, range(args.years[0], args.years[1] + 1), args.markets, args.seed)
+            print(f"[OK] Dati sintetici generati in {time.perf_counter() - started:.1f}s")
+        csv_files = _csv_files(workdir)
+        if not csv_files:
+            print(f"[ERROR] Nessun CSV cot_legacy_*.txt in {csv_dir}")
+            return 1
+        csv_mb = sum(path.stat().st_size for path in csv_files) / 1e6
+        print(f"Dati: {len(csv_files)} anni, {csv_mb:.1f}MB di CSV (commit {commit})")
+
+        results = {
+            "commit": commit,
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "params": {
+                "years": list(args.years) if not args.fixtures_dir else None,
+                "markets": args.markets if not args.fixtures_dir else None,
+                "seed": args.seed if not args.fixtures_dir else None,
+                "files": len(csv_files),
+                "csv_mb": round(csv_mb, 1),
+            },
+            "repeat": args.repeat,
+            "stages": {},
+        }
+        for stage in (stage for stage in STAGES if stage in needed):
+            try:
+                if stage in args.stages:
+                    results["stages"][stage] = measure(stage, workdir, args.repeat)
+                else:
+                    measure(stage, workdir, 1)
+            except RuntimeError as e:
+                print(f"[ERROR] {e}")
+                return 1
+
+    print_results(results)
+    output = args.output or RESULTS_DIR / f"pipeline_{commit}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    print(f"[OK] Risultati salvati in {output}")
+
+    if args.compare:
+        print()
+        compare(json.loads(args.compare.read_text(encoding="utf-8")), results)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""Benchmark del tempo di avvio della CLI ``cot`` (``python -X importtime``).
+
+Per ogni sottocomando misura, in processi separati, il tempo totale di
+import (somma dei tempi ``self`` riportati da ``-X importtime``), il tempo
+di esecuzione complessivo e quali librerie pesanti (pandas, pyarrow, numpy,
+duckdb) vengono caricate. Come riferimento riporta il costo degli import
+eager che ogni script pagava prima (``import pandas, pyarrow.parquet,
+duckdb``). Fallisce (exit 1) se ``--help`` di un comando carica una
+libreria pesante.
+
+Uso:
+    python benchmarks/bench_startup.py --repeat 5
+"""
+from __future__ import annotations
+
+import argparse
+import re
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.append(str(REPO_ROOT))
+
+from scripts.cot.cli import COMMANDS
+
+HEAVY_MODULES = ("pandas", "pyarrow", "numpy", "duckdb")
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$")
+
+
+def parse_importtime(stderr: str) -> tuple[float, set[str]]:
+    """(ms totali di import, librerie pesanti caricate) dall'output di -X importtime."""
+    total_us = 0
+    heavy = set()
+    for line in stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        total_us += int(match.group(1))
+        root = match.group(4).split(".")[0].lstrip("_")
+        if root in HEAVY_MODULES:
+            heavy.add(root)
+    return total_us / 1000, heavy
+
+
+def measure(args: list[str], repeat: int) -> tuple[float, float, set[str]]:
+    """Miglior tempo di import e totale (ms) su ``repeat`` esecuzioni."""
+    best_import = best_wall = float("inf")
+    heavy: set[str] = set()
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", *args],
+            cwd=REPO_ROOT, capture_output=True, text=True, encoding="utf-8", errors="replace",
+        )
+        wall = (time.perf_counter() - started) * 1000
+        import_ms, heavy = parse_importtime(result.stderr)
+        best_import = min(best_import, import_ms)
+        best_wall = min(best_wall, wall)
+    return best_import, best_wall, heavy
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark avvio CLI cot")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    cases = [("eager (riferimento)", ["-c", "import pandas, pyarrow.parquet, duckdb"])]
+    cases += [("cot --help", ["-m", "scripts.cot", "--help"])]
+    cases += [(f"cot {name} --help", ["-m", "scripts.cot", name, "--help"]) for name in COMMANDS]
+
+    print(f"{'comando':28s} {'import':>10s} {'totale':>10s}  librerie pesanti")
+    failures = []
+    for label, command in cases:
+        import_ms, wall_ms, heavy = measure(command, args.repeat)
+        loaded = ", ".join(sorted(heavy)) or "-"
+        print(f"{label:28s} {import_ms:8.1f}ms {wall_ms:8.1f}ms  {loaded}")
+        if "--help" in command and heavy:
+            failures.append(label)
+
+    if failures:
+        print(f"[ERROR] Librerie pesanti caricate da: {', '.join(failures)}")
+        return 1
+    print("[OK] Nessun --help carica librerie pesanti")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""Benchmark dei modi di sync: tabelle DuckDB (``table``) vs viste sul Parquet (``view``).
+
+Costruisce in una directory temporanea un dataset partizionato dai CSV in
+``data/cot/csv`` (ingranditi con ``--scale`` copie di ogni mercato, vedi
+``bench_parquet_layout.py``) senza l'ultima settimana. Per ogni modo misura:
+
+- il primo sync su un database vuoto
+- il sync settimanale dopo l'arrivo dell'ultima settimana (file dell'anno
+  corrente riscritto)
+- un sync senza modifiche
+- la latenza del report (connessione read-only, risoluzione simboli, query
+  e formattazione, come ``auto_report.py``)
+- lo spazio su disco del database
+
+Fallisce (exit 1) se i due modi producono report diversi.
+
+Uso:
+    python benchmarks/bench_storage_mode.py --scale 30 --repeat 10
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.append(str(REPO_ROOT))
+
+import duckdb
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from benchmarks.bench_parquet_layout import DATE_COLUMN, scale_csv
+from scripts.cot.auto_report import build_report, fetch_report_rows, resolve_instruments
+from scripts.cot.sync_complete import MODES, sync
+from shared.config import COT_CSV_DIR
+from shared.cot_convert import csv_to_dataset, dataset_files
+
+
+def build_dataset(csv_dir: Path, workdir: Path, scale: int) -> tuple[Path, Path, Path]:
+    """Dataset senza l'ultima settimana. Ritorna (dataset, file corrente, file completo)."""
+    dataset_dir = workdir / "legacy_futures"
+    for source in sorted(csv_dir.glob("cot_legacy_*.txt")):
+        scaled = workdir / source.name
+        scale_csv(source, scaled, scale)
+        csv_to_dataset(scaled, dataset_dir, source.stem.split("_")[-1])
+        scaled.unlink()
+
+    current = dataset_files(dataset_dir)[-1]
+    complete = workdir / "complete.parquet"
+    shutil.copyfile(current, complete)
+    table = pq.read_table(complete)
+    latest = pc.max(table.column(DATE_COLUMN))
+    pq.write_table(table.filter(pc.not_equal(table.column(DATE_COLUMN), latest)), current)
+    return dataset_dir, current, complete
+
+
+def timed_sync(**kwargs) -> float:
+    """Secondi di un sync in-process (output soppresso)."""
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        code = sync(snapshot=False, **kwargs)
+    if code != 0:
+        raise RuntimeError(f"sync fallito: {kwargs}")
+    return time.perf_counter() - started
+
+
+def report_once(database: Path, cache_path: Path) -> list[str]:
+    con = duckdb.connect(str(database), read_only=True)
+    try:
+        codes = resolve_instruments(con, cache_path=cache_path)
+        lines, _ = build_report(fetch_report_rows(con, codes=codes))
+        return lines
+    finally:
+        con.close()
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark sync/report: modo table vs view")
+    parser.add_argument("--csv-dir", type=Path, default=COT_CSV_DIR)
+    parser.add_argument("--scale", type=int, default=30,
+                        help="Repliche di ogni mercato (30 ~ dimensione reale Legacy)")
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        dataset_dir, current, complete = build_dataset(args.csv_dir, workdir, args.scale)
+        truncated = workdir / "truncated.parquet"
+        shutil.copyfile(current, truncated)
+        dataset_mb = sum(p.stat().st_size for p in dataset_files(dataset_dir)) / 1e6
+        print(f"Dataset: {len(dataset_files(dataset_dir))} anni, {dataset_mb:.1f}MB (scale={args.scale})")
+
+        results = {}
+        reports = {}
+        for mode in MODES:
+            database = workdir / f"{mode}.db"
+            shutil.copyfile(truncated, current)
+            first = timed_sync(database=database, mode=mode, dataset_dir=dataset_dir)
+            # Nuova settimana: il file dell'anno corrente viene sostituito
+            shutil.copyfile(complete, current.with_name(current.name + ".tmp"))
+            os.replace(current.with_name(current.name + ".tmp"), current)
+            weekly = timed_sync(database=database, dataset_dir=dataset_dir)
+            unchanged = timed_sync(database=database, dataset_dir=dataset_dir)
+
+            cache_path = workdir / f"resolver_{mode}.json"
+            latencies = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                reports[mode] = report_once(database, cache_path)
+                latencies.append((time.perf_counter() - started) * 1000)
+            results[mode] = (first, weekly, unchanged, min(latencies),
+                             sorted(latencies)[len(latencies) // 2], database.stat().st_size / 1e6)
+
+        print(f"{'modo':6s} {'1o sync':>9s} {'settimana':>10s} {'invariato':>10s} "
+              f"{'report min':>11s} {'report p50':>11s} {'db':>8s}")
+        for mode, (first, weekly, unchanged, best, median, size_mb) in results.items():
+            print(f"{mode:6s} {first:8.2f}s {weekly:9.2f}s {unchanged:9.2f}s "
+                  f"{best:9.1f}ms {median:9.1f}ms {size_mb:6.1f}MB")
+
+    if reports["table"] != reports["view"]:
+        print("[ERROR] Report diversi tra i modi table e view")
+        return 1
+    print("[OK] Report identici nei due modi")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""Generatore di CSV Legacy sintetici per i benchmark della pipeline.
+
+Scrive ``cot_legacy_YYYY.txt`` separati da tab con le intestazioni CFTC
+reali (prima sorgente di ogni colonna di ``LEGACY_SCHEMA``), un report per
+martedi' e per mercato. I mercati sono gli strumenti del report
+(``auto_report.INSTRUMENTS``, con nomi che le regole del catalogo
+risolvono) piu' mercati sintetici fino a ``--markets``. Le posizioni sono
+random walk per mercato che proseguono da un anno all'altro, quindi le
+variazioni settimanali (``Change in ...``) sono coerenti con le posizioni e
+le metriche a 52/156 settimane hanno valori realistici. Stesso seed, stessi
+file.
+
+Uso:
+    python benchmarks/synthetic.py --output-dir /tmp/cot_csv --years 1995 2024 --markets 400
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+from pathlib import Path
+from typing import Iterator
+
+import numpy as np
+import pandas as pd
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.append(str(REPO_ROOT))
+
+from shared.cot_schema import LEGACY_SCHEMA
+
+# Strumenti del report con i nomi usati dalla CFTC
+REPORT_MARKETS = (
+    ("AUSTRALIAN DOLLAR - CHICAGO MERCANTILE EXCHANGE", "232741"),
+    ("BRITISH POUND - CHICAGO MERCANTILE EXCHANGE", "096742"),
+    ("CANADIAN DOLLAR - CHICAGO MERCANTILE EXCHANGE", "090741"),
+    ("EURO FX - CHICAGO MERCANTILE EXCHANGE", "099741"),
+    ("JAPANESE YEN - CHICAGO MERCANTILE EXCHANGE", "097741"),
+    ("SWISS FRANC - CHICAGO MERCANTILE EXCHANGE", "092741"),
+    ("NZ DOLLAR - CHICAGO MERCANTILE EXCHANGE", "112741"),
+    ("RUSSELL E-MINI - CHICAGO MERCANTILE EXCHANGE", "239742"),
+    ("S&P 500 Consolidated - CHICAGO MERCANTILE EXCHANGE", "13874+"),
+    ("E-MINI S&P 500 - CHICAGO MERCANTILE EXCHANGE", "13874A"),
+    ("NASDAQ-100 Consolidated - CHICAGO MERCANTILE EXCHANGE", "20974+"),
+    ("VIX FUTURES - CBOE FUTURES EXCHANGE", "1170E1"),
+    ("GOLD - COMMODITY EXCHANGE INC.", "088691"),
+    ("SILVER - COMMODITY EXCHANGE INC.", "084691"),
+)
+
+# Posizioni con random walk (le altre colonne intere sono rumore)
+WALK_COLUMNS = (
+    "noncommercial_long",
+    "noncommercial_short",
+    "noncommercial_spreading",
+    "commercial_long",
+    "commercial_short",
+    "nonreportable_long",
+    "nonreportable_short",
+)
+
+DEFAULT_MARKETS = 400
+DEFAULT_SEED = 42
+
+
+def market_list(markets: int = DEFAULT_MARKETS) -> list[tuple[str, str]]:
+    """Strumenti del report piu' mercati sintetici, ``markets`` in totale."""
+    synthetic = [
+        (f"SYNTHETIC MARKET {i:04d} - TEST EXCHANGE", f"{900000 + i:06d}")
+        for i in range(max(0, markets - len(REPORT_MARKETS)))
+    ]
+    return list(REPORT_MARKETS[:markets]) + synthetic
+
+
+def iter_years(years: range, markets: int = DEFAULT_MARKETS,
+               seed: int = DEFAULT_SEED) -> Iterator[tuple[int, pd.DataFrame]]:
+    """Un DataFrame per anno con le intestazioni CFTC, righe per (settimana, mercato)."""
+    rng = np.random.default_rng(seed)
+    names, codes = (np.array(values) for values in zip(*market_list(markets)))
+    n = len(codes)
+    state = {col: rng.integers(5_000, 200_000, n).astype(np.int64) for col in WALK_COLUMNS}
+
+    for year in years:
+        weeks = pd.date_range(f"{year}-01-01", f"{year}-12-31", freq="W-TUE")
+        shape = (len(weeks), n)
+        values = {}
+        changes = {}
+        for col in WALK_COLUMNS:
+            steps = rng.normal(0, 2_500, shape).round().astype(np.int64)
+            walk = np.maximum(state[col] + steps.cumsum(axis=0), 0)
+            previous = np.vstack([state[col], walk[:-1]])
+            values[col] = walk.ravel()
+            changes[col] = (walk - previous).ravel()
+            state[col] = walk[-1]
+
+        rows = len(weeks) * n
+        dates = np.repeat(weeks, n)
+        values["total_reportable_long"] = values["noncommercial_long"] + values["commercial_long"]
+        values["total_reportable_short"] = values["noncommercial_short"] + values["commercial_short"]
+        values["open_interest"] = (
+            values["total_reportable_long"] + values["noncommercial_spreading"]
+            + values["nonreportable_long"]
+        )
+        for col in ("total_reportable_long", "total_reportable_short", "open_interest"):
+            changes[col] = np.zeros(rows, dtype=np.int64)
+
+        frame = {}
+        for column in LEGACY_SCHEMA.columns:
+            header = column.sources[0]
+            name = column.name
+            if name == "market_and_exchange":
+                frame[header] = np.tile(names, len(weeks))
+            elif name == "report_date":
+                frame[header] = dates.strftime("%Y-%m-%d")
+            elif name == "report_date_yymmdd":
+                frame[header] = dates.strftime("%y%m%d")
+            elif name in ("contract_market_code", "contract_market_code_quotes"):
+                frame[header] = np.tile(codes, len(weeks))
+            elif name in ("commodity_code", "commodity_code_quotes"):
+                frame[header] = np.tile([code[:3] for code in codes], len(weeks))
+            elif name in values:
+                frame[header] = values[name]
+            elif name.endswith("_change") and name[:-len("_change")] in changes:
+                frame[header] = changes[name[:-len("_change")]]
+            elif column.dtype == "int32":
+                frame[header] = rng.integers(0, 50_000, rows)
+            elif column.dtype == "float32":
+                frame[header] = rng.uniform(0, 100, rows).round(1)
+            elif name == "contract_units":
+                frame[header] = "(CONTRACTS OF 1)"
+            else:
+                frame[header] = "X"
+        yield year, pd.DataFrame(frame)
+
+
+def write_fixtures(output_dir: Path, years: range, markets: int = DEFAULT_MARKETS,
+                   seed: int = DEFAULT_SEED) -> list[Path]:
+    """Scrive ``cot_legacy_YYYY.txt`` in ``output_dir``; ritorna i file scritti."""
+    output_dir.mkdir(parents=True, exist_ok=True)
+    written = []
+    for year, frame in iter_years(years, markets, seed):
+        path = output_dir / f"cot_legacy_{year}.txt"
+        frame.to_csv(path, sep="\t", index=False)
+        written.append(path)
+    return written
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Genera CSV COT Legacy sintetici")
+    parser.add_argument("--output-dir", type=Path, required=True)
+    parser.add_argument("--years", type=int, nargs=2, default=(1995, 2024), metavar=("FROM", "TO"))
+    parser.add_argument("--markets", type=int, default=DEFAULT_MARKETS)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    args = parser.parse_args(argv)
+
+    years = range(args.years[0], args.years[1] + 1)
+    written = write_fixtures(args.output_dir, years, args.markets, args.seed)
+    size_mb = sum(path.stat().st_size for path in written) / 1e6
+    print(f"[OK] {len(written)} file in {args.output_dir} ({size_mb:.1f}MB, {args.markets} mercati)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
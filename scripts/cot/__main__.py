@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+"""``python -m scripts.cot <comando>``: vedi ``scripts/cot/cli.py``."""
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.append(str(REPO_ROOT))
+
+from scripts.cot.cli import main
+
+sys.exit(main())
@@ -1,10 +1,14 @@
-"""Auto-converter CSV→Parquet con check esistenza.
+"""Auto-converter CSV→Parquet con check sul manifest.
 
 Logica:
-- Legge tutti i CSV in csv/
-- Per ogni CSV, check se corrispondente Parquet esiste
-- Se NO → converti e salva in parquet/
+- Legge i CSV della famiglia in csv/ (cot_{famiglia}_YYYY.txt)
+- Per ogni CSV, check nel manifest se il Parquet esiste ed è aggiornato
+- Se NO (mancante o generato da un CSV diverso) → converti e salva nel dataset
+  partizionato della famiglia (es. parquet/legacy_futures/year=YYYY/, ordinato
+  per market code e data) con il suo schema canonico
 - Se SÌ → skip (idempotent)
+- Un CSV che non si converte viene segnalato e saltato; il manifest viene
+  salvato dopo ogni file convertito, cosi' un errore non fa rifare gli altri
 """
 
 # -*- coding: utf-8 -*-
@@ -24,68 +28,88 @@ if __package__ is None or __package__ == "":
 from shared.encoding_fix import setup_utf8_encoding
 setup_utf8_encoding()
 
-from shared.config import COT_CSV_DIR, COT_PARQUET_DIR, ensure_directories
+from shared.config import ensure_directories
+from shared.cot_convert import (
+    DATASET_ROW_GROUP_SIZE,
+    DEFAULT_BLOCK_SIZE,
+    csv_to_dataset,
+    partition_path,
+)
+from shared.cot_families import FAMILY_CHOICES, LEGACY, ReportFamily, resolve_families
+from shared.cot_manifest import load_manifest, needs_conversion, record_parquet, save_manifest
 from shared.encoding_utils import format_number_ascii
-import pandas as pd
+from shared import run_metrics
 
 LOGGER = logging.getLogger("cot.converter")
 
 
-def csv_to_parquet(csv_path: Path, parquet_path: Path) -> Path:
-    """Converti CSV a Parquet ottimizzando tipi e colonne."""
-    df = pd.read_csv(csv_path, sep="\t")
-    
-    # Ottimizza date parsing
-    date_cols = [c for c in df.columns if 'Date' in c and 'YYYY-MM-DD' in c]
-    for col in date_cols:
-        df[col] = pd.to_datetime(df[col], format="%Y-%m-%d", errors="coerce")
-    
-    # Rimuovi colonne duplicate e spazi
-    df.columns = df.columns.str.strip()
-    df = df.loc[:, ~df.columns.duplicated()]
-    
-    parquet_path.parent.mkdir(parents=True, exist_ok=True)
-    df.to_parquet(parquet_path, index=False)
-    
-    LOGGER.info(f"Converted {csv_path.name} to {parquet_path.name} ({format_number_ascii(len(df))} rows)")
+def csv_to_parquet(csv_path: Path, year: str, *, family: ReportFamily = LEGACY,
+                   block_size: int = DEFAULT_BLOCK_SIZE,
+                   row_group_size: int = DATASET_ROW_GROUP_SIZE) -> Path:
+    """Converti CSV nella partizione dell'anno con schema dichiarato (vedi shared.cot_convert)."""
+    rows = csv_to_dataset(
+        csv_path, family.dataset_dir, year, block_size=block_size, row_group_size=row_group_size,
+        schema=family.schema,
+    )
+    parquet_path = partition_path(family.dataset_dir, year)
+    LOGGER.info(f"Converted {csv_path.name} to {parquet_path.parent.name}/{parquet_path.name} "
+                f"({format_number_ascii(rows)} rows)")
     return parquet_path
 
 
-def convert_all_csvs(force: bool = False) -> list[Path]:
-    """Converte tutti i CSV in Parquet se non esistono già."""
+def convert_all_csvs(force: bool = False, families: list[ReportFamily] | None = None,
+                     **options) -> list[Path]:
+    """Converte i CSV il cui Parquet manca o è obsoleto secondo il manifest."""
     ensure_directories()
     
-    csv_files = sorted(COT_CSV_DIR.glob("cot_*.txt"))
+    manifest = load_manifest()
     converted = []
     
-    for csv_file in csv_files:
-        # Naming: cot_legacy_2023.txt → legacy_futures_2023.parquet
-        year = csv_file.stem.split("_")[-1]
-        parquet_name = f"legacy_futures_{year}.parquet"
-        parquet_path = COT_PARQUET_DIR / parquet_name
-        
-        if parquet_path.exists() and not force:
-            LOGGER.debug(f"Skipping {csv_file.name} (Parquet exists)")
-            continue
-        
-        converted.append(csv_to_parquet(csv_file, parquet_path))
+    for family in families or [LEGACY]:
+        for csv_file in family.csv_files():
+            # Naming: cot_legacy_2023.txt → year=2023/legacy_futures_2023.parquet
+            year = csv_file.stem.split("_")[-1]
+            parquet_path = partition_path(family.dataset_dir, year)
+
+            if not force and not needs_conversion(manifest, csv_file, parquet_path):
+                LOGGER.debug(f"Skipping {csv_file.name} (Parquet up to date)")
+                continue
+
+            try:
+                converted.append(csv_to_parquet(csv_file, year, family=family, **options))
+            except Exception as e:
+                print(f"[ERROR] Conversione {csv_file.name} fallita: {e}")
+                run_metrics.event("convert_failed", "error", family=family.name, file=csv_file.name,
+                                  error=f"{type(e).__name__}: {e}")
+                continue
+            record_parquet(manifest, parquet_path, csv_file)
+            save_manifest(manifest)
     
     return converted
 
 
-def main():
+def main(argv: list[str] | None = None) -> int:
     parser = argparse.ArgumentParser(description="Auto-convert CSV to Parquet")
-    parser.add_argument("--force", action="store_true", help="Re-convert even if Parquet exists")
+    parser.add_argument("--force", action="store_true", help="Re-convert even if Parquet is up to date")
+    parser.add_argument("--row-group-size", type=int, default=DATASET_ROW_GROUP_SIZE,
+                        help="Righe per row group Parquet (piu' piccoli = pruning piu' fine)")
+    parser.add_argument("--block-size", type=int, default=DEFAULT_BLOCK_SIZE,
+                        help="Byte di CSV letti per blocco (l'anno resta in memoria per l'ordinamento)")
+    parser.add_argument("--family", action="append", choices=FAMILY_CHOICES,
+                        help="Famiglia di report (ripetibile; 'all' = tutte). Default: legacy")
     parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"])
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     
     logging.basicConfig(level=getattr(logging, args.log_level), format='%(message)s')
     
-    converted = convert_all_csvs(force=args.force)
+    converted = convert_all_csvs(
+        force=args.force, families=resolve_families(args.family),
+        block_size=args.block_size, row_group_size=args.row_group_size,
+    )
     if converted:
         print(f"[OK] Converted {len(converted)} files to Parquet")
     else:
-        print("[OK] All Parquet files already exist")
+        print("[OK] All Parquet files already up to date")
     
     return 0
 
@@ -1,18 +1,34 @@
 # -*- coding: utf-8 -*-
 """Report automatico COT per Team Command Cursor."""
+from __future__ import annotations
+
+import argparse
+import os
 import sys
+import time
 from pathlib import Path
+from typing import Iterator
 
 REPO_ROOT = Path(__file__).resolve().parents[2]
 if str(REPO_ROOT) not in sys.path:
     sys.path.append(str(REPO_ROOT))
 
 # Fix encoding UTF-8 per Windows e importa utility avanzate
-from shared.encoding_utils import force_utf8_stdout, safe_print, sanitize_ascii, format_number_ascii
+from shared.encoding_utils import ReportSink, force_utf8_stdout, safe_print
 force_utf8_stdout()
 
-import duckdb
-from shared.config import COT_DUCKDB_PATH
+from shared.config import COT_DUCKDB_PATH, COT_MARKET_RESOLVER_PATH
+from shared.market_catalog import CATALOG_TABLE, resolve_symbols
+from shared.lazy_import import lazy_import
+
+duckdb = lazy_import("duckdb")
+pd = lazy_import("pandas")
+pa = lazy_import("pyarrow")
+pq = lazy_import("pyarrow.parquet")
+
+# Tabelle (o viste, con sync --mode view) create da sync_complete.py
+TABLE_NAME = "cot_disagg"
+METRICS_TABLE = "cot_metrics"
 
 # Path per salvare report in file UTF-8 (per copia/incolla affidabile)
 REPORTS_DIR = REPO_ROOT / "data" / "reports"
@@ -37,184 +53,351 @@ INSTRUMENTS = {
 }
 
 
-def find_market_codes(con: duckdb.DuckDBPyConnection):
-    """Trova market codes mancanti cercando nel database."""
-    # Query per trovare strumenti simili
-    # IMPORTANTE: ordine conta - pattern più specifici PRIMA
-    queries = [
-        ("E-MINI S&P 500", "%E-MINI S&P 500%", None),
-        ("S&P 500", "%S&P 500%", "%E-MINI%"),  # Esclude E-MINI
-        ("NASDAQ", "%NASDAQ-100%", None),
-        ("VIX", "%VIX FUTURES%", None),
-        ("GOLD", "%GOLD%", None),
-        ("SILVER", "%SILVER%", None),
-    ]
-    
-    found = {}
-    for query_item in queries:
-        name, pattern, exclude_pattern = query_item
-        
-        if exclude_pattern:
-            sql = """
-                SELECT DISTINCT contract_market_code, market_and_exchange 
-                FROM cot_disagg 
-                WHERE market_and_exchange LIKE ? 
-                  AND market_and_exchange NOT LIKE ?
-                ORDER BY market_and_exchange
-                LIMIT 1
-            """
-            result = con.execute(sql, [pattern, exclude_pattern]).fetchone()
-        else:
-            sql = """
-                SELECT DISTINCT contract_market_code, market_and_exchange 
-                FROM cot_disagg 
-                WHERE market_and_exchange LIKE ?
-                ORDER BY market_and_exchange
-                LIMIT 1
-            """
-            result = con.execute(sql, [pattern]).fetchone()
-        
-        if result:
-            found[name] = result[0]
-    
-    return found
+# Strumenti senza codice fisso: risolti sul catalogo mercati
+# (frase da cercare nel nome mercato, frase da escludere)
+MARKET_RULES = {
+    "E-MINI S&P 500": ("E-MINI S&P 500", None),
+    "S&P 500": ("S&P 500", "E-MINI"),  # Esclude E-MINI
+    "NASDAQ": ("NASDAQ-100", None),
+    "VIX": ("VIX FUTURES", None),
+    "GOLD": ("GOLD", None),
+    "SILVER": ("SILVER", None),
+}
 
+# Colonne del report (interi gia' pronti per la formattazione)
+REPORT_COLUMNS = """
+        CAST(COALESCE(m.noncommercial_long, 0) AS BIGINT) AS long_total,
+        CAST(COALESCE(m.noncommercial_short, 0) AS BIGINT) AS short_total,
+        CAST(COALESCE(m.noncommercial_long_change, 0) AS BIGINT) AS delta_long,
+        CAST(COALESCE(m.noncommercial_short_change, 0) AS BIGINT) AS delta_short,
+        CAST(COALESCE(m.noncommercial_net_change,
+                      COALESCE(m.noncommercial_long_change, 0)
+                      - COALESCE(m.noncommercial_short_change, 0)) AS BIGINT) AS delta_week,
+        CAST(COALESCE(m.noncommercial_net,
+                      COALESCE(m.noncommercial_long, 0)
+                      - COALESCE(m.noncommercial_short, 0)) AS BIGINT) AS bias_open
+"""
 
-def get_latest_date(con: duckdb.DuckDBPyConnection) -> str:
-    """Trova ultima data disponibile."""
-    result = con.execute("SELECT MAX(report_date) FROM cot_disagg").fetchone()[0]
-    return result.strftime("%Y-%m-%d") if result else None
+# Una sola query per tutto il report: trova l'ultima data e legge le righe
+# di tutti gli strumenti in un unico passaggio. Il filtro list_contains sui
+# codici ($codes) arriva fino alla scansione anche quando cot_metrics e' una
+# vista (sync --mode view): le window function girano solo sugli strumenti
+# del report.
+REPORT_QUERY = f"""
+    WITH target AS (
+        SELECT COALESCE(CAST($report_date AS DATE), MAX(report_date)) AS report_date
+        FROM {TABLE_NAME}
+    ),
+    scoped AS (
+        SELECT * FROM {METRICS_TABLE} WHERE list_contains($codes, contract_market_code)
+    )
+    SELECT
+        r.name,
+        r.code,
+        t.report_date,
+        m.contract_market_code IS NOT NULL AS available,
+        {REPORT_COLUMNS}
+    FROM report_instruments r
+    CROSS JOIN target t
+    LEFT JOIN scoped m
+      ON m.contract_market_code = r.code AND m.report_date = t.report_date
+    ORDER BY r.position
+"""
 
+# Backtest: tutte le settimane dell'intervallo per tutti gli strumenti,
+# ordinate per settimana e poi nell'ordine del report.
+BACKTEST_QUERY = f"""
+    SELECT
+        m.report_date,
+        r.name,
+        r.code,
+        {REPORT_COLUMNS}
+    FROM report_instruments r
+    JOIN {METRICS_TABLE} m
+      ON m.contract_market_code = r.code
+    WHERE list_contains($codes, m.contract_market_code)
+      AND m.report_date BETWEEN CAST($date_from AS DATE) AND CAST($date_to AS DATE)
+    ORDER BY m.report_date, r.position
+"""
 
-def get_instrument_data(con: duckdb.DuckDBPyConnection, code: str, date: str):
-    """Estrae dati COT per uno strumento."""
-    result = con.execute("""
-        SELECT noncommercial_long, noncommercial_short, 
-               noncommercial_long_change, noncommercial_short_change
-        FROM cot_disagg 
-        WHERE contract_market_code = ? AND report_date = ?
-    """, [code, date]).fetchone()
-    
-    if result:
-        long_pos, short_pos, delta_long, delta_short = result
-        
-        # Gestione valori None/NaN esplicita
-        import math
-        def is_nan_or_none(val):
-            return val is None or (isinstance(val, float) and math.isnan(val))
-        
-        if is_nan_or_none(long_pos):
-            long_pos = 0.0
-        if is_nan_or_none(short_pos):
-            short_pos = 0.0
-        if is_nan_or_none(delta_long):
-            delta_long = 0.0
-        if is_nan_or_none(delta_short):
-            delta_short = 0.0
-        
-        bias_total = float(long_pos) - float(short_pos)
-        bias_delta = float(delta_long) - float(delta_short)
-        
-        return {
-            "long_total": int(long_pos),
-            "short_total": int(short_pos),
-            "delta_long": int(delta_long),
-            "delta_short": int(delta_short),
-            "delta_week": int(bias_delta),
-            "bias_open": int(bias_total),
-            "available": True
+BACKTEST_DIR = REPORTS_DIR / "backtest"
+BACKTEST_BATCH_ROWS = 65_536
+
+
+def resolve_instruments(con: duckdb.DuckDBPyConnection, instruments: dict = INSTRUMENTS,
+                        cache_path: Path = COT_MARKET_RESOLVER_PATH) -> dict[str, str | None]:
+    """Market code per strumento: codice fisso o risolto dal catalogo (cache)."""
+    rules = {name: MARKET_RULES[name] for name, code_info in instruments.items()
+             if code_info is None and name in MARKET_RULES}
+    found = resolve_symbols(con, rules, cache_path) if rules else {}
+    return {
+        name: code_info[0] if code_info else found.get(name)
+        for name, code_info in instruments.items()
+    }
+
+
+def _code_list(codes: dict[str, str | None]) -> list[str]:
+    """Valore di ``$codes``: i market code risolti, senza duplicati."""
+    return sorted({code for code in codes.values() if code})
+
+
+def instruments_frame(codes: dict[str, str | None]) -> pd.DataFrame:
+    """Tabella in memoria degli strumenti (ordine di report e codice)."""
+    return pd.DataFrame(
+        [{"position": i, "name": name, "code": code} for i, (name, code) in enumerate(codes.items())],
+        columns=["position", "name", "code"],
+    )
+
+
+def fetch_report_rows(con: duckdb.DuckDBPyConnection, instruments: dict = INSTRUMENTS,
+                      report_date: str | None = None,
+                      codes: dict[str, str | None] | None = None) -> pd.DataFrame:
+    """Righe del report per tutti gli strumenti con una sola query.
+
+    Senza ``report_date`` usa l'ultima settimana disponibile. Gli strumenti
+    senza codice (non risolti) o senza dati in quella data hanno
+    ``available`` False. ``codes`` evita di risolvere di nuovo i simboli
+    (vedi ``resolve_instruments``).
+    """
+    if codes is None:
+        codes = resolve_instruments(con, instruments)
+    con.register("report_instruments", instruments_frame(codes))
+    try:
+        return con.execute(
+            REPORT_QUERY, {"report_date": report_date, "codes": _code_list(codes)}
+        ).df()
+    finally:
+        con.unregister("report_instruments")
+
+
+def format_report_line(row) -> str:
+    """Riga DELTA/BIAS di uno strumento (numeri senza separatori delle migliaia)."""
+    if abs(row.bias_open) > 50000:
+        bias_desc = f"(forte {'long' if row.bias_open > 0 else 'short'})"
+    elif abs(row.bias_open) > 10000:
+        bias_desc = f"(strong {'long' if row.bias_open > 0 else 'short'})"
+    else:
+        bias_desc = "(allineato)"
+
+    delta_sign = "+" if row.delta_week >= 0 else ""
+    bias_sign = "+" if row.bias_open >= 0 else ""
+    delta_long_str = f"+{row.delta_long}" if row.delta_long >= 0 else str(row.delta_long)
+    delta_short_str = f"+{row.delta_short}" if row.delta_short >= 0 else str(row.delta_short)
+
+    return (
+        f"{row.name}: DELTA settimana {delta_sign}{row.delta_week} "
+        f"(Long: {delta_long_str}, Short: {delta_short_str}); "
+        f"BIAS aperto {bias_sign}{row.bias_open} "
+        f"(Long: {row.long_total}, Short: {row.short_total}) {bias_desc}"
+    )
+
+
+def build_report(rows: pd.DataFrame, header: str = "ultimo report disponibile") -> tuple[list[str], dict]:
+    """Righe di testo del report (intestazione inclusa) e dati per strumento."""
+    report_date = rows["report_date"].iloc[0].strftime("%Y-%m-%d")
+    lines = [f"{report_date} ({header})\n"]
+    results = {}
+    for row in rows.itertuples(index=False):
+        if row.code is None or pd.isna(row.code):
+            continue
+        if not row.available:
+            results[row.name] = None
+            continue
+        lines.append(format_report_line(row))
+        results[row.name] = {
+            "long_total": int(row.long_total),
+            "short_total": int(row.short_total),
+            "delta_long": int(row.delta_long),
+            "delta_short": int(row.delta_short),
+            "delta_week": int(row.delta_week),
+            "bias_open": int(row.bias_open),
+            "available": True,
         }
-    return {"available": False}
+    return lines, results
 
 
 def generate_report():
     """Genera report completo."""
-    # Pulisci file report precedente (overwrite mode)
-    if REPORT_UTF8_FILE.exists():
-        REPORT_UTF8_FILE.unlink()
-    
-    con = duckdb.connect(str(COT_DUCKDB_PATH))
+    if not COT_DUCKDB_PATH.exists():
+        safe_print("[ERROR] Database non trovato: esegui python scripts/cot/sync_complete.py",
+                   ascii_only=True)
+        return
+    # Sola lettura: non blocca (e non e' bloccato da) altri lettori
+    con = duckdb.connect(str(COT_DUCKDB_PATH), read_only=True)
     
     try:
-        # Trova ultima data
-        latest_date = get_latest_date(con)
-        if not latest_date:
-            safe_print("No data available", ascii_only=True)
+        tables = {row[0] for row in con.execute("SHOW TABLES").fetchall()}
+        missing = [t for t in (METRICS_TABLE, CATALOG_TABLE) if t not in tables]
+        if missing:
+            safe_print(
+                f"[ERROR] Tabella {', '.join(missing)} non trovata: esegui "
+                "python scripts/cot/sync_complete.py",
+                ascii_only=True,
+            )
             return
         
-        # Trova market codes manc.canti
-        found_codes = find_market_codes(con)
-        
-        # Completa mapping
-        instruments_map = {}
-        for name, code_info in INSTRUMENTS.items():
-            if code_info is None:
-                if name in found_codes:
-                    instruments_map[name] = found_codes[name]
-                else:
-                    instruments_map[name] = None
-            else:
-                instruments_map[name] = code_info[0]
+        rows = fetch_report_rows(con)
+        if rows.empty or pd.isna(rows["report_date"].iloc[0]):
+            safe_print("No data available", ascii_only=True)
+            return
+        lines, results = build_report(rows)
+        # Console ASCII pulita, file UTF-8 originale (sovrascritto a fine report)
+        with ReportSink(ascii_only=True, tee_file_utf8=REPORT_UTF8_FILE) as sink:
+            sink.writelines(lines)
         
-        # Header report
-        header_line = f"{latest_date} (ultimo report disponibile)\n"
-        safe_print(
-            header_line,
-            ascii_only=True,
-            tee_file_utf8=str(REPORT_UTF8_FILE)
+        return results
+    finally:
+        con.close()
+
+
+def iter_backtest_batches(con: duckdb.DuckDBPyConnection, date_from: str, date_to: str | None = None,
+                          instruments: dict = INSTRUMENTS,
+                          batch_rows: int = BACKTEST_BATCH_ROWS) -> Iterator[pd.DataFrame]:
+    """Righe del backtest a blocchi, gia' formattate nella colonna ``line``.
+
+    Una sola query per tutto l'intervallo; i risultati arrivano come record
+    batch Arrow e vengono formattati blocco per blocco.
+    """
+    codes = resolve_instruments(con, instruments)
+    con.register("report_instruments", instruments_frame(codes))
+    try:
+        result = con.execute(
+            BACKTEST_QUERY,
+            {"date_from": date_from, "date_to": date_to or "9999-12-31", "codes": _code_list(codes)},
         )
-        
-        # Query per ogni strumento
-        results = {}
-        for name, code in instruments_map.items():
-            if code:
-                data = get_instrument_data(con, code, latest_date)
-                if data["available"]:
-                    # Format bias description
-                    if abs(data["bias_open"]) > 50000:
-                        bias_desc = f"(forte {'long' if data['bias_open'] > 0 else 'short'})"
-                    elif abs(data["bias_open"]) > 10000:
-                        bias_desc = f"(strong {'long' if data['bias_open'] > 0 else 'short'})"
-                    else:
-                        bias_desc = "(allineato)"
-                    
-                    # Format output senza separatori delle migliaia (tutti attaccati)
-                    delta_sign = "+" if data["delta_week"] >= 0 else ""
-                    bias_sign = "+" if data["bias_open"] >= 0 else ""
-                    
-                    delta_long_str = f"+{data['delta_long']}" if data['delta_long'] >= 0 else str(data['delta_long'])
-                    delta_short_str = f"+{data['delta_short']}" if data['delta_short'] >= 0 else str(data['delta_short'])
-                    
-                    # Formatta numeri senza virgole (tutti attaccati)
-                    delta_week_fmt = str(data['delta_week'])
-                    bias_open_fmt = str(data['bias_open'])
-                    long_total_fmt = str(data['long_total'])
-                    short_total_fmt = str(data['short_total'])
-                    
-                    # Usa il nome originale (non sanitizzato) per il file UTF-8
-                    # La sanitizzazione avviene solo per la console
-                    line = (
-                        f"{name}: DELTA settimana {delta_sign}{delta_week_fmt} "
-                        f"(Long: {delta_long_str}, Short: {delta_short_str}); "
-                        f"BIAS aperto {bias_sign}{bias_open_fmt} "
-                        f"(Long: {long_total_fmt}, Short: {short_total_fmt}) {bias_desc}"
-                    )
-                    
-                    # Stampa in console (ASCII) e scrivi in file (UTF-8 originale)
-                    safe_print(
-                        line,
-                        ascii_only=True,  # Console ASCII pulita
-                        tee_file_utf8=str(REPORT_UTF8_FILE)  # File UTF-8 per copia/incolla
-                    )
-                    
-                    results[name] = data
+        # to_arrow_reader() sostituisce fetch_record_batch() da DuckDB 1.4
+        if hasattr(result, "to_arrow_reader"):
+            reader = result.to_arrow_reader(batch_rows)
+        else:
+            reader = result.fetch_record_batch(batch_rows)
+        for batch in reader:
+            frame = batch.to_pandas()
+            frame["line"] = [format_report_line(row) for row in frame.itertuples(index=False)]
+            yield frame
+    finally:
+        con.unregister("report_instruments")
+
+
+def write_week_files(batches: Iterator[pd.DataFrame], output_dir: Path) -> tuple[int, int]:
+    """Un file UTF-8 per settimana (stesso formato del report). Ritorna (settimane, righe)."""
+    weeks = rows = 0
+    current_date = None
+    sink = None
+    for frame in batches:
+        for report_date, line in zip(frame["report_date"], frame["line"]):
+            if report_date != current_date:
+                if sink:
+                    sink.flush()
+                current_date = report_date
+                day = report_date.strftime("%Y-%m-%d")
+                sink = ReportSink(console=False, tee_file_utf8=output_dir / f"cot_report_{day}.txt")
+                sink.write(f"{day}\n")
+                weeks += 1
+            sink.write(line)
+            rows += 1
+    if sink:
+        sink.flush()
+    return weeks, rows
+
+
+def write_consolidated(batches: Iterator[pd.DataFrame], output: Path) -> tuple[int, int]:
+    """Tutte le settimane in un unico file ``.parquet`` o ``.csv``. Ritorna (settimane, righe).
+
+    Il file viene scritto su un ``.tmp`` e rinominato solo a scrittura
+    completata e con almeno una riga: un intervallo vuoto non crea
+    ``output`` (niente CSV vuoto o Parquet senza footer) e un errore non
+    lascia il ``.tmp``.
+    """
+    output.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = output.with_name(output.name + ".tmp")
+    dates = set()
+    rows = 0
+    writer = None
+    try:
+        with open(tmp_path, "w", encoding="utf-8", newline="") as csv_file:
+            for frame in batches:
+                dates.update(frame["report_date"].unique())
+                rows += len(frame)
+                if output.suffix == ".parquet":
+                    table = pa.Table.from_pandas(frame, preserve_index=False)
+                    if writer is None:
+                        csv_file.close()
+                        writer = pq.ParquetWriter(tmp_path, table.schema, compression="zstd")
+                    writer.write_table(table)
                 else:
-                    results[name] = None
-        
-        return results
+                    frame.to_csv(csv_file, header=(rows == len(frame)), index=False,
+                                 date_format="%Y-%m-%d")
+        if writer is not None:
+            writer.close()
+            writer = None
+        if rows:
+            os.replace(tmp_path, output)
+    finally:
+        if writer is not None:
+            writer.close()
+        if tmp_path.exists():
+            tmp_path.unlink()
+    return len(dates), rows
+
+
+def generate_backtest(date_from: str, date_to: str | None = None, output: Path | None = None,
+                      output_dir: Path = BACKTEST_DIR) -> int:
+    """Report DELTA/BIAS per ogni settimana tra ``date_from`` e ``date_to``."""
+    if output is not None and output.suffix not in (".parquet", ".csv"):
+        print(f"[ERROR] Formato output non supportato: {output.name} (usa .parquet o .csv)")
+        return 1
+
+    if not COT_DUCKDB_PATH.exists():
+        print("[ERROR] Database non trovato: esegui python scripts/cot/sync_complete.py")
+        return 1
+    con = duckdb.connect(str(COT_DUCKDB_PATH), read_only=True)
+    try:
+        tables = {row[0] for row in con.execute("SHOW TABLES").fetchall()}
+        missing = [t for t in (METRICS_TABLE, CATALOG_TABLE) if t not in tables]
+        if missing:
+            print(f"[ERROR] Tabella {', '.join(missing)} non trovata: esegui "
+                  "python scripts/cot/sync_complete.py")
+            return 1
+
+        started = time.perf_counter()
+        batches = iter_backtest_batches(con, date_from, date_to)
+        if output is not None:
+            weeks, rows = write_consolidated(batches, output)
+            target = output
+        else:
+            weeks, rows = write_week_files(batches, output_dir)
+            target = output_dir
+        elapsed = time.perf_counter() - started
     finally:
         con.close()
 
+    if not weeks:
+        print(f"[WARN] Nessuna settimana tra {date_from} e {date_to or 'oggi'}")
+        return 1
+    print(f"[OK] Backtest: {weeks} settimane, {rows} righe -> {target}")
+    print(f"[STATS] time={elapsed:.2f}s throughput={weeks / max(elapsed, 1e-9):.1f} settimane/s")
+    return 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Report automatico COT")
+    parser.add_argument("--from", dest="date_from", metavar="YYYY-MM-DD",
+                        help="Backtest: genera il report per ogni settimana da questa data")
+    parser.add_argument("--to", dest="date_to", metavar="YYYY-MM-DD",
+                        help="Backtest: ultima settimana inclusa (default: ultima disponibile)")
+    parser.add_argument("--output", type=Path,
+                        help="Backtest: un unico file .parquet o .csv invece di un file per settimana")
+    parser.add_argument("--output-dir", type=Path, default=BACKTEST_DIR,
+                        help=f"Backtest: directory dei file settimanali (default: {BACKTEST_DIR})")
+    args = parser.parse_args(argv)
+
+    if args.date_from is None:
+        if args.date_to or args.output:
+            parser.error("--to/--output richiedono --from")
+        generate_report()
+        return 0
+    return generate_backtest(args.date_from, args.date_to, args.output, args.output_dir)
+
 
 if __name__ == "__main__":
-    generate_report()
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""CLI unificata ``cot``: un solo punto di ingresso per tutti gli script.
+
+    python -m scripts.cot <comando> [argomenti]
+    python -m scripts.cot --help
+
+Il dispatcher importa solo il modulo del sottocomando scelto, e i moduli
+importano pandas/pyarrow/duckdb in modo differito (``shared.lazy_import``):
+``--help`` e gli errori di argomenti rispondono senza caricare librerie
+pesanti. Gli script restano eseguibili anche direttamente
+(``python scripts/cot/auto_report.py``).
+"""
+from __future__ import annotations
+
+import importlib
+import sys
+
+# comando -> (modulo con main(argv), descrizione)
+COMMANDS = {
+    "update": ("scripts.cot.update_cot_pipeline", "Scarica i dati CFTC e aggiorna CSV/Parquet"),
+    "convert": ("scripts.cot.auto_convert_csv_to_parquet", "Converte i CSV in Parquet"),
+    "sync": ("scripts.cot.sync_complete", "Sincronizza i Parquet in DuckDB"),
+    "report": ("scripts.cot.auto_report", "Report DELTA/BIAS (anche storico con --from/--to)"),
+    "query": ("scripts.cot.query", "Query SQL sul database"),
+    "normalize": ("scripts.cot.normalize_legacy_cot", "Dataset Legacy normalizzato con metriche"),
+    "serve": ("scripts.cot.serve", "Servizio HTTP per report e query"),
+}
+
+
+def usage() -> str:
+    width = max(len(name) for name in COMMANDS)
+    lines = ["Uso: cot <comando> [argomenti]", "", "Comandi:"]
+    lines += [f"  {name:<{width}}  {description}" for name, (_, description) in COMMANDS.items()]
+    lines += ["", "Aiuto di un comando: cot <comando> --help"]
+    return "\n".join(lines)
+
+
+def main(argv: list[str] | None = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ("-h", "--help"):
+        print(usage())
+        return 0 if argv else 2
+
+    command, rest = argv[0], argv[1:]
+    if command not in COMMANDS:
+        print(f"[ERROR] Comando sconosciuto: {command}\n", file=sys.stderr)
+        print(usage(), file=sys.stderr)
+        return 2
+
+    module_name, _ = COMMANDS[command]
+    # argparse usa sys.argv[0] come nome del programma nei messaggi
+    sys.argv = [f"cot {command}", *rest]
+    module = importlib.import_module(module_name)
+    return module.main(rest) or 0
+
+
+__all__ = ["COMMANDS", "main"]
@@ -1,7 +1,22 @@
-﻿"""Normalize raw CFTC Legacy Futures COT reports to analytics-ready data.
+﻿"""Normalize CFTC Legacy Futures COT reports to analytics-ready data.
 
 Legacy format: Noncommercial (Large Speculators) + Commercial positions
 as shown in the screenshot from Tradingster (market code 090741 - Canadian Dollar).
+
+Job batch sul dataset Parquet convertito (``year=YYYY/``): i mercati vengono
+divisi in blocchi elaborati in parallelo da un pool di processi, ognuno dei
+quali legge solo le righe dei propri mercati (filtro sul codice, i file sono
+ordinati per mercato) e scrive un file per mercato nel dataset normalizzato
+``market=CODE/``. Con ``--markets`` si ricalcolano solo i mercati indicati
+senza toccare gli altri.
+
+Con ``--incremental`` ogni blocco legge dal dataset convertito solo i file
+con settimane successive all'ultima gia' normalizzata dei suoi mercati e,
+dall'output, solo le ultime ``METRIC_HISTORY_ROWS`` righe di ogni mercato
+(gli ultimi row group); le settimane nuove finiscono in un file aggiuntivo
+``market=CODE/..._YYYYMMDD.parquet`` invece di riscrivere tutta la storia.
+Oltre ``MAX_APPEND_PARTS`` file aggiuntivi il mercato viene compattato in
+un unico file.
 """
 
 # -*- coding: utf-8 -*-
@@ -9,11 +24,13 @@ from __future__ import annotations
 
 import argparse
 import logging
+import os
 import sys
+import urllib.parse
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from pathlib import Path
-from typing import Iterable
-
-import pandas as pd
+from typing import Iterable, Sequence
 
 if __package__ is None or __package__ == "":
     REPO_ROOT = Path(__file__).resolve().parents[2]
@@ -24,200 +41,375 @@ if __package__ is None or __package__ == "":
 from shared.encoding_fix import setup_utf8_encoding
 setup_utf8_encoding()
 
-from shared.config import COT_PARQUET_DIR, COT_RAW_DIR, ensure_directories
+from shared.config import COT_DATASET_DIR, COT_NORMALIZED_DIR, ensure_directories
+from shared.cot_convert import dataset_files
+from shared.cot_schema import MARKET_CODE
+from shared.lazy_import import lazy_import
 
+pd = lazy_import("pandas")
+pa = lazy_import("pyarrow")
+pq = lazy_import("pyarrow.parquet")
 
-LOGGER = logging.getLogger("cot.normalize_legacy")
-
-# Mapping per il formato Legacy Futures (adattato per cot_reports library)
-# NOTE: Usiamo solo "As of Date in Form YYYY-MM-DD" per evitare duplicati
-LEGACY_COLUMN_MAP = {
-    # Data formats - SOLO YYYY-MM-DD per evitare duplicati
-    "As of Date in Form YYYY-MM-DD": "report_date",  # Primary - usa questo
-    # NON mappare le altre colonne date per evitare conflitti
-    # "As_of_Date_in_Form_YY-MM-DD": "report_date",
-    # "As of Date in Form YYMMDD": "report_date",
-    
-    # Market identifiers
-    "CFTC Contract Market Code": "contract_market_code",
-    "CFTC_Contract_Market_Code": "contract_market_code",
-    "CFTC Market Code in Initials": "market_code",
-    "CFTC_Market_Code": "market_code",
-    "Market and Exchange Names": "market_and_exchange",
-    "Market_and_Exchange_Names": "market_and_exchange",
-    
-    # Open Interest
-    "Open Interest (All)": "open_interest",
-    "Open_Interest_All": "open_interest",
-    "Change in Open Interest (All)": "open_interest_change",
-    "Change_in_Open_Interest_All": "open_interest_change",
-    
-    # Noncommercial (Large Speculators)
-    "Noncommercial Positions-Long (All)": "noncommercial_long",
-    "Noncommercial_Positions-Long_All": "noncommercial_long",
-    "Noncommercial Positions-Short (All)": "noncommercial_short",
-    "Noncommercial_Positions-Short_All": "noncommercial_short",
-    "Change in Noncommercial-Long (All)": "noncommercial_long_change",
-    "Change_in_Noncommercial-Long_All": "noncommercial_long_change",
-    "Change in Noncommercial-Short (All)": "noncommercial_short_change",
-    "Change_in_Noncommercial-Short_All": "noncommercial_short_change",
-    
-    # Commercial
-    "Commercial Positions-Long (All)": "commercial_long",
-    "Commercial_Positions-Long_All": "commercial_long",
-    "Commercial Positions-Short (All)": "commercial_short",
-    "Commercial_Positions-Short_All": "commercial_short",
-    "Change in Commercial-Long (All)": "commercial_long_change",
-    "Change_in_Commercial-Long_All": "commercial_long_change",
-    "Change in Commercial-Short (All)": "commercial_short_change",
-    "Change_in_Commercial-Short_All": "commercial_short_change",
-    
-    # Total Reportable
-    "Total Reportable-Long (All)": "total_reportable_long",
-    "Total_Reportable_Long_All": "total_reportable_long",
-    "Total Reportable-Short (All)": "total_reportable_short",
-    "Total_Reportable_Short_All": "total_reportable_short",
-    
-    # Nonreportable
-    "Nonreportable Positions-Long (All)": "nonreportable_long",
-    "Nonreportable_Positions-Long_All": "nonreportable_long",
-    "Nonreportable Positions-Short (All)": "nonreportable_short",
-    "Nonreportable_Positions-Short_All": "nonreportable_short",
-}
-
-NUMERIC_COLUMNS = [
-    col for col in LEGACY_COLUMN_MAP.values()
-    if col not in {"report_date", "contract_market_code", "market_code", "market_and_exchange"}
-]
-
-
-def _load_raw_file(path: Path) -> pd.DataFrame:
-    LOGGER.debug("Loading raw file %s", path)
-    
-    # Leggi il file mantenendo i nomi colonne originali
-    try:
-        df = pd.read_csv(path, sep="\t", dtype={"CFTC_Contract_Market_Code": "string", "CFTC_Market_Code": "string"})
-    except Exception:
-        df = pd.read_csv(path, dtype={"CFTC_Contract_Market_Code": "string", "CFTC_Market_Code": "string"})
-    
-    # Rimuovi spazi bianchi dai nomi colonne
-    df.columns = df.columns.str.strip()
-    
-    # Trova colonne disponibili - cerca varianti con trattini o underscore
-    rename_map = {}
-    for file_col in df.columns:
-        # Cerca mapping esatto
-        if file_col in LEGACY_COLUMN_MAP:
-            rename_map[file_col] = LEGACY_COLUMN_MAP[file_col]
-        # Altrimenti cerca variante con underscore
-        else:
-            for legacy_key, target_name in LEGACY_COLUMN_MAP.items():
-                if file_col.replace("-", "_") == legacy_key.replace("-", "_"):
-                    rename_map[file_col] = target_name
-                    break
-    
-    LOGGER.debug("Mapped %d columns from file", len(rename_map))
-    
-    # Selezione solo colonne mappate + mantieni solo quelle necessarie
-    cols_to_keep = list(rename_map.keys())
-    missing_cols = [c for c in cols_to_keep if c not in df.columns]
-    if missing_cols:
-        LOGGER.warning("Missing columns: %s", missing_cols[:5])
-    
-    available_cols = [c for c in cols_to_keep if c in df.columns]
-    df = df[available_cols].rename(columns=rename_map)
-    
-    # Parsing data con formato esplicito
-    if "report_date" in df.columns:
-        # Se ci sono duplicati, prendi il primo
-        if df.columns.tolist().count("report_date") > 1:
-            LOGGER.warning("Multiple report_date columns found, taking first")
-            df = df.loc[:, ~df.columns.duplicated()]
-        
-        # Converti in serie temporale
-        date_series = pd.Series(df["report_date"], dtype="object")
-        df["report_date"] = pd.to_datetime(date_series, format="%Y-%m-%d", errors="coerce")
-        df = df.dropna(subset=["report_date"])
-        LOGGER.debug("Parsed %d valid dates", len(df))
-    else:
-        raise ValueError("report_date column not found after mapping")
-
-    for column in NUMERIC_COLUMNS:
-        if column in df.columns:
-            df[column] = pd.to_numeric(df[column], errors="coerce")
-
-    df["source_file"] = path.name
-    return df
 
+LOGGER = logging.getLogger("cot.normalize_legacy")
 
-def _concat_raw_files(paths: Iterable[Path]) -> pd.DataFrame:
-    frames = [_load_raw_file(path) for path in paths]
+# Colonne canoniche (shared.cot_schema) usate dalle metriche
+NORMALIZED_COLUMNS = (
+    "market_and_exchange",
+    "report_date",
+    "contract_market_code",
+    "market_code",
+    "open_interest",
+    "open_interest_change",
+    "noncommercial_long",
+    "noncommercial_short",
+    "noncommercial_long_change",
+    "noncommercial_short_change",
+    "commercial_long",
+    "commercial_short",
+    "commercial_long_change",
+    "commercial_short_change",
+    "total_reportable_long",
+    "total_reportable_short",
+    "nonreportable_long",
+    "nonreportable_short",
+)
+
+# Righe precedenti necessarie alla finestra piu' lunga (COT Index 156w)
+METRIC_HISTORY_ROWS = 155
+# Row group dell'output: la coda per --incremental sta in uno o due row group
+OUTPUT_ROW_GROUP_SIZE = METRIC_HISTORY_ROWS + 1
+# File aggiuntivi per mercato prima della compattazione (circa un anno di settimane)
+MAX_APPEND_PARTS = 52
+
+DEFAULT_WORKERS = os.cpu_count() or 1
+DEFAULT_CHUNK_SIZE = 50  # mercati per task del pool
+
+
+def list_markets(paths: Iterable[Path]) -> list[str]:
+    """Codici mercato presenti nei file del dataset (legge solo quella colonna)."""
+    codes = set()
+    for path in paths:
+        column = pq.read_table(path, columns=[MARKET_CODE]).column(MARKET_CODE)
+        codes.update(code for code in column.unique().to_pylist() if code)
+    return sorted(codes)
+
+
+def _max_report_date(path: Path):
+    """Ultima data del file dalle statistiche dei row group (None se assenti)."""
+    metadata = pq.ParquetFile(path).metadata
+    names = [metadata.schema.column(i).name for i in range(metadata.num_columns)]
+    if "report_date" not in names:
+        return None
+    column = names.index("report_date")
+    dates = []
+    for index in range(metadata.num_row_groups):
+        stats = metadata.row_group(index).column(column).statistics
+        if stats is None or not stats.has_min_max:
+            return None
+        dates.append(pd.Timestamp(stats.max))
+    return max(dates, default=None)
+
+
+def _load_markets(paths: Iterable[Path], markets: Sequence[str]) -> pd.DataFrame:
+    """Righe dei mercati ``markets`` dai file annuali, con le colonne delle metriche.
+
+    Il filtro sul codice sfrutta le statistiche dei row group (file ordinati
+    per mercato): ogni blocco legge solo le proprie righe. A parita' di
+    (settimana, mercato) vince il file dell'anno piu' recente.
+    """
+    frames = []
+    for path in paths:
+        names = pq.ParquetFile(path).schema_arrow.names
+        table = pq.read_table(
+            path,
+            columns=[name for name in NORMALIZED_COLUMNS if name in names],
+            filters=[(MARKET_CODE, "in", list(markets))],
+        )
+        LOGGER.debug("Loaded %d rows from %s", table.num_rows, path.name)
+        if table.num_rows:
+            df = table.to_pandas(date_as_object=False)
+            df["source_file"] = path.name
+            frames.append(df)
     if not frames:
-        raise FileNotFoundError("No raw COT files matched")
+        return pd.DataFrame()
     combined = pd.concat(frames, ignore_index=True)
-    combined = combined.dropna(subset=["report_date", "contract_market_code"])
     combined = combined.drop_duplicates(subset=["report_date", "contract_market_code"], keep="last")
     return combined
 
 
 def _compute_metrics(df: pd.DataFrame) -> pd.DataFrame:
-    """Calculate COT Index and z-scores for Legacy format."""
+    """Calculate COT Index and z-scores for Legacy format.
+
+    Tutte le finestre mobili sono calcolate con ``groupby().rolling()`` sul
+    frame intero (una passata vettorizzata per metrica, con i confini dei
+    gruppi gestiti internamente da pandas) invece di un ``apply`` Python per
+    mercato. I risultati coincidono con il calcolo per gruppo.
+    """
     df = df.sort_values(["contract_market_code", "report_date"]).reset_index(drop=True)
 
     # Net positions per categoria
     df["noncommercial_net"] = df["noncommercial_long"] - df["noncommercial_short"]
     df["commercial_net"] = df["commercial_long"] - df["commercial_short"]
 
-    def _group_metrics(group: pd.DataFrame) -> pd.DataFrame:
-        # COT Index basato su Noncommercial (Large Speculators)
-        net = group["noncommercial_net"]
+    grouped = df.groupby("contract_market_code", sort=False)
+    net = df["noncommercial_net"]
+
+    def _rolling(window: int):
+        return grouped["noncommercial_net"].rolling(window=window, min_periods=1)
+
+    def _aligned(series: pd.Series) -> pd.Series:
+        # Il risultato ha (gruppo, indice originale): torna all'indice del frame
+        return series.reset_index(level=0, drop=True)
 
-        rolling_max = net.rolling(window=156, min_periods=1).max()
-        rolling_min = net.rolling(window=156, min_periods=1).min()
-        denominator = rolling_max - rolling_min
-        cot_index = (net - rolling_min) / denominator.replace(0, pd.NA)
-        group["noncommercial_cot_index_156w"] = (cot_index * 100).fillna(50.0)
+    # COT Index basato su Noncommercial (Large Speculators)
+    window_156 = _rolling(156)
+    rolling_max = _aligned(window_156.max())
+    rolling_min = _aligned(window_156.min())
+    denominator = rolling_max - rolling_min
+    cot_index = (net - rolling_min) / denominator.where(denominator != 0)
+    df["noncommercial_cot_index_156w"] = (cot_index * 100).fillna(50.0)
 
-        # Z-score 52 settimane
-        mean_52 = net.rolling(window=52, min_periods=1).mean()
-        std_52 = net.rolling(window=52, min_periods=1).std(ddof=0)
-        group["noncommercial_net_zscore_52w"] = (net - mean_52) / std_52.replace(0, pd.NA)
+    # Z-score 52 settimane
+    window_52 = _rolling(52)
+    mean_52 = _aligned(window_52.mean())
+    std_52 = _aligned(window_52.std(ddof=0))
+    df["noncommercial_net_zscore_52w"] = (net - mean_52) / std_52.where(std_52 != 0)
 
-        # Change week-over-week
-        group["noncommercial_net_change_wow"] = net.diff()
-        
-        # Commercial net per confronto
-        group["commercial_net_change_wow"] = group["commercial_net"].diff()
+    # Change week-over-week
+    df["noncommercial_net_change_wow"] = grouped["noncommercial_net"].diff()
 
-        return group
+    # Commercial net per confronto
+    df["commercial_net_change_wow"] = grouped["commercial_net"].diff()
 
-    df = df.groupby("contract_market_code", group_keys=False).apply(_group_metrics)
     return df
 
 
-def normalize(raw_paths, output: Path) -> Path:
-    frame = _concat_raw_files(raw_paths)
-    frame = _compute_metrics(frame)
+def _compute_metrics_incremental(frame: pd.DataFrame, existing: pd.DataFrame) -> pd.DataFrame:
+    """Calcola le metriche solo per le settimane non ancora presenti in ``existing``.
+
+    Per ogni mercato con righe nuove vengono riprese dall'output esistente
+    solo le ultime ``METRIC_HISTORY_ROWS`` righe: bastano a riempire ogni
+    finestra mobile (156w, 52w, diff) delle righe nuove, quindi i valori
+    coincidono con un ricalcolo completo (lo z-score a meno di ~1e-15, per
+    l'algoritmo online di rolling std). Il costo e' O(mercati x 156)
+    invece di O(mercati x storia). Le revisioni di settimane gia' presenti
+    vengono ignorate: per quelle serve un ricalcolo completo.
+    """
+    last_dates = existing.groupby("contract_market_code")["report_date"].max()
+    cutoff = frame["contract_market_code"].map(last_dates)
+    new_rows = frame[cutoff.isna() | (frame["report_date"] > cutoff)]
+    if new_rows.empty:
+        return new_rows.iloc[0:0]
+
+    history = existing[existing["contract_market_code"].isin(new_rows["contract_market_code"].unique())]
+    history = (
+        history.sort_values(["contract_market_code", "report_date"])
+        .groupby("contract_market_code", sort=False)
+        .tail(METRIC_HISTORY_ROWS)
+    )
+    combined = pd.concat(
+        [history[frame.columns].assign(_is_new=False), new_rows.assign(_is_new=True)],
+        ignore_index=True,
+    )
+    computed = _compute_metrics(combined)
+    return computed[computed["_is_new"]].drop(columns="_is_new")
 
-    ensure_directories()
-    output.parent.mkdir(parents=True, exist_ok=True)
-    frame.to_parquet(output, index=False)
-
-    LOGGER.info(
-        "Wrote %d normalized rows covering %d markets to %s",
-        len(frame),
-        frame["contract_market_code"].nunique(),
-        output,
+
+def partition_file(output_dir: Path, code: str) -> Path:
+    """File del mercato nel dataset normalizzato (``{output}/market=CODE/{output}_CODE.parquet``).
+
+    Il codice e' quotato come nelle partizioni Hive (``13874+`` -> ``13874%2B``).
+    """
+    output_dir = Path(output_dir)
+    quoted = urllib.parse.quote(code, safe="")
+    return output_dir / f"market={quoted}" / f"{output_dir.name}_{quoted}.parquet"
+
+
+def append_file(output_dir: Path, code: str, last_date) -> Path:
+    """File aggiuntivo del mercato con le settimane fino a ``last_date`` (``..._YYYYMMDD.parquet``)."""
+    base = partition_file(output_dir, code)
+    return base.with_name(f"{base.stem}_{pd.Timestamp(last_date):%Y%m%d}.parquet")
+
+
+def market_parts(output_dir: Path, code: str) -> list[Path]:
+    """File del mercato in ordine cronologico: quello base, poi gli aggiuntivi per data."""
+    return sorted(partition_file(output_dir, code).parent.glob("*.parquet"))
+
+
+def _write_market(df: pd.DataFrame, path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    try:
+        df.to_parquet(tmp_path, index=False, compression="zstd", row_group_size=OUTPUT_ROW_GROUP_SIZE)
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+def _replace_market(df: pd.DataFrame, output_dir: Path, code: str) -> None:
+    """Riscrive tutta la storia del mercato nel file base e rimuove gli aggiuntivi."""
+    base = partition_file(output_dir, code)
+    _write_market(df, base)
+    for path in market_parts(output_dir, code):
+        if path != base:
+            path.unlink()
+
+
+def _read_tail(parts: Sequence[Path], rows: int) -> pd.DataFrame:
+    """Ultime ``rows`` righe (o poco piu') leggendo i row group dall'ultimo all'indietro."""
+    tables = []
+    collected = 0
+    for path in reversed(parts):
+        parquet = pq.ParquetFile(path)
+        for index in reversed(range(parquet.num_row_groups)):
+            table = parquet.read_row_group(index)
+            tables.append(table)
+            collected += table.num_rows
+            if collected >= rows:
+                break
+        if collected >= rows:
+            break
+    frames = [table.to_pandas(date_as_object=False) for table in reversed(tables)]
+    return pd.concat(frames, ignore_index=True)
+
+
+def _read_tails(output_dir: Path, markets: Sequence[str]) -> pd.DataFrame | None:
+    """Coda dell'output esistente dei mercati ``markets`` (None se nessuno e' normalizzato)."""
+    tails = [_read_tail(parts, METRIC_HISTORY_ROWS)
+             for parts in (market_parts(output_dir, code) for code in markets) if parts]
+    if not tails:
+        return None
+    return pd.concat(tails, ignore_index=True)
+
+
+def _load_new_weeks(paths: Sequence[Path], markets: Sequence[str],
+                    existing: pd.DataFrame) -> pd.DataFrame:
+    """Righe dal dataset convertito leggendo solo i file che servono.
+
+    I mercati gia' normalizzati leggono solo i file con date successive alla
+    loro ultima settimana (statistiche dei row group), quelli nuovi tutto.
+    """
+    last_dates = existing.groupby(MARKET_CODE)["report_date"].max()
+    known = [code for code in markets if code in last_dates.index]
+    new = [code for code in markets if code not in last_dates.index]
+    cutoff = last_dates.min()
+    recent = [path for path in paths
+              if (latest := _max_report_date(path)) is None or latest > cutoff]
+    frames = [frame for frame in (_load_markets(recent, known) if known and recent else None,
+                                  _load_markets(paths, new) if new else None)
+              if frame is not None and not frame.empty]
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
+
+
+def normalize_chunk(paths: Sequence[Path], markets: Sequence[str], output_dir: Path,
+                    incremental: bool = False) -> dict:
+    """Normalizza un blocco di mercati e scrive un file per mercato (task del pool).
+
+    Ritorna righe scritte, mercati aggiornati e intervallo di date del blocco.
+    """
+    result = {"rows": 0, "markets": 0, "min_date": None, "max_date": None}
+    existing = _read_tails(output_dir, markets) if incremental else None
+    frame = _load_markets(paths, markets) if existing is None else _load_new_weeks(paths, markets, existing)
+    if frame.empty:
+        return result
+
+    if existing is not None and not set(frame.columns) <= set(existing.columns):
+        # Output scritto con un altro insieme di colonne: va ricalcolato tutto
+        LOGGER.info("Columns changed since %s was written: full recompute", output_dir.name)
+        existing = None
+        frame = _load_markets(paths, markets)
+
+    if existing is not None:
+        frame = _compute_metrics_incremental(frame, existing)
+        if frame.empty:
+            return result
+        frame = frame[existing.columns]
+        for code, group in frame.groupby(MARKET_CODE, sort=False):
+            parts = market_parts(output_dir, code)
+            if len(parts) > MAX_APPEND_PARTS:
+                # Troppi file piccoli: il mercato torna a un unico file
+                history = pd.concat([pd.read_parquet(path) for path in parts] + [group],
+                                    ignore_index=True)
+                _replace_market(history, output_dir, code)
+            else:
+                _write_market(group, append_file(output_dir, code, group["report_date"].max()))
+    else:
+        frame = _compute_metrics(frame)
+        for code, group in frame.groupby(MARKET_CODE, sort=False):
+            _replace_market(group, output_dir, code)
+    result.update(
+        rows=len(frame),
+        markets=frame[MARKET_CODE].nunique(),
+        min_date=frame["report_date"].min(),
+        max_date=frame["report_date"].max(),
     )
-    
+    return result
+
+
+def _chunks(markets: Sequence[str], size: int) -> list[list[str]]:
+    return [list(markets[i:i + size]) for i in range(0, len(markets), max(1, size))]
+
+
+def normalize(paths: Sequence[Path], output: Path = COT_NORMALIZED_DIR, incremental: bool = False,
+              markets: Sequence[str] | None = None, workers: int = DEFAULT_WORKERS,
+              chunk_size: int = DEFAULT_CHUNK_SIZE) -> Path:
+    """Normalizza i file annuali ``paths`` nel dataset ``output`` (una partizione per mercato).
+
+    Senza ``markets`` vengono elaborati tutti i mercati dei file e rimosse le
+    partizioni dei mercati non piu' presenti; con ``markets`` solo quelli.
+    """
+    paths = [Path(path) for path in paths]
+    if not paths:
+        raise FileNotFoundError("No COT Parquet files matched")
+    all_markets = list_markets(paths)
+    selected = all_markets if markets is None else [code for code in all_markets if code in set(markets)]
+    missing = sorted(set(markets or ()) - set(selected))
+    if missing:
+        LOGGER.warning("Markets not found in the dataset: %s", ", ".join(missing))
+    if not selected:
+        raise ValueError("No markets to normalize")
+
+    ensure_directories()
+    output = Path(output)
+    output.mkdir(parents=True, exist_ok=True)
+    chunks = _chunks(selected, chunk_size)
+    LOGGER.info("Normalizing %d markets in %d chunks with %d workers", len(selected), len(chunks), workers)
+    if workers <= 1 or len(chunks) == 1:
+        results = [normalize_chunk(paths, chunk, output, incremental) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(normalize_chunk, repeat(paths), chunks, repeat(output),
+                                    repeat(incremental)))
+
+    if markets is None:
+        present = {partition_file(output, code).parent for code in all_markets}
+        for stale in output.glob("market=*"):
+            if stale not in present:
+                for path in stale.glob("*.parquet"):
+                    path.unlink()
+                stale.rmdir()
+                LOGGER.info("Removed %s (market no longer in the dataset)", stale.name)
+
+    rows = sum(result["rows"] for result in results)
+    updated = sum(result["markets"] for result in results)
+    if incremental and rows == 0:
+        print("\n[OK] Nessuna nuova settimana da normalizzare")
+        return output
+    dates = [result[key] for result in results for key in ("min_date", "max_date") if result[key] is not None]
+
+    LOGGER.info("Wrote %d normalized rows covering %d markets to %s", rows, updated, output)
+
     # Statistiche di test
     print(f"\n=== Riepilogo Normalizzazione ===")
-    print(f"Totale righe: {len(frame)}")
-    print(f"Date range: {frame['report_date'].min()} - {frame['report_date'].max()}")
-    print(f"Markets unici: {frame['contract_market_code'].nunique()}")
-    if "noncommercial_cot_index_156w" in frame.columns:
-        print(f"COT Index (primo valore): {frame['noncommercial_cot_index_156w'].iloc[-1]:.2f}")
-    
+    print(f"Totale righe: {rows}")
+    if dates:
+        print(f"Date range: {min(dates)} - {max(dates)}")
+    print(f"Markets aggiornati: {updated}/{len(all_markets)}")
+
     return output
 
 
@@ -227,13 +419,42 @@ def parse_args(argv: list[str]) -> argparse.Namespace:
         "paths",
         nargs="*",
         type=Path,
-        help="Raw file paths (defaults to all files in data/cot/raw)",
+        help="Yearly Parquet files (defaults to the whole dataset in --dataset-dir)",
+    )
+    parser.add_argument(
+        "--dataset-dir",
+        type=Path,
+        default=COT_DATASET_DIR,
+        help="Converted Parquet dataset (year=YYYY/) to read",
     )
     parser.add_argument(
         "--output",
         type=Path,
-        default=COT_PARQUET_DIR / "legacy_futures.parquet",
-        help="Destination Parquet file",
+        default=COT_NORMALIZED_DIR,
+        help="Destination dataset directory (one market=CODE/ partition per market)",
+    )
+    parser.add_argument(
+        "--markets",
+        nargs="+",
+        metavar="CODE",
+        help="Recompute only these CFTC contract market codes (e.g. 099741 13874A)",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Compute metrics only for weeks not yet in --output and append them",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help="Worker processes (default: CPU count; 1 = no pool)",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=DEFAULT_CHUNK_SIZE,
+        help="Markets per worker task",
     )
     parser.add_argument(
         "--log-level",
@@ -248,17 +469,14 @@ def main(argv: list[str]) -> int:
     args = parse_args(argv)
     logging.basicConfig(level=getattr(logging, args.log_level))
 
-    if args.paths:
-        raw_paths = list(args.paths)
-    else:
-        raw_paths = sorted(COT_RAW_DIR.glob("*.txt"))
-
-    if not raw_paths:
-        LOGGER.error("No raw files found")
+    paths = list(args.paths) or dataset_files(args.dataset_dir)
+    if not paths:
+        LOGGER.error("No Parquet files found in %s (run the update/convert step first)", args.dataset_dir)
         return 1
 
     try:
-        normalize(raw_paths, args.output)
+        normalize(paths, args.output, incremental=args.incremental, markets=args.markets,
+                  workers=args.workers, chunk_size=args.chunk_size)
     except Exception as exc:
         LOGGER.exception("Normalization failed: %s", exc)
         return 1
@@ -1,4 +1,24 @@
 # -*- coding: utf-8 -*-
+"""Esegue una query SQL sul database COT.
+
+Senza ``--format`` stampa le righe come tuple (comportamento storico, adatto
+a risultati piccoli). Per estrazioni grandi i formati colonnari non passano
+mai da oggetti Python riga per riga:
+
+- con ``--output`` parquet/csv/jsonl vengono scritti da DuckDB con
+  ``COPY (...) TO``;
+- su stdout (csv, jsonl, arrow) il risultato viene letto a blocchi di
+  ``--batch-size`` righe come record batch Arrow, in memoria costante.
+
+Esempi:
+    python scripts/cot/query.py "SELECT * FROM cot_metrics" --format parquet --output metrics.parquet
+    python scripts/cot/query.py "SELECT * FROM cot_disagg" --format csv --limit 100 > sample.csv
+    python scripts/cot/query.py "SELECT * FROM cot_metrics WHERE report_date > '2024-01-01'" --explain-analyze
+"""
+from __future__ import annotations
+
+import argparse
+import json
 import sys
 from pathlib import Path
 
@@ -11,21 +31,134 @@ if __package__ is None or __package__ == "":
 from shared.encoding_fix import setup_utf8_encoding
 setup_utf8_encoding()
 
-import duckdb
 from shared.config import COT_DUCKDB_PATH
+from shared.lazy_import import lazy_import
+
+duckdb = lazy_import("duckdb")
 
 DB_PATH = COT_DUCKDB_PATH
 
-if len(sys.argv) < 2:
-    print("Usage: python query.py \"SQL query\"")
-    sys.exit(1)
+FORMATS = ("rows", "arrow", "parquet", "csv", "jsonl")
+DEFAULT_BATCH_SIZE = 100_000
+
+# Opzioni COPY per formato (--output)
+COPY_OPTIONS = {
+    "parquet": "FORMAT parquet, COMPRESSION zstd",
+    "csv": "FORMAT csv, HEADER true",
+    "jsonl": "FORMAT json",
+}
+
+
+def _record_batches(con: duckdb.DuckDBPyConnection, sql: str, batch_size: int):
+    result = con.execute(sql)
+    # to_arrow_reader() sostituisce fetch_record_batch() da DuckDB 1.4
+    if hasattr(result, "to_arrow_reader"):
+        return result.to_arrow_reader(batch_size)
+    return result.fetch_record_batch(batch_size)
+
+
+def copy_to_file(con: duckdb.DuckDBPyConnection, sql: str, fmt: str, output: Path) -> None:
+    """Scrive il risultato direttamente da DuckDB (parquet/csv/jsonl)."""
+    target = str(output).replace("'", "''")
+    con.execute(f"COPY ({sql}) TO '{target}' ({COPY_OPTIONS[fmt]})")
+
+
+def stream_arrow(con: duckdb.DuckDBPyConnection, sql: str, sink, batch_size: int) -> int:
+    """Stream Arrow IPC (leggibile con ``pyarrow.ipc.open_stream``)."""
+    import pyarrow as pa
+
+    reader = _record_batches(con, sql, batch_size)
+    rows = 0
+    with pa.ipc.new_stream(sink, reader.schema) as writer:
+        for batch in reader:
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    return rows
+
+
+def stream_csv(con: duckdb.DuckDBPyConnection, sql: str, sink, batch_size: int) -> int:
+    import pyarrow.csv as pacsv
+
+    reader = _record_batches(con, sql, batch_size)
+    rows = 0
+    with pacsv.CSVWriter(sink, reader.schema) as writer:
+        for batch in reader:
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    return rows
+
+
+def stream_jsonl(con: duckdb.DuckDBPyConnection, sql: str, sink, batch_size: int) -> int:
+    rows = 0
+    for batch in _record_batches(con, sql, batch_size):
+        lines = [json.dumps(row, default=str) for row in batch.to_pylist()]
+        if lines:
+            sink.write(("\n".join(lines) + "\n").encode("utf-8"))
+        rows += batch.num_rows
+    return rows
+
+
+STREAMERS = {"arrow": stream_arrow, "csv": stream_csv, "jsonl": stream_jsonl}
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Query SQL sul database COT",
+        epilog="Tabelle: cot_metrics (net, COT index, z-score, percentili), cot_disagg (posizioni raw)",
+    )
+    parser.add_argument("sql", help="Query SQL")
+    parser.add_argument("--format", choices=FORMATS, default="rows",
+                        help="rows: tuple Python (default); arrow/parquet/csv/jsonl: output colonnare")
+    parser.add_argument("--output", type=Path,
+                        help="File di destinazione (obbligatorio per parquet; default stdout)")
+    parser.add_argument("--limit", type=int, help="Limita il numero di righe restituite")
+    parser.add_argument("--explain-analyze", action="store_true",
+                        help="Esegue la query e mostra il piano con tempi e righe per operatore")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f"Righe per blocco in streaming (default {DEFAULT_BATCH_SIZE:,})")
+    args = parser.parse_args(argv)
+
+    sql = args.sql.strip().rstrip(";")
+    if args.limit is not None:
+        sql = f"SELECT * FROM ({sql}) LIMIT {int(args.limit)}"
+    if args.format == "parquet" and args.output is None:
+        parser.error("--format parquet richiede --output")
+
+    con = duckdb.connect(str(DB_PATH), read_only=True)
+    try:
+        if args.explain_analyze:
+            for _, plan in con.execute(f"EXPLAIN ANALYZE {sql}").fetchall():
+                print(plan)
+            return 0
+
+        if args.format == "rows":
+            result = con.execute(sql)
+            while True:
+                chunk = result.fetchmany(args.batch_size)
+                if not chunk:
+                    break
+                for row in chunk:
+                    print(row)
+            return 0
+
+        if args.output is not None and args.format in COPY_OPTIONS:
+            copy_to_file(con, sql, args.format, args.output)
+            print(f"[OK] {args.format} scritto in {args.output}", file=sys.stderr)
+            return 0
+
+        streamer = STREAMERS[args.format]
+        if args.output is not None:
+            with open(args.output, "wb") as sink:
+                rows = streamer(con, sql, sink, args.batch_size)
+            print(f"[OK] {rows:,} righe scritte in {args.output}", file=sys.stderr)
+        else:
+            sys.stdout.flush()
+            streamer(con, sql, sys.stdout.buffer, args.batch_size)
+            sys.stdout.buffer.flush()
+    finally:
+        con.close()
+    return 0
 
-query = sys.argv[1]
 
-con = duckdb.connect(str(DB_PATH))
-try:
-    result = con.execute(query).fetchall()
-    for row in result:
-        print(row)
-finally:
-    con.close()
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+"""Servizio HTTP locale per report e query COT.
+
+Evita a ogni chiamata l'avvio di Python, gli import di pandas/duckdb e una
+nuova ``duckdb.connect()``: il processo resta attivo e tiene un pool di
+connessioni read-only sull'ultimo snapshot pubblicato da ``sync_complete.py``
+(``shared.cot_snapshot``). Ogni richiesta usa un cursore del pool; quando il
+sync pubblica un nuovo snapshot il servizio lo apre e ci passa senza
+interrompere le richieste in corso (il vecchio viene chiuso quando si
+liberano i suoi cursori).
+
+Endpoint:
+    GET  /report[?date=YYYY-MM-DD][&format=json]   report DELTA/BIAS
+    POST /query  {"sql": "...", "params": [...], "limit": N}
+                                                   una sola SELECT parametrizzata
+    GET  /health                                   snapshot in uso
+
+``/query`` accetta solo POST con ``Content-Type: application/json`` (da
+un'altra pagina aperta nel browser richiederebbe un preflight CORS, che il
+servizio non concede) e una sola istruzione SELECT. Le connessioni del pool hanno inoltre l'accesso al
+filesystem disabilitato (``enable_external_access=false``, salvo le
+directory Parquet lette dalle viste) e la configurazione bloccata, quindi
+neanche una SELECT puo' leggere o scrivere altri file (``COPY``,
+``read_text``, ``ATTACH``...).
+
+Uso:
+    python scripts/cot/serve.py --port 8765
+    curl "http://127.0.0.1:8765/report?date=2025-09-23"
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import queue
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.append(str(REPO_ROOT))
+
+# Fix encoding UTF-8 per Windows
+from shared.encoding_fix import setup_utf8_encoding
+setup_utf8_encoding()
+
+from shared.config import COT_DUCKDB_PATH, COT_PARQUET_DIR, COT_SNAPSHOT_DIR
+from shared.cot_snapshot import current_snapshot, publish_snapshot
+from scripts.cot.auto_report import build_report, fetch_report_rows, resolve_instruments
+from shared.lazy_import import lazy_import
+
+duckdb = lazy_import("duckdb")
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_POOL_SIZE = 4
+DEFAULT_POLL_INTERVAL = 2.0  # secondi tra due controlli del puntatore snapshot
+DEFAULT_QUERY_LIMIT = 10_000
+# Unici percorsi leggibili dalle connessioni del servizio (viste in modo view)
+ALLOWED_DIRECTORIES = (COT_PARQUET_DIR,)
+
+
+def _lock_down(connection: duckdb.DuckDBPyConnection) -> None:
+    """Disabilita l'accesso ai file fuori dal dataset e blocca la configurazione."""
+    connection.execute("SET allowed_directories = ?",
+                       [[f"{Path(path).resolve()}/" for path in ALLOWED_DIRECTORIES]])
+    connection.execute("SET enable_external_access = false")
+    connection.execute("SET lock_configuration = true")
+
+
+def validate_select(sql: str) -> None:
+    """Accetta solo una singola istruzione SELECT (ValueError altrimenti)."""
+    statements = duckdb.extract_statements(sql)
+    if len(statements) != 1:
+        raise ValueError("'sql' deve contenere una sola istruzione")
+    if statements[0].type != duckdb.StatementType.SELECT:
+        raise ValueError(f"istruzione non ammessa: {statements[0].type.name} (solo SELECT)")
+
+
+class SnapshotGeneration:
+    """Un database aperto in sola lettura con il suo pool di cursori."""
+
+    def __init__(self, path: Path, pool_size: int):
+        self.path = path
+        self.opened_at = datetime.now()
+        self.connection = duckdb.connect(str(path), read_only=True)
+        _lock_down(self.connection)
+        self.cursors: queue.Queue = queue.Queue()
+        for _ in range(pool_size):
+            self.cursors.put(self.connection.cursor())
+        self.active = 0
+        self.retired = False
+        self.lock = threading.Lock()
+        # Simboli del report risolti una volta per snapshot
+        cursor = self.connection.cursor()
+        try:
+            self.codes = resolve_instruments(cursor)
+        finally:
+            cursor.close()
+
+    def enter(self) -> None:
+        """Registra una richiesta: la generazione non viene chiusa finche' e' attiva."""
+        with self.lock:
+            self.active += 1
+
+    def checkout(self) -> duckdb.DuckDBPyConnection:
+        return self.cursors.get()
+
+    def checkin(self, cursor: duckdb.DuckDBPyConnection) -> None:
+        self.cursors.put(cursor)
+        with self.lock:
+            self.active -= 1
+            close = self.retired and self.active == 0
+        if close:
+            self.close()
+
+    def retire(self) -> None:
+        """Segna la generazione come sostituita; si chiude a richieste finite."""
+        with self.lock:
+            self.retired = True
+            close = self.active == 0
+        if close:
+            self.close()
+
+    def close(self) -> None:
+        while not self.cursors.empty():
+            self.cursors.get_nowait().close()
+        self.connection.close()
+
+
+class SnapshotPool:
+    """Pool read-only che segue il puntatore ``CURRENT`` degli snapshot."""
+
+    def __init__(self, snapshot_dir: Path = COT_SNAPSHOT_DIR,
+                 pool_size: int = DEFAULT_POOL_SIZE, poll_interval: float = DEFAULT_POLL_INTERVAL):
+        self.snapshot_dir = snapshot_dir
+        self.pool_size = pool_size
+        self.poll_interval = poll_interval
+        self.lock = threading.Lock()
+        self.generation: SnapshotGeneration | None = None
+        self.checked_at = 0.0
+        self.refresh(force=True)
+
+    def refresh(self, force: bool = False) -> None:
+        """Passa al nuovo snapshot se il puntatore e' cambiato (al massimo ogni poll_interval)."""
+        now = time.monotonic()
+        if not force and now - self.checked_at < self.poll_interval:
+            return
+        with self.lock:
+            self.checked_at = now
+            # Mai il database live: lo terrebbe bloccato per il sync
+            target = current_snapshot(self.snapshot_dir)
+            if target is None and self.generation is None:
+                raise FileNotFoundError(f"Nessuno snapshot pubblicato in {self.snapshot_dir}")
+            if target is None or (self.generation is not None and self.generation.path == target):
+                return
+            previous = self.generation
+            self.generation = SnapshotGeneration(target, self.pool_size)
+        print(f"[OK] Snapshot in uso: {target.name}", flush=True)
+        if previous is not None:
+            previous.retire()
+
+    @contextmanager
+    def cursor(self):
+        self.refresh()
+        with self.lock:
+            generation = self.generation
+            generation.enter()
+        # Fuori dal lock: con il pool esaurito si attende solo un cursore libero
+        cursor = generation.checkout()
+        try:
+            yield generation, cursor
+        finally:
+            generation.checkin(cursor)
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+class CotRequestHandler(BaseHTTPRequestHandler):
+    pool: SnapshotPool  # impostato da make_server
+
+    def _send(self, status: int, body: str, content_type: str) -> None:
+        payload = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_json(self, status: int, data) -> None:
+        self._send(status, json.dumps(data, default=_json_default), "application/json")
+
+    def do_GET(self) -> None:
+        url = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            if url.path == "/report":
+                self._report(params)
+            elif url.path == "/query":
+                self._send_json(405, {"error": "usa POST /query con corpo JSON"})
+            elif url.path == "/health":
+                self.pool.refresh()
+                generation = self.pool.generation
+                self._send_json(200, {"snapshot": generation.path.name,
+                                      "opened_at": generation.opened_at})
+            else:
+                self._send_json(404, {"error": f"endpoint sconosciuto: {url.path}"})
+        except (ValueError, duckdb.Error) as e:
+            self._send_json(400, {"error": str(e)})
+
+    def do_POST(self) -> None:
+        url = urlparse(self.path)
+        if url.path != "/query":
+            self._send_json(404, {"error": f"endpoint sconosciuto: {url.path}"})
+            return
+        content_type = self.headers.get("Content-Type", "").split(";")[0].strip().lower()
+        if content_type != "application/json":
+            self._send_json(415, {"error": "Content-Type richiesto: application/json"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            self._query(body.get("sql"), body.get("params", []), body.get("limit"))
+        except (ValueError, duckdb.Error) as e:
+            self._send_json(400, {"error": str(e)})
+
+    def _report(self, params: dict) -> None:
+        with self.pool.cursor() as (generation, cursor):
+            rows = fetch_report_rows(cursor, report_date=params.get("date"), codes=generation.codes)
+        if rows.empty or rows["report_date"].isna().all() or not rows["available"].any():
+            self._send_json(404, {"error": "nessun dato per la data richiesta"})
+            return
+        lines, results = build_report(rows, header="report")
+        if params.get("format") == "json":
+            self._send_json(200, {"report_date": rows["report_date"].iloc[0], "instruments": results})
+        else:
+            self._send(200, "\n".join(lines) + "\n", "text/plain")
+
+    def _query(self, sql: str | None, query_params, limit) -> None:
+        if not sql:
+            raise ValueError("parametro 'sql' mancante")
+        validate_select(sql)
+        limit = int(limit or DEFAULT_QUERY_LIMIT)
+        with self.pool.cursor() as (_, cursor):
+            result = cursor.execute(sql, query_params)
+            columns = [col[0] for col in result.description]
+            rows = result.fetchmany(limit + 1)
+        self._send_json(200, {
+            "columns": columns,
+            "rows": rows[:limit],
+            "truncated": len(rows) > limit,
+        })
+
+    def log_message(self, format: str, *args) -> None:
+        sys.stderr.write(f"{self.address_string()} - {format % args}\n")
+
+
+def make_server(host: str, port: int, pool: SnapshotPool) -> ThreadingHTTPServer:
+    handler = type("Handler", (CotRequestHandler,), {"pool": pool})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def publish_initial_snapshot(database: Path = COT_DUCKDB_PATH,
+                             snapshot_dir: Path = COT_SNAPSHOT_DIR) -> Path:
+    """Pubblica il primo snapshot di un database sincronizzato prima degli snapshot.
+
+    La copia avviene con il database aperto in sola lettura: un sync in corso
+    fa fallire l'apertura invece di produrre una copia a meta'.
+    """
+    con = duckdb.connect(str(database), read_only=True)
+    try:
+        snapshot = publish_snapshot(database, snapshot_dir)
+    finally:
+        con.close()
+    print(f"[OK] Primo snapshot pubblicato: {snapshot.name}", flush=True)
+    return snapshot
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Servizio HTTP read-only per report e query COT")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--pool-size", type=int, default=DEFAULT_POOL_SIZE,
+                        help="Cursori read-only per snapshot (richieste concorrenti)")
+    parser.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL,
+                        help="Secondi tra due controlli di nuovi snapshot")
+    args = parser.parse_args(argv)
+
+    if current_snapshot() is None:
+        if not COT_DUCKDB_PATH.exists():
+            print("[ERROR] Nessun database: esegui python scripts/cot/sync_complete.py")
+            return 1
+        try:
+            publish_initial_snapshot()
+        except (duckdb.Error, OSError) as e:
+            print(f"[ERROR] Pubblicazione del primo snapshot fallita: {e}")
+            print("Esegui python scripts/cot/sync_complete.py e riprova")
+            return 1
+
+    pool = SnapshotPool(pool_size=args.pool_size, poll_interval=args.poll_interval)
+    server = make_server(args.host, args.port, pool)
+    print(f"[OK] In ascolto su http://{args.host}:{args.port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,53 @@
 # -*- coding: utf-8 -*-
-"""Sincronizza TUTTI i dati COT (2023+2024+2025) in DuckDB."""
+"""Sincronizza TUTTI i dati COT (2023+2024+2025) in DuckDB.
+
+Di default la sincronizzazione e' incrementale: per ogni file Parquet viene
+salvata in ``cot_sync_state`` un'impronta (size, mtime, sha256) e
+l'intervallo di ``report_date``. Ai run successivi vengono ricaricati solo i
+file cambiati e in ``cot_disagg`` finiscono solo le righe nuove/modificate
+per chiave ``(report_date, contract_market_code)`` tramite un MERGE a stadi
+(DELETE + INSERT nella stessa transazione); le chiavi sparite da un file
+riconvertito vengono eliminate nella stessa transazione. Con ``--full`` la tabella viene
+ricostruita da zero e sostituita atomicamente.
+
+Con l'engine ``duckdb`` (default) i Parquet sono letti direttamente da
+DuckDB con ``read_parquet(..., union_by_name=true)``: le colonne hanno gia'
+nomi e tipi canonici (``shared.cot_schema``, assegnati alla conversione) e
+nessuna copia dei dati passa da pandas. I Parquet scritti prima dello schema
+condiviso vengono rinominati e tipizzati nella proiezione.
+L'engine ``pandas`` resta disponibile per confronto (``--compare-engines``).
+
+Con ``--mode view`` i dati non vengono copiati in DuckDB: ``cot_disagg``,
+``cot_metrics`` e ``market_catalog`` sono viste sul dataset Parquet (stessa
+proiezione e stesse metriche del modo ``table``), il sync si limita a
+(ri)definirle e ogni nuova settimana convertita e' subito visibile. Il modo
+resta quello dell'ultimo sync se ``--mode`` non e' indicato; passando da un
+modo all'altro le relazioni vengono ricreate da zero.
+
+Ogni famiglia di report (``shared.cot_families``: legacy, combined,
+disaggregated, tff) ha la propria tabella, con stato di sync separato per
+prefisso dei file; ``cot_metrics`` e ``market_catalog`` esistono solo per la
+Legacy. Senza ``--family`` vengono sincronizzate la Legacy e le famiglie con
+un dataset su disco, una dopo l'altra (DuckDB ammette un solo writer).
+
+Se i dati cambiano, a fine sync viene pubblicato uno snapshot read-only del
+database (``shared.cot_snapshot``) per ``serve.py``.
+
+Tempi per famiglia, metriche e snapshot e contatori (righe e file
+sincronizzati, file invariati) vengono registrati nel log dei run
+(``shared.run_metrics``, opzioni ``--run-log``/``--prometheus``/``--profile``).
+"""
+from __future__ import annotations
+
+import argparse
+import dataclasses
+import subprocess
 import sys
+import tempfile
+import time
 from pathlib import Path
+from typing import Iterable
+
 REPO_ROOT = Path(__file__).resolve().parents[2]
 if str(REPO_ROOT) not in sys.path:
     sys.path.append(str(REPO_ROOT))
@@ -10,87 +56,839 @@ if str(REPO_ROOT) not in sys.path:
 from shared.encoding_fix import setup_utf8_encoding
 setup_utf8_encoding()
 
-import pandas as pd
-import duckdb
-from shared.config import COT_PARQUET_DIR, COT_DUCKDB_PATH
+from shared.config import COT_DUCKDB_PATH, COT_SNAPSHOT_DIR
+from shared.cot_convert import (
+    conform_table,
+    dataset_files,
+    dataset_glob,
+    migrate_flat_files,
+    migrate_legacy_schema,
+)
+from shared.cot_families import FAMILIES, FAMILY_CHOICES, LEGACY, ReportFamily, resolve_families
+from shared.cot_manifest import sha256_file
+from shared.cot_schema import LEGACY_SCHEMA, MARKET_CODE, REPORT_DATE, ReportSchema
 from shared.encoding_utils import format_number_ascii
+from shared.market_catalog import CATALOG_TABLE, build_market_catalog
+from shared.cot_snapshot import current_snapshot, publish_snapshot
+from shared import run_metrics
+from shared.lazy_import import lazy_import
+
+pd = lazy_import("pandas")
+pa = lazy_import("pyarrow")
+pq = lazy_import("pyarrow.parquet")
+duckdb = lazy_import("duckdb")
+
+TABLE_NAME = LEGACY.table
+SYNC_STATE_TABLE = "cot_sync_state"
+METRICS_TABLE = "cot_metrics"
+KEY_COLUMNS = (REPORT_DATE, MARKET_CODE)
+ENGINES = ("duckdb", "pandas")
+MODES = ("table", "view")
+DERIVED_RELATIONS = (TABLE_NAME, METRICS_TABLE, CATALOG_TABLE)
+
+
+def _derived_relations(family: ReportFamily) -> tuple[str, ...]:
+    return DERIVED_RELATIONS if family.metrics else (family.table,)
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _sql_list(files: list[Path]) -> str:
+    return "[" + ", ".join("'" + str(f).replace("'", "''") + "'" for f in files) + "]"
+
+
+def build_projection(con: duckdb.DuckDBPyConnection, files: list[Path],
+                     schema: ReportSchema = LEGACY_SCHEMA) -> str:
+    """Genera la SELECT sui Parquet con i nomi e i tipi di ``schema``.
+
+    Sui file convertiti con lo schema canonico e' una semplice proiezione;
+    solo le colonne con intestazione CFTC o tipo diverso (file precedenti)
+    vengono rinominate e convertite. Le righe duplicate per chiave tengono
+    l'ultima occorrenza (ordine file/riga).
+    """
+    # hive_partitioning=false: la colonna ``year`` del percorso non entra nella tabella
+    source = f"read_parquet({_sql_list(files)}, union_by_name=true, hive_partitioning=false)"
+    described = con.execute(f"DESCRIBE SELECT * FROM {source}").fetchall()
+
+    select_list = []
+    for (col, col_type, *_), column in zip(described, schema.resolve_headers(row[0] for row in described)):
+        if column is None:
+            continue
+        expr = _quote(col)
+        if col_type != column.duckdb_type:
+            expr = f"TRY_CAST({expr} AS {column.duckdb_type})"
+        select_list.append(expr if expr == _quote(column.name) else f"{expr} AS {_quote(column.name)}")
+
+    return f"""
+        SELECT {", ".join(select_list)}
+        FROM read_parquet({_sql_list(files)}, union_by_name=true, hive_partitioning=false,
+                          filename=true, file_row_number=true)
+        WHERE report_date IS NOT NULL
+        QUALIFY ROW_NUMBER() OVER (
+            PARTITION BY {", ".join(KEY_COLUMNS)}
+            ORDER BY filename DESC, file_row_number DESC
+        ) = 1
+    """
+
+
+def load_parquet(path: Path, schema: ReportSchema = LEGACY_SCHEMA) -> pd.DataFrame:
+    """Carica un file Parquet con lo schema canonico, deduplicato per chiave."""
+    df = conform_table(pq.read_table(path), schema).to_pandas()
+    return df.drop_duplicates(subset=list(KEY_COLUMNS), keep="last")
+
+
+def stage_files(con: duckdb.DuckDBPyConnection, files: list[Path], table: str,
+                engine: str = "duckdb", temp: bool = False,
+                schema: ReportSchema = LEGACY_SCHEMA) -> int:
+    """Materializza in ``table`` le righe normalizzate dei file indicati."""
+    kind = "TEMP TABLE" if temp else "TABLE"
+    if engine == "duckdb":
+        con.execute(f"CREATE OR REPLACE {kind} {table} AS {build_projection(con, files, schema)}")
+    else:
+        df_all = pd.concat([load_parquet(f, schema) for f in files], ignore_index=True)
+        df_all = df_all.drop_duplicates(subset=list(KEY_COLUMNS), keep="last")
+        con.execute(f"CREATE OR REPLACE {kind} {table} AS SELECT * FROM df_all")
+    return con.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def _file_stats(con: duckdb.DuckDBPyConnection, path: Path,
+                schema: ReportSchema = LEGACY_SCHEMA) -> tuple[int, object]:
+    """Righe e intervallo di ``report_date`` di un file (legge solo le colonne chiave)."""
+    return con.execute(
+        f"SELECT COUNT(*), MIN(report_date), MAX(report_date) FROM ({build_projection(con, [path], schema)})"
+    ).fetchone()
+
+
+def _table_exists(con: duckdb.DuckDBPyConnection, name: str) -> bool:
+    return con.execute(
+        "SELECT COUNT(*) FROM information_schema.tables WHERE table_name = ?", [name]
+    ).fetchone()[0] > 0
+
+
+def _relation_type(con: duckdb.DuckDBPyConnection, name: str) -> str | None:
+    """``BASE TABLE``, ``VIEW`` oppure None se ``name`` non esiste."""
+    row = con.execute(
+        "SELECT table_type FROM information_schema.tables WHERE table_name = ?", [name]
+    ).fetchone()
+    return row[0] if row else None
 
-# Mapping colonne per normalizzazione
-LEGACY_COLUMN_MAP = {
-    "As of Date in Form YYYY-MM-DD": "report_date",
-    "CFTC Contract Market Code": "contract_market_code",
-    "Market and Exchange Names": "market_and_exchange",
-    "Noncommercial Positions-Long (All)": "noncommercial_long",
-    "Noncommercial Positions-Short (All)": "noncommercial_short",
-    "Change in Noncommercial-Long (All)": "noncommercial_long_change",
-    "Change in Noncommercial-Short (All)": "noncommercial_short_change",
-}
-
-def normalize_columns_if_needed(df: pd.DataFrame) -> pd.DataFrame:
-    """Normalizza le colonne se necessario (se non già normalizzate)."""
-    # Verifica se già normalizzato
-    if "report_date" in df.columns:
-        return df
-    
-    # Normalizza le colonne
-    df.columns = df.columns.str.strip()
-    rename_map = {}
-    for col in df.columns:
-        if col in LEGACY_COLUMN_MAP:
-            rename_map[col] = LEGACY_COLUMN_MAP[col]
-    
-    df = df.rename(columns=rename_map)
-    
-    # Converti report_date in datetime se presente
-    if "report_date" in df.columns:
-        df["report_date"] = pd.to_datetime(df["report_date"], format="%Y-%m-%d", errors="coerce")
-        df = df.dropna(subset=["report_date"])
-    
-    return df
-
-# Carica dinamicamente tutti i file Parquet disponibili
-parquet_files = sorted(COT_PARQUET_DIR.glob("legacy_futures_*.parquet"))
-
-if not parquet_files:
-    print("[ERROR] Nessun file Parquet trovato in", COT_PARQUET_DIR)
-    print("Esegui prima: python scripts/cot/update_cot_pipeline.py")
-    sys.exit(1)
-
-# Carica tutti i file disponibili
-dfs = []
-for parquet_file in parquet_files:
-    year = parquet_file.stem.split("_")[-1]
-    print(f"Loading {year}...")
+
+def _drop_relation(con: duckdb.DuckDBPyConnection, name: str) -> None:
+    kind = _relation_type(con, name)
+    if kind is not None:
+        con.execute(f"DROP {'VIEW' if kind == 'VIEW' else 'TABLE'} {name}")
+
+
+def current_mode(con: duckdb.DuckDBPyConnection, table: str = TABLE_NAME) -> str:
+    """Modo di una famiglia: ``view`` se ``table`` e' una vista, altrimenti ``table``."""
+    return "view" if _relation_type(con, table) == "VIEW" else "table"
+
+
+def _table_columns(con: duckdb.DuckDBPyConnection, name: str) -> list[str]:
+    return [row[0] for row in con.execute(f"DESCRIBE {name}").fetchall()]
+
+
+def _ensure_state_table(con: duckdb.DuckDBPyConnection) -> None:
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SYNC_STATE_TABLE} (
+            source_file VARCHAR PRIMARY KEY,
+            file_size BIGINT,
+            mtime_ns BIGINT,
+            content_hash VARCHAR,
+            row_count BIGINT,
+            max_report_date TIMESTAMP,
+            synced_at TIMESTAMP,
+            min_report_date TIMESTAMP
+        )
+    """)
+    # Database creati prima che lo stato registrasse l'intervallo completo
+    con.execute(f"ALTER TABLE {SYNC_STATE_TABLE} ADD COLUMN IF NOT EXISTS min_report_date TIMESTAMP")
+
+
+def _clear_state(con: duckdb.DuckDBPyConnection, family: ReportFamily) -> None:
+    """Rimuove lo stato di sync dei soli file della famiglia (prefisso ``{dataset}_``)."""
+    con.execute(f"DELETE FROM {SYNC_STATE_TABLE} WHERE starts_with(source_file, ?)",
+                [f"{family.dataset}_"])
+
+
+def _record_state(con: duckdb.DuckDBPyConnection, path: Path, digest: str,
+                  stats: tuple[int, object, object]) -> None:
+    stat = path.stat()
+    row_count, min_date, max_date = stats
+    con.execute(
+        f"""INSERT OR REPLACE INTO {SYNC_STATE_TABLE}
+            (source_file, file_size, mtime_ns, content_hash, row_count,
+             min_report_date, max_report_date, synced_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, now())""",
+        [path.name, stat.st_size, stat.st_mtime_ns, digest, row_count, min_date, max_date],
+    )
+
+
+def find_changed_files(con: duckdb.DuckDBPyConnection, files: list[Path]) -> list[tuple[Path, str]]:
+    """Restituisce i file nuovi o modificati rispetto a ``cot_sync_state``.
+
+    Size e mtime invariati bastano a considerare il file identico; altrimenti
+    si confronta l'hash del contenuto (un file riscritto uguale non viene
+    risincronizzato).
+    """
+    state = {
+        row[0]: row[1:]
+        for row in con.execute(
+            f"SELECT source_file, file_size, mtime_ns, content_hash FROM {SYNC_STATE_TABLE}"
+        ).fetchall()
+    }
+    changed = []
+    for path in files:
+        stat = path.stat()
+        previous = state.get(path.name)
+        if previous and previous[0] == stat.st_size and previous[1] == stat.st_mtime_ns:
+            continue
+        digest = sha256_file(path)
+        if previous and previous[2] == digest:
+            continue
+        changed.append((path, digest))
+    return changed
+
+
+def full_sync(con: duckdb.DuckDBPyConnection, files: list[Path], engine: str = "duckdb",
+              family: ReportFamily = LEGACY) -> int:
+    """Ricostruisce la tabella della famiglia da zero e la sostituisce in un'unica transazione."""
+    table = family.table
+    staging = f"{table}__staging"
+    loaded = []
+    for parquet_file in files:
+        year = parquet_file.stem.split("_")[-1]
+        print(f"Loading {year}...")
+        try:
+            stats = _file_stats(con, parquet_file, family.schema)
+            loaded.append((parquet_file, stats))
+            print(f"  -> {format_number_ascii(stats[0])} righe caricate")
+        except Exception as e:
+            print(f"  -> [ERROR] Impossibile caricare {parquet_file.name}: {e}")
+            run_metrics.event("load_failed", "error", file=parquet_file.name,
+                              error=f"{type(e).__name__}: {e}")
+
+    if not loaded:
+        print("[ERROR] Nessun file Parquet caricato correttamente")
+        return 0
+
+    # La nuova tabella viene costruita a parte: quella attuale resta
+    # interrogabile fino allo swap finale
+    total = stage_files(con, [path for path, _ in loaded], staging, engine, schema=family.schema)
+    date_min, date_max = con.execute(
+        f"SELECT MIN(report_date)::DATE, MAX(report_date)::DATE FROM {staging}"
+    ).fetchone()
+
+    run_metrics.count("synced_rows", total)
+    run_metrics.count("synced_files", len(loaded))
+    print(f"\nTOTAL: {format_number_ascii(total)} rows")
+    print(f"Date range: {date_min} - {date_max}")
+
+    con.execute("BEGIN TRANSACTION")
     try:
-        df = pd.read_parquet(parquet_file)
-        df = normalize_columns_if_needed(df)
-        dfs.append(df)
-        print(f"  -> {format_number_ascii(len(df))} righe caricate")
-    except Exception as e:
-        print(f"  -> [ERROR] Impossibile caricare {parquet_file.name}: {e}")
-
-if not dfs:
-    print("[ERROR] Nessun file Parquet caricato correttamente")
-    sys.exit(1)
-
-# Concatenate all
-df_all = pd.concat(dfs, ignore_index=True)
-
-print(f"\nTOTAL: {format_number_ascii(len(df_all))} rows")
-print(f"Date range: {df_all['report_date'].min().date()} - {df_all['report_date'].max().date()}")
-
-# Sync to DuckDB
-con = duckdb.connect(str(COT_DUCKDB_PATH))
-try:
-    con.execute("DROP TABLE IF EXISTS cot_disagg")
-    con.execute("CREATE TABLE cot_disagg AS SELECT * FROM df_all")
-    
-    count = con.execute("SELECT COUNT(*) FROM cot_disagg").fetchone()[0]
-    date_min, date_max = con.execute("SELECT MIN(report_date), MAX(report_date) FROM cot_disagg").fetchone()
-    
-    print(f"[OK] DuckDB sync: {format_number_ascii(count)} rows")
-    print(f"Date range in DB: {date_min.date()} - {date_max.date()}")
-finally:
-    con.close()
-
-print("[OK] Complete!")
+        con.execute(f"DROP TABLE IF EXISTS {table}")
+        con.execute(f"ALTER TABLE {staging} RENAME TO {table}")
+        _clear_state(con, family)
+        for parquet_file, stats in loaded:
+            _record_state(con, parquet_file, sha256_file(parquet_file), stats)
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    return total
+
+
+def upsert_file(con: duckdb.DuckDBPyConnection, path: Path, digest: str,
+                staged_table: str, columns: list[str], table: str = TABLE_NAME) -> tuple[int, object]:
+    """Applica a ``table`` solo le righe nuove/modificate/rimosse di un file.
+
+    Le righe del file vengono confrontate (EXCEPT) con quelle gia' presenti
+    nello stesso intervallo di date; il delta viene poi applicato con
+    DELETE + INSERT per chiave nella stessa transazione. Nella stessa
+    transazione vengono eliminate le chiavi che il file conteneva e non
+    contiene piu': quelle di ``table`` nell'intervallo di date della
+    versione precedente (da ``cot_sync_state``) o attuale del file, assenti
+    da ``staged_table``. Ritorna il numero di righe applicate o eliminate e
+    la loro ``report_date`` minima.
+    """
+    column_list = ", ".join(_quote(c) for c in columns)
+    key_list = ", ".join(KEY_COLUMNS)
+
+    stats = con.execute(
+        f"SELECT COUNT(*), MIN(report_date), MAX(report_date) FROM {staged_table}"
+    ).fetchone()
+    # LEAST/GREATEST ignorano i NULL: file senza stato o stato senza
+    # min_report_date (database precedenti) usano l'intervallo attuale
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE cot_removed AS
+        WITH previous AS (
+            SELECT min_report_date, max_report_date FROM {SYNC_STATE_TABLE} WHERE source_file = $file
+            UNION ALL SELECT NULL, NULL
+        ),
+        bounds AS (
+            SELECT LEAST(MIN(min_report_date), $low) AS low, GREATEST(MAX(max_report_date), $high) AS high
+            FROM previous
+        )
+        SELECT {key_list} FROM {table}, bounds
+        WHERE report_date BETWEEN bounds.low AND bounds.high
+          AND ({key_list}) NOT IN (SELECT ({key_list}) FROM {staged_table})
+    """, {"file": path.name, "low": stats[1], "high": stats[2]})
+
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE cot_delta AS
+        SELECT {column_list} FROM {staged_table}
+        EXCEPT
+        SELECT {column_list} FROM {table}
+        WHERE report_date >= (SELECT MIN(report_date) FROM {staged_table})
+          AND report_date <= (SELECT MAX(report_date) FROM {staged_table})
+    """)
+
+    delta, first_date = con.execute(
+        "SELECT COUNT(*), MIN(report_date) FROM ("
+        "SELECT report_date FROM cot_delta UNION ALL SELECT report_date FROM cot_removed)"
+    ).fetchone()
+    con.execute("BEGIN TRANSACTION")
+    try:
+        if delta:
+            con.execute(f"""
+                DELETE FROM {table}
+                WHERE ({key_list}) IN (SELECT ({key_list}) FROM cot_delta)
+                   OR ({key_list}) IN (SELECT ({key_list}) FROM cot_removed)
+            """)
+            con.execute(f"INSERT INTO {table} BY NAME SELECT * FROM cot_delta")
+        _record_state(con, path, digest, stats)
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    finally:
+        con.execute("DROP TABLE IF EXISTS cot_delta")
+        con.execute("DROP TABLE IF EXISTS cot_removed")
+    return delta, first_date
+
+
+def incremental_sync(con: duckdb.DuckDBPyConnection, files: list[Path],
+                     engine: str = "duckdb", family: ReportFamily = LEGACY) -> tuple[int, object] | None:
+    """Sincronizza solo i file cambiati.
+
+    Ritorna (righe applicate, prima ``report_date`` modificata) oppure None
+    se serve un full sync.
+    """
+    table = family.table
+    if not _table_exists(con, table):
+        print(f"[CHECK] Tabella {table} assente: ricostruzione completa")
+        return None
+    recorded = {row[0] for row in con.execute(
+        f"SELECT source_file FROM {SYNC_STATE_TABLE} WHERE starts_with(source_file, ?)",
+        [f"{family.dataset}_"],
+    ).fetchall()}
+    if not recorded:
+        print("[CHECK] Nessuno stato di sync registrato: ricostruzione completa")
+        return None
+    # Un file rimosso (es. anno scartato dalla validazione del backfill) lascerebbe
+    # le sue righe nella tabella: la ricostruzione le elimina insieme al suo stato
+    removed = sorted(recorded - {path.name for path in files})
+    if removed:
+        print(f"[CHECK] File non piu' nel dataset ({', '.join(removed)}): ricostruzione completa")
+        return None
+
+    changed = find_changed_files(con, files)
+    run_metrics.count("sync_cache_hits", len(files) - len(changed))
+    if not changed:
+        print("[OK] Nessun file Parquet modificato dall'ultimo sync")
+        return 0, None
+
+    columns = _table_columns(con, table)
+    total = 0
+    since = None
+    try:
+        for path, digest in changed:
+            year = path.stem.split("_")[-1]
+            stage_files(con, [path], "cot_staged", engine, temp=True, schema=family.schema)
+            if set(_table_columns(con, "cot_staged")) != set(columns):
+                print(f"[CHECK] Schema di {path.name} diverso da {table}: ricostruzione completa")
+                return None
+            delta, first_date = upsert_file(con, path, digest, "cot_staged", columns, table)
+            total += delta
+            run_metrics.count("synced_rows", delta)
+            run_metrics.count("synced_files")
+            if first_date is not None and (since is None or first_date < since):
+                since = first_date
+            print(f"Sync {year}: {format_number_ascii(delta)} righe nuove/modificate")
+    finally:
+        con.execute("DROP TABLE IF EXISTS cot_staged")
+    return total, since
+
+
+def metrics_query(since: bool = False) -> str:
+    """SELECT delle metriche per mercato/settimana calcolate con window function.
+
+    Stesse definizioni di ``normalize_legacy_cot._compute_metrics`` (COT Index
+    156w con 50 se max == min, z-score 52w con std di popolazione) piu' il
+    percentile rank della net position nelle ultime 156 settimane. Con
+    ``since`` (parametro ``?``) vengono prodotte solo le righe con
+    ``report_date >= ?``, leggendo per ogni mercato solo le 155 righe
+    precedenti necessarie alle finestre (media/std possono differire da un
+    ricalcolo completo nell'ultima cifra decimale, ~1e-16).
+    """
+    scope = "SELECT * FROM base"
+    if since:
+        scope = """
+            SELECT base.* FROM base
+            JOIN (
+                SELECT contract_market_code, MIN(rn) AS first_rn
+                FROM base WHERE report_date >= $since
+                GROUP BY contract_market_code
+            ) first_changed USING (contract_market_code)
+            WHERE base.rn >= first_changed.first_rn - 155
+        """
+    return f"""
+        WITH base AS (
+            SELECT
+                report_date, contract_market_code, market_and_exchange,
+                noncommercial_long, noncommercial_short,
+                noncommercial_long_change, noncommercial_short_change,
+                commercial_long, commercial_short, open_interest,
+                noncommercial_long - noncommercial_short AS noncommercial_net,
+                commercial_long - commercial_short AS commercial_net,
+                ROW_NUMBER() OVER (
+                    PARTITION BY contract_market_code ORDER BY report_date
+                ) AS rn
+            FROM {TABLE_NAME}
+        ),
+        scope AS ({scope}),
+        windowed AS (
+            SELECT
+                *,
+                MAX(noncommercial_net) OVER w156 AS max_156,
+                MIN(noncommercial_net) OVER w156 AS min_156,
+                COUNT(noncommercial_net) OVER w156 AS count_156,
+                LIST(noncommercial_net) OVER w156 AS values_156,
+                AVG(noncommercial_net) OVER w52 AS mean_52,
+                STDDEV_POP(noncommercial_net) OVER w52 AS std_52,
+                LAG(noncommercial_net) OVER w AS prev_net,
+                LAG(commercial_net) OVER w AS prev_commercial_net
+            FROM scope
+            WINDOW
+                w AS (PARTITION BY contract_market_code ORDER BY report_date),
+                w156 AS (PARTITION BY contract_market_code ORDER BY report_date
+                         ROWS BETWEEN 155 PRECEDING AND CURRENT ROW),
+                w52 AS (PARTITION BY contract_market_code ORDER BY report_date
+                        ROWS BETWEEN 51 PRECEDING AND CURRENT ROW)
+        )
+        SELECT
+            report_date,
+            contract_market_code,
+            market_and_exchange,
+            open_interest,
+            noncommercial_long,
+            noncommercial_short,
+            noncommercial_long_change,
+            noncommercial_short_change,
+            noncommercial_net,
+            noncommercial_long_change - noncommercial_short_change AS noncommercial_net_change,
+            noncommercial_net - prev_net AS noncommercial_net_change_wow,
+            commercial_long,
+            commercial_short,
+            commercial_net,
+            commercial_net - prev_commercial_net AS commercial_net_change_wow,
+            COALESCE(
+                100.0 * (noncommercial_net - min_156) / NULLIF(max_156 - min_156, 0), 50.0
+            ) AS noncommercial_cot_index_156w,
+            (noncommercial_net - mean_52) / NULLIF(std_52, 0) AS noncommercial_net_zscore_52w,
+            CASE WHEN noncommercial_net IS NOT NULL THEN
+                100.0 * len(list_filter(values_156, v -> v <= noncommercial_net)) / count_156
+            END AS noncommercial_net_pctrank_156w
+        FROM windowed
+        {"WHERE report_date >= $since" if since else ""}
+    """
+
+
+def refresh_metrics(con: duckdb.DuckDBPyConnection, since=None) -> int:
+    """Aggiorna ``cot_metrics``: completa, oppure solo dalle settimane ``>= since``."""
+    if since is None or not _table_exists(con, METRICS_TABLE):
+        con.execute(f"CREATE OR REPLACE TABLE {METRICS_TABLE} AS {metrics_query()}")
+        return con.execute(f"SELECT COUNT(*) FROM {METRICS_TABLE}").fetchone()[0]
+
+    con.execute("BEGIN TRANSACTION")
+    try:
+        con.execute(f"DELETE FROM {METRICS_TABLE} WHERE report_date >= ?", [since])
+        con.execute(
+            f"INSERT INTO {METRICS_TABLE} BY NAME {metrics_query(since=True)}", {"since": since}
+        )
+        refreshed = con.execute(
+            f"SELECT COUNT(*) FROM {METRICS_TABLE} WHERE report_date >= ?", [since]
+        ).fetchone()[0]
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    return refreshed
+
+
+def _view_definitions(con: duckdb.DuckDBPyConnection) -> dict[str, str]:
+    return dict(con.execute(
+        "SELECT view_name, sql FROM duckdb_views() WHERE NOT internal"
+    ).fetchall())
+
+
+def sync_views(con: duckdb.DuckDBPyConnection, dataset_dir: Path,
+               family: ReportFamily = LEGACY) -> bool:
+    """Definisce la tabella della famiglia (e per la Legacy ``cot_metrics`` e
+    ``market_catalog``) come viste.
+
+    La vista legge tutti i file ``year=*/`` con un glob, quindi anni e
+    settimane nuove non richiedono un nuovo sync. Ritorna True se le
+    definizioni sono cambiate (primo sync in modo view o schema cambiato).
+    """
+    before = _view_definitions(con)
+    relations = _derived_relations(family)
+    if current_mode(con, family.table) != "view":
+        for name in relations:
+            _drop_relation(con, name)
+        # Tornando al modo table il sync ripartira' da una ricostruzione completa
+        _clear_state(con, family)
+
+    source = [Path(dataset_dir).resolve() / dataset_glob(dataset_dir)]
+    con.execute(f"CREATE OR REPLACE VIEW {family.table} AS {build_projection(con, source, family.schema)}")
+    if family.metrics:
+        con.execute(f"CREATE OR REPLACE VIEW {METRICS_TABLE} AS {metrics_query()}")
+        markets = build_market_catalog(con, family.table, view=True,
+                                       source_glob=str(source[0]))
+    print(f"[OK] Viste {', '.join(relations)} su {dataset_dir}")
+    if family.metrics:
+        print(f"[OK] {CATALOG_TABLE}: {format_number_ascii(markets)} mercati")
+    return _view_definitions(con) != before
+
+
+def _default_families() -> list[ReportFamily]:
+    """Legacy sempre, le altre famiglie solo se hanno gia' un dataset su disco."""
+    return [family for family in FAMILIES.values()
+            if family is LEGACY or dataset_files(family.dataset_dir)]
+
+
+def sync_family(con: duckdb.DuckDBPyConnection, family: ReportFamily, full: bool = False,
+                engine: str = "duckdb", mode: str | None = None):
+    """Sincronizza il dataset di una famiglia nella sua tabella.
+
+    Ritorna le righe applicate (0 se nulla e' cambiato, None dopo una
+    ricostruzione o una ridefinizione delle viste) oppure False in caso di
+    errore.
+    """
+    dataset_dir = family.dataset_dir
+    # Layout precedente (un file per anno senza partizioni): migrato una volta
+    for migrated in migrate_flat_files(dataset_dir, schema=family.schema):
+        print(f"[MIGRATE] {migrated.parent.name}/{migrated.name}")
+    # File senza CSV locale scritti prima dello schema canonico
+    for migrated in migrate_legacy_schema(dataset_dir, schema=family.schema):
+        print(f"[MIGRATE] {migrated.parent.name}/{migrated.name}: schema canonico")
+
+    # Carica dinamicamente tutti i file Parquet disponibili
+    parquet_files = dataset_files(dataset_dir)
+
+    if not parquet_files:
+        print("[ERROR] Nessun file Parquet trovato in", dataset_dir)
+        print(f"Esegui prima: python scripts/cot/update_cot_pipeline.py --family {family.name}")
+        return False
+
+    mode = mode or current_mode(con, family.table)
+    if mode == "view":
+        delta = None if sync_views(con, dataset_dir, family) else 0
+    else:
+        if current_mode(con, family.table) == "view":
+            print("[CHECK] Passaggio dal modo view al modo table: ricostruzione completa")
+            for name in _derived_relations(family):
+                _drop_relation(con, name)
+        delta = sync_tables(con, parquet_files, full, engine, family)
+        if delta is False:
+            return False
+
+    count, date_min, date_max = con.execute(
+        f"SELECT COUNT(*), MIN(report_date)::DATE, MAX(report_date)::DATE FROM {family.table}"
+    ).fetchone()
+
+    print(f"[OK] DuckDB sync ({mode}) {family.table}: {format_number_ascii(count)} rows")
+    print(f"Date range in DB: {date_min} - {date_max}")
+    return delta
+
+
+def sync(full: bool = False, database: Path = COT_DUCKDB_PATH, engine: str = "duckdb",
+         snapshot: bool = True, mode: str | None = None, dataset_dir: Path | None = None,
+         families: list[ReportFamily] | None = None) -> int:
+    """Sincronizza i dataset ``{dataset}/year=*/`` delle famiglie in DuckDB.
+
+    ``mode`` None mantiene il modo (``table``/``view``) gia' in uso per ogni
+    famiglia. ``dataset_dir`` sostituisce il dataset di una singola famiglia
+    (default Legacy). Le famiglie vengono sincronizzate in sequenza sulla
+    stessa connessione: ognuna resta incrementale, quindi il costo dipende
+    solo dai file cambiati.
+    """
+    started = time.perf_counter()
+    if dataset_dir is not None:
+        families = families or [LEGACY]
+        if len(families) != 1:
+            raise ValueError("dataset_dir richiede una sola famiglia")
+        families = [dataclasses.replace(families[0], dataset_dir=Path(dataset_dir))]
+    families = families or _default_families()
+
+    con = duckdb.connect(str(database))
+    try:
+        _ensure_state_table(con)
+        changed = False
+        for family in families:
+            if len(families) > 1:
+                print(f"--- {family.label} ({family.name}) ---")
+            with run_metrics.stage(f"sync_{family.name}"):
+                delta = sync_family(con, family, full, engine, mode)
+            if delta is False:
+                return 1
+            changed = changed or delta != 0
+    finally:
+        con.close()
+
+    snapshot_dir = Path(database).parent / COT_SNAPSHOT_DIR.name
+    if snapshot and (changed or current_snapshot(snapshot_dir) is None):
+        with run_metrics.stage("snapshot"):
+            published = publish_snapshot(database, snapshot_dir)
+        print(f"[OK] Snapshot pubblicato: {published.name}")
+
+    elapsed = time.perf_counter() - started
+    peak = run_metrics.peak_rss_mb()
+    peak_str = f"{peak:.1f}MB" if peak is not None else "n/a"
+    print(f"[STATS] engine={engine} mode={mode or 'auto'} families={','.join(f.name for f in families)} "
+          f"time={elapsed:.2f}s peak_rss={peak_str}")
+    print("[OK] Complete!")
+    return 0
+
+
+def sync_tables(con: duckdb.DuckDBPyConnection, parquet_files: list[Path], full: bool = False,
+                engine: str = "duckdb", family: ReportFamily = LEGACY):
+    """Modo table: copia i Parquet nella tabella della famiglia e aggiorna le tabelle derivate.
+
+    Ritorna le righe applicate (None dopo una ricostruzione completa) oppure
+    False se nessun file e' stato caricato.
+    """
+    synced = None if full else incremental_sync(con, parquet_files, engine, family)
+    if synced is None:
+        if not full_sync(con, parquet_files, engine, family):
+            return False
+        delta, since = None, None
+    else:
+        delta, since = synced
+    refresh_derived(con, family, delta, since)
+    return delta
+
+
+def refresh_derived(con: duckdb.DuckDBPyConnection, family: ReportFamily, delta, since) -> None:
+    """Aggiorna ``cot_metrics`` e ``market_catalog`` (solo Legacy) dopo un sync.
+
+    ``delta`` None indica una ricostruzione completa, 0 nessuna modifica.
+    """
+    if not family.metrics:
+        return
+
+    with run_metrics.stage("metrics"):
+        if delta is None:
+            refreshed = refresh_metrics(con)
+        elif delta or not _table_exists(con, METRICS_TABLE):
+            refreshed = refresh_metrics(con, since)
+        else:
+            refreshed = 0
+    print(f"[OK] {METRICS_TABLE}: {format_number_ascii(refreshed)} righe ricalcolate")
+
+    if delta != 0 or not _table_exists(con, CATALOG_TABLE):
+        markets = build_market_catalog(con, family.table)
+        print(f"[OK] {CATALOG_TABLE}: {format_number_ascii(markets)} mercati")
+
+
+def append_table(con: duckdb.DuckDBPyConnection, family: ReportFamily, path: Path,
+                 table: pa.Table) -> tuple[int, object] | None:
+    """Applica alla tabella della famiglia un anno gia' in memoria (update ``--fused``).
+
+    Come ``incremental_sync`` per il solo file ``path`` appena scritto, ma lo
+    staging legge la tabella Arrow invece di rileggere il Parquet; lo stato
+    registrato e' quello di ``path``, quindi il sync successivo lo considera
+    invariato. Ritorna None se serve un sync normale (modo view, tabella o
+    stato assenti, schema diverso).
+    """
+    if current_mode(con, family.table) == "view" or not _table_exists(con, family.table):
+        return None
+    recorded = con.execute(
+        f"SELECT COUNT(*) FROM {SYNC_STATE_TABLE} WHERE starts_with(source_file, ?)",
+        [f"{family.dataset}_"],
+    ).fetchone()[0]
+    if recorded == 0:
+        return None
+
+    columns = _table_columns(con, family.table)
+    if set(table.column_names) != set(columns):
+        return None
+    # Stessa deduplica di build_projection: per chiave vince l'ultima riga
+    arrow_rows = table.append_column("__row", pa.array(range(table.num_rows), pa.int64()))
+    con.register("cot_arrow", arrow_rows)
+    try:
+        con.execute(f"""
+            CREATE OR REPLACE TEMP TABLE cot_staged AS
+            SELECT {", ".join(_quote(c) for c in table.column_names)} FROM cot_arrow
+            WHERE report_date IS NOT NULL
+            QUALIFY ROW_NUMBER() OVER (PARTITION BY {", ".join(KEY_COLUMNS)} ORDER BY __row DESC) = 1
+        """)
+        delta, first_date = upsert_file(con, path, sha256_file(path), "cot_staged", columns,
+                                        family.table)
+    finally:
+        con.unregister("cot_arrow")
+        con.execute("DROP TABLE IF EXISTS cot_staged")
+    run_metrics.count("synced_rows", delta)
+    run_metrics.count("synced_files")
+    return delta, first_date
+
+
+def sync_stream(years: Iterable[tuple[ReportFamily, Path, pa.Table]], database: Path = COT_DUCKDB_PATH,
+                engine: str = "duckdb", snapshot: bool = True) -> int:
+    """Carica in DuckDB gli anni prodotti da un generatore, uno alla volta.
+
+    Ogni elemento e' (famiglia, Parquet appena scritto, tabella Arrow dello
+    stesso anno): la tabella viene applicata e rilasciata prima di chiedere
+    l'anno successivo, quindi in memoria c'e' al piu' un anno. Le tabelle
+    derivate vengono aggiornate una volta per famiglia alla fine; le
+    famiglie che non ammettono l'append (vedi ``append_table``) passano dal
+    sync normale sul dataset.
+    """
+    con = duckdb.connect(str(database))
+    changed = {}
+    fallback = {}
+    try:
+        _ensure_state_table(con)
+        for family, path, table in years:
+            with run_metrics.stage(f"sync_{family.name}"):
+                result = None if family.name in fallback else append_table(con, family, path, table)
+            del table
+            if result is None:
+                fallback[family.name] = family
+                continue
+            delta, since = result
+            _, total, first = changed.get(family.name, (family, 0, None))
+            if since is not None and (first is None or since < first):
+                first = since
+            changed[family.name] = (family, total + delta, first)
+            print(f"[OK] {family.table}: {format_number_ascii(delta)} righe nuove/modificate da {path.name}")
+
+        for family, delta, since in changed.values():
+            if family.name not in fallback:
+                refresh_derived(con, family, delta, since)
+        for family in fallback.values():
+            print(f"[CHECK] {family.table}: append non applicabile, sync dal dataset")
+            with run_metrics.stage(f"sync_{family.name}"):
+                if sync_family(con, family, engine=engine) is False:
+                    return 1
+    finally:
+        con.close()
+
+    snapshot_dir = Path(database).parent / COT_SNAPSHOT_DIR.name
+    if snapshot and (fallback or any(delta for _, delta, _ in changed.values())
+                     or current_snapshot(snapshot_dir) is None):
+        with run_metrics.stage("snapshot"):
+            published = publish_snapshot(database, snapshot_dir)
+        print(f"[OK] Snapshot pubblicato: {published.name}")
+    return 0
+
+
+def compare_engines() -> int:
+    """Esegue un full sync per engine in processi separati e confronta tempi/memoria.
+
+    Ogni engine scrive su un database temporaneo, cosi' il picco RSS misurato
+    e' quello del singolo percorso e ``cot.db`` non viene toccato.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for engine in ENGINES:
+            database = Path(tmp) / f"compare_{engine}.db"
+            proc = subprocess.run(
+                [sys.executable, str(Path(__file__).resolve()), "--full", "--no-snapshot", "--no-run-log",
+                 "--mode", "table",
+                 "--engine", engine, "--database", str(database)],
+                capture_output=True, text=True, encoding="utf-8", errors="replace",
+            )
+            if proc.returncode != 0:
+                print(f"[ERROR] Engine {engine} fallito:\n{proc.stdout}{proc.stderr}")
+                return 1
+            stats_line = next(
+                (line for line in proc.stdout.splitlines() if line.startswith("[STATS]")), ""
+            )
+            results[engine] = dict(
+                item.split("=", 1) for item in stats_line.split()[1:]
+            )
+
+    print("=== Confronto engine (full sync) ===")
+    print(f"{'engine':<8} {'time':>10} {'peak_rss':>12}")
+    for engine, stats in results.items():
+        print(f"{engine:<8} {stats.get('time', 'n/a'):>10} {stats.get('peak_rss', 'n/a'):>12}")
+    return 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Sync COT Parquet files into DuckDB")
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Ricostruisce le tabelle da zero invece del sync incrementale",
+    )
+    parser.add_argument(
+        "--mode",
+        choices=MODES,
+        help="table: copia i dati in DuckDB; view: viste sul dataset Parquet, nessuna copia "
+             "(default: il modo gia' in uso, table per un database nuovo)",
+    )
+    parser.add_argument(
+        "--family",
+        action="append",
+        choices=FAMILY_CHOICES,
+        help="Famiglia da sincronizzare (ripetibile; 'all' = tutte). "
+             "Default: legacy e le famiglie con un dataset su disco",
+    )
+    parser.add_argument(
+        "--dataset-dir",
+        type=Path,
+        help="Dataset Parquet partizionato da sincronizzare (una sola famiglia, default legacy)",
+    )
+    parser.add_argument(
+        "--engine",
+        default="duckdb",
+        choices=ENGINES,
+        help="Solo modo table. duckdb: read_parquet nativo (default); pandas: percorso storico via DataFrame",
+    )
+    parser.add_argument(
+        "--database",
+        type=Path,
+        default=COT_DUCKDB_PATH,
+        help="Database DuckDB di destinazione",
+    )
+    parser.add_argument(
+        "--compare-engines",
+        action="store_true",
+        help="Confronta tempo e picco di memoria dei due engine (full sync su DB temporanei)",
+    )
+    parser.add_argument(
+        "--no-snapshot",
+        action="store_true",
+        help="Non pubblica lo snapshot read-only per serve.py",
+    )
+    run_metrics.add_arguments(parser, ("metrics", "snapshot", *(f"sync_{name}" for name in FAMILIES)))
+    args = parser.parse_args(argv)
+    families = resolve_families(args.family, default=())
+    if args.dataset_dir and len(families) > 1:
+        parser.error("--dataset-dir richiede una sola --family")
+    if args.compare_engines:
+        return compare_engines()
+    with run_metrics.from_args("sync", args) as metrics:
+        code = sync(full=args.full, database=args.database, engine=args.engine,
+                    snapshot=not args.no_snapshot, mode=args.mode, dataset_dir=args.dataset_dir,
+                    families=families or None)
+        metrics.failed = code != 0
+    return code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
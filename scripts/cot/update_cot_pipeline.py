@@ -5,14 +5,32 @@ Orchestratore intelligente che:
 2. Scarica solo se necessario (idempotent)
 3. Converte CSV->Parquet solo se necessario
 4. Aggiorna DuckDB se ci sono nuovi dati
+
+Con ``--fused`` i passi 2-4 diventano un'unica passata per anno: il file
+dell'archivio viene letto in streaming direttamente in Arrow, scritto nella
+partizione Parquet e applicato a DuckDB nello stesso processo, senza CSV
+intermedio (``--keep-raw`` conserva comunque il file originale).
+
+Ogni stadio (probe, download, convert, backfill) viene cronometrato e i
+contatori (byte scaricati, cache hit HTTP e manifest, righe convertite,
+errori) finiscono nel log JSON-lines dei run (``shared.run_metrics``);
+``--prometheus`` li scrive anche in un textfile e ``--profile STAGE``
+esegue uno stadio sotto cProfile/tracemalloc.
 """
 
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 
+import argparse
+import hashlib
+import os
+import shutil
 import sys
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from datetime import datetime
+from typing import Iterator
 
 if __package__ is None or __package__ == "":
     REPO_ROOT = Path(__file__).resolve().parents[2]
@@ -23,173 +41,591 @@ if __package__ is None or __package__ == "":
 from shared.encoding_fix import setup_utf8_encoding
 setup_utf8_encoding()
 
-from shared.config import COT_CSV_DIR, COT_PARQUET_DIR, ensure_directories
+from shared.config import COT_DUCKDB_PATH, ensure_directories
+from shared.cot_convert import (
+    csv_to_dataset,
+    dataset_files,
+    partition_path,
+    read_report_csv,
+    table_to_dataset,
+)
+from shared.cot_families import FAMILIES, FAMILY_CHOICES, LEGACY, ReportFamily, resolve_families
+from shared.cot_fetch import (
+    ProbeResult,
+    archive_name,
+    fetch_year_archive,
+    open_archive_member,
+    probe_year_archive,
+    read_archive,
+    remember_validators,
+)
+from shared.cot_manifest import (
+    latest_parquet_date,
+    latest_report_date,
+    load_manifest,
+    needs_conversion,
+    parquet_stats,
+    record_csv,
+    record_parquet,
+    save_manifest,
+)
+from shared.cot_schema import REPORT_DATE, report_date_header
+from shared import run_metrics
 from shared.encoding_utils import format_number_ascii
-import pandas as pd
-import duckdb
+from shared.lazy_import import lazy_import
 
-try:
-    import cot_reports as cot
-    COT_LIB_AVAILABLE = True
-except ImportError:
-    COT_LIB_AVAILABLE = False
+pd = lazy_import("pandas")
+pa = lazy_import("pyarrow")
+pc = lazy_import("pyarrow.compute")
+pq = lazy_import("pyarrow.parquet")
 
+DEFAULT_BACKFILL_WORKERS = 4
+STAGES = ("probe", "download", "convert", "backfill")
 
-def get_latest_available_date() -> str | None:
-    """Trova ultima data disponibile online usando cot_reports."""
-    if not COT_LIB_AVAILABLE:
-        return None
-    
-    try:
-        current_year = datetime.now().year
-        # Prova anno corrente
-        for year in [current_year, current_year - 1]:
-            try:
-                df = cot.cot_year(year=year, cot_report_type='legacy_fut')
-                if len(df) > 0 and 'As of Date in Form YYYY-MM-DD' in df.columns:
-                    max_date = df['As of Date in Form YYYY-MM-DD'].max()
-                    return str(max_date) if pd.notna(max_date) else None
-            except:
-                continue
-        return None
-    except Exception:
-        return None
 
+def probe_latest_archive(url_template: str = LEGACY.archive_template) -> ProbeResult | None:
+    """Verifica con una richiesta condizionale se l'archivio piu recente e' cambiato.
 
-def get_latest_downloaded_date() -> str | None:
-    """Trova ultima data nei file CSV scaricati."""
-    ensure_directories()
-    csv_files = sorted(COT_CSV_DIR.glob("cot_legacy_*.txt"))
-    
-    if not csv_files:
-        return None
-    
-    latest_date = None
-    for csv_file in csv_files:
+    Prova l'anno corrente e, se non ancora pubblicato (404), il precedente.
+    """
+    current_year = datetime.now().year
+    for year in [current_year, current_year - 1]:
         try:
-            # Leggi solo prima riga per date
-            df_sample = pd.read_csv(csv_file, sep="\t", nrows=1)
-            if 'As of Date in Form YYYY-MM-DD' in df_sample.columns:
-                # Leggi tutte le date
-                df = pd.read_csv(csv_file, sep="\t", usecols=['As of Date in Form YYYY-MM-DD'])
-                max_date = df['As of Date in Form YYYY-MM-DD'].max()
-                if pd.notna(max_date):
-                    if latest_date is None or max_date > latest_date:
-                        latest_date = max_date
-        except:
-            continue
-    
-    return str(latest_date) if latest_date else None
+            return probe_year_archive(year, url_template=url_template)
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                continue
+            print(f"[WARN] Verifica archivio {year} fallita: {e}")
+            run_metrics.event("probe_failed", "error", year=year, url_template=url_template, error=str(e))
+            return None
+        except Exception as e:
+            print(f"[WARN] Verifica archivio {year} fallita: {e}")
+            run_metrics.event("probe_failed", "error", year=year, url_template=url_template,
+                              error=f"{type(e).__name__}: {e}")
+            return None
+    return None
+
 
+def _report_dates(df: pd.DataFrame) -> pd.Series:
+    date_column = report_date_header(df.columns)
+    if date_column is None:
+        return pd.Series(dtype=str)
+    return df[date_column].replace("", pd.NA).dropna()
 
-def download_latest_year() -> Path | None:
-    """Scarica dati anno corrente se non gia presente."""
-    if not COT_LIB_AVAILABLE:
-        print("[SKIP] Libreria cot_reports non disponibile")
+
+def _max_report_date(df: pd.DataFrame) -> str | None:
+    dates = _report_dates(df)
+    return str(dates.max()) if len(dates) else None
+
+
+def get_latest_available_date(probe: ProbeResult | None, frame: pd.DataFrame | None) -> str | None:
+    """Ultima data disponibile online.
+
+    Con archivio invariato (304) e' l'ultima data registrata nella cache dei
+    validatori; altrimenti viene letta dall'archivio appena ricevuto.
+    """
+    if frame is not None:
+        return _max_report_date(frame)
+    return probe.cached_max_date if probe else None
+
+
+def get_latest_downloaded_date(manifest: dict, family: ReportFamily = LEGACY) -> str | None:
+    """Trova ultima data nei file scaricati (dal manifest, senza rileggere i file).
+
+    Oltre ai CSV considera i Parquet del dataset: gli anni aggiornati con
+    ``--fused`` non hanno un CSV.
+    """
+    csv_files = family.csv_files()
+    parquet_files = dataset_files(family.dataset_dir)
+    if not csv_files and not parquet_files:
         return None
-    
-    current_year = datetime.now().year
-    csv_path = COT_CSV_DIR / f"cot_legacy_{current_year}.txt"
-    
-    if csv_path.exists():
-        print(f"[CHECK] File {csv_path.name} gia presente")
-        return csv_path
-    
     try:
-        print(f"[DOWNLOAD] Scaricando dati {current_year}...")
-        df = cot.cot_year(year=current_year, cot_report_type='legacy_fut')
-        
+        dates = [latest_report_date(manifest, csv_files), latest_parquet_date(manifest, parquet_files)]
+        return max((date for date in dates if date), default=None)
+    except Exception as e:
+        print(f"[WARN] Lettura date dai CSV fallita: {e}")
+        run_metrics.event("latest_downloaded_date_failed", "warning", family=family.name,
+                          error=f"{type(e).__name__}: {e}")
+        return None
+
+
+def download_latest_year(probe: ProbeResult, manifest: dict, frame: pd.DataFrame | None = None,
+                         family: ReportFamily = LEGACY, url_template: str | None = None) -> Path | None:
+    """Salva l'archivio dell'anno verificato, riusando il payload del probe."""
+    csv_path, _ = _year_paths(probe.year, family)
+
+    try:
+        if frame is None:
+            # Archivio invariato (304) ma CSV locale mancante: serve il download
+            print(f"[DOWNLOAD] Scaricando dati {probe.year}...")
+            frame = read_archive(fetch_year_archive(
+                probe.year, url_template=url_template or family.archive_template
+            ))
+        else:
+            print(f"[DOWNLOAD] Dati {probe.year} ricevuti dalla verifica (nessun secondo download)")
+
         ensure_directories()
-        csv_path.parent.mkdir(parents=True, exist_ok=True)
-        df.to_csv(csv_path, index=False, sep="\t")
-        
-        date_range = df['As of Date in Form YYYY-MM-DD'].min() if 'As of Date in Form YYYY-MM-DD' in df.columns else "N/A"
-        print(f"[OK] Scaricati {format_number_ascii(len(df))} righe, data range: {date_range}")
+        tmp_path = csv_path.with_name(csv_path.name + ".tmp")
+        try:
+            frame.to_csv(tmp_path, index=False, sep="\t")
+            os.replace(tmp_path, csv_path)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+
+        # Il manifest registra il nuovo hash: il Parquet dell'anno risultera'
+        # obsoleto e verra' riconvertito
+        max_date = _max_report_date(frame)
+        min_date = str(_report_dates(frame).min()) if max_date else None
+        record_csv(manifest, csv_path, len(frame), min_date, max_date)
+
+        remember_validators(probe, max_date)
+        run_metrics.count("downloaded_rows", len(frame))
+        print(f"[OK] Scaricati {format_number_ascii(len(frame))} righe, ultima data: {max_date or 'N/A'}")
         return csv_path
     except Exception as e:
         print(f"[ERROR] Download fallito: {e}")
+        run_metrics.event("download_failed", "error", year=probe.year, family=family.name,
+                          error=f"{type(e).__name__}: {e}")
         return None
 
 
-def check_and_convert_parquet() -> tuple[int, int]:
-    """Controlla e converte CSV->Parquet solo se necessario."""
+def update_family(family: ReportFamily, probe: ProbeResult | None, manifest: dict,
+                  url_template: str | None = None) -> Path | None:
+    """Confronta date online/locali di una famiglia e scarica l'anno se serve."""
+    print(f"--- {family.label} ({family.name}) ---")
+    frame = read_archive(probe.payload) if probe and probe.modified else None
+
+    latest_online = get_latest_available_date(probe, frame)
+    latest_downloaded = get_latest_downloaded_date(manifest, family)
+
+    print(f"Ultima data online: {latest_online or 'N/A'}")
+    print(f"Ultima data scaricata: {latest_downloaded or 'Nessuna'}")
+
+    if probe is None:
+        print("[ERROR] Impossibile verificare gli archivi CFTC")
+        run_metrics.event("archive_unavailable", "error", family=family.name)
+    elif not probe.modified and _year_paths(probe.year, family)[0].exists():
+        print(f"[OK] Archivio {probe.year} invariato (HTTP 304): gia scaricati i piu recenti COT report")
+    elif latest_online and latest_downloaded and latest_online <= latest_downloaded:
+        print("[OK] Gia scaricati i piu recenti COT report")
+        remember_validators(probe, latest_online)
+    else:
+        return download_latest_year(probe, manifest, frame, family, url_template)
+    return None
+
+
+def _read_archive_table(payload: bytes, family: ReportFamily, raw_path: Path | None) -> pa.Table:
+    """Tabella Arrow tipizzata del report nello zip, senza passare da pandas.
+
+    Con ``raw_path`` il file originale viene prima estratto li' (atomico) e
+    letto da disco; altrimenti viene letto in streaming dal membro dello zip.
+    """
+    if raw_path is None:
+        with open_archive_member(payload) as f:
+            return read_report_csv(f, schema=family.schema)
+    tmp_path = raw_path.with_name(raw_path.name + ".tmp")
+    try:
+        with open_archive_member(payload) as src, open(tmp_path, "wb") as dst:
+            shutil.copyfileobj(src, dst, 1 << 20)
+        os.replace(tmp_path, raw_path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+    return read_report_csv(raw_path, schema=family.schema)
+
+
+def _table_dates(table: pa.Table) -> tuple[str | None, str | None]:
+    dates = table.column(REPORT_DATE)
+    if dates.null_count == len(dates):
+        return None, None
+    bounds = pc.min_max(dates).as_py()
+    return bounds["min"].isoformat(), bounds["max"].isoformat()
+
+
+def fused_year(family: ReportFamily, probe: ProbeResult | None, manifest: dict,
+               url_template: str | None = None,
+               keep_raw: bool = False) -> tuple[Path, pa.Table] | None:
+    """Variante di ``update_family`` senza CSV intermedio.
+
+    L'archivio viene letto in Arrow, scritto nella partizione dell'anno e
+    registrato nel manifest con l'archivio come sorgente. Ritorna
+    (Parquet, tabella) da applicare a DuckDB, oppure None se non c'e' nulla
+    di nuovo.
+    """
+    print(f"--- {family.label} ({family.name}) ---")
+    if probe is None:
+        print("[ERROR] Impossibile verificare gli archivi CFTC")
+        run_metrics.event("archive_unavailable", "error", family=family.name)
+        return None
+
+    csv_path, parquet_path = _year_paths(probe.year, family)
+    if not probe.modified and parquet_path.exists():
+        print(f"[OK] Archivio {probe.year} invariato (HTTP 304): gia scaricati i piu recenti COT report")
+        return None
+
+    template = url_template or family.archive_template
+    # Prima di estrarre il file originale (--keep-raw), che sostituisce il CSV dell'anno
+    latest_downloaded = get_latest_downloaded_date(manifest, family)
+    try:
+        with run_metrics.stage("download"):
+            payload = probe.payload
+            if payload is None:
+                # Archivio invariato (304) ma partizione mancante: serve il download
+                print(f"[DOWNLOAD] Scaricando dati {probe.year}...")
+                payload = fetch_year_archive(probe.year, url_template=template)
+            table = _read_archive_table(payload, family, csv_path if keep_raw else None)
+        min_date, max_date = _table_dates(table)
+        run_metrics.count("downloaded_rows", table.num_rows)
+
+        print(f"Ultima data online: {max_date or 'N/A'}")
+        print(f"Ultima data scaricata: {latest_downloaded or 'Nessuna'}")
+        if parquet_path.exists() and max_date and latest_downloaded and max_date <= latest_downloaded:
+            print("[OK] Gia scaricati i piu recenti COT report")
+            remember_validators(probe, max_date)
+            return None
+
+        with run_metrics.stage("convert"):
+            table_to_dataset(table, family.dataset_dir, probe.year, schema=family.schema)
+    except Exception as e:
+        print(f"[ERROR] Aggiornamento {family.name} {probe.year} fallito: {e}")
+        run_metrics.event("download_failed", "error", year=probe.year, family=family.name,
+                          error=f"{type(e).__name__}: {e}")
+        return None
+
+    if keep_raw:
+        record_csv(manifest, csv_path, table.num_rows, min_date, max_date)
+        record_parquet(manifest, parquet_path, csv_path)
+    else:
+        # Un CSV rimasto da un update precedente risulterebbe piu' recente
+        # della partizione e la farebbe riconvertire con i dati vecchi
+        if csv_path.exists():
+            csv_path.unlink()
+        manifest["csv"].pop(csv_path.name, None)
+        record_parquet(manifest, parquet_path, source_name=archive_name(probe.year, template),
+                       source_sha256=hashlib.sha256(payload).hexdigest())
+    remember_validators(probe, max_date)
+    print(f"[OK] {family.name} {probe.year}: {format_number_ascii(table.num_rows)} righe -> "
+          f"{parquet_path.parent.name}/{parquet_path.name}, ultima data: {max_date or 'N/A'}")
+    return parquet_path, table
+
+
+def fused_years(families: list[ReportFamily], probes: list[ProbeResult | None], templates: list[str],
+                manifest: dict, keep_raw: bool = False) -> Iterator[tuple[ReportFamily, Path, pa.Table]]:
+    """Generatore (famiglia, Parquet, tabella) per ``sync_complete.sync_stream``.
+
+    Un anno alla volta: l'anno successivo viene letto solo dopo che il
+    consumatore ha applicato e rilasciato il precedente. Il manifest viene
+    salvato dopo ogni anno scritto.
+    """
+    for family, probe, template in zip(families, probes, templates):
+        result = fused_year(family, probe, manifest, template, keep_raw)
+        print()
+        if result is None:
+            continue
+        save_manifest(manifest)
+        parquet_path, table = result
+        del result
+        yield family, parquet_path, table
+
+
+def check_and_convert_parquet(families: list[ReportFamily] | None = None,
+                              workers: int = DEFAULT_BACKFILL_WORKERS) -> tuple[int, int]:
+    """Controlla e converte CSV->Parquet solo se necessario.
+
+    Un Parquet viene rigenerato se manca o se il manifest indica che e' stato
+    prodotto da una versione diversa del CSV (es. anno riscaricato). Le
+    conversioni di tutte le famiglie e gli anni girano in parallelo su
+    ``workers`` thread (lettura CSV e scrittura Parquet di pyarrow rilasciano
+    il GIL); il manifest viene letto e aggiornato solo da questo thread.
+    """
     ensure_directories()
-    
-    csv_files = sorted(COT_CSV_DIR.glob("cot_legacy_*.txt"))
-    converted = 0
+    manifest = load_manifest()
+    pending = []
     skipped = 0
-    
-    for csv_file in csv_files:
-        year = csv_file.stem.split("_")[-1]
-        parquet_name = f"legacy_futures_{year}.parquet"
-        parquet_path = COT_PARQUET_DIR / parquet_name
-        
-        if parquet_path.exists():
-            skipped += 1
-            continue
-        
-        try:
-            print(f"[CONVERT] {csv_file.name} -> {parquet_name}")
-            df = pd.read_csv(csv_file, sep="\t")
-            
-            # Ottimizza date
-            date_cols = [c for c in df.columns if 'Date' in c and 'YYYY-MM-DD' in c]
-            for col in date_cols:
-                df[col] = pd.to_datetime(df[col], format="%Y-%m-%d", errors="coerce")
-            
-            df.columns = df.columns.str.strip()
-            df = df.loc[:, ~df.columns.duplicated()]
-            
-            parquet_path.parent.mkdir(parents=True, exist_ok=True)
-            df.to_parquet(parquet_path, index=False)
+
+    for family in families or [LEGACY]:
+        for csv_file in family.csv_files():
+            year = csv_file.stem.split("_")[-1]
+            if needs_conversion(manifest, csv_file, partition_path(family.dataset_dir, year)):
+                pending.append((family, year))
+            else:
+                skipped += 1
+    run_metrics.count("manifest_cache_hits", skipped)
+
+    converted = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {}
+        for family, year in pending:
+            csv_file, parquet_path = _year_paths(year, family)
+            print(f"[CONVERT] {csv_file.name} -> {parquet_path.parent.name}/{parquet_path.name}")
+            futures[pool.submit(csv_to_dataset, csv_file, family.dataset_dir, year,
+                                schema=family.schema)] = (family, year)
+        for future in as_completed(futures):
+            family, year = futures[future]
+            csv_file, parquet_path = _year_paths(year, family)
+            try:
+                rows = future.result()
+            except Exception as e:
+                print(f"[ERROR] Conversione {csv_file.name} fallita: {e}")
+                run_metrics.event("convert_failed", "error", file=csv_file.name,
+                                  error=f"{type(e).__name__}: {e}")
+                continue
+            record_parquet(manifest, parquet_path, csv_file)
             converted += 1
-            print(f"[OK] Convertito {format_number_ascii(len(df))} righe")
-        except Exception as e:
-            print(f"[ERROR] Conversione {csv_file.name} fallita: {e}")
-    
+            print(f"[OK] Convertito {csv_file.name}: {format_number_ascii(rows)} righe")
+
+    save_manifest(manifest)
     return converted, skipped
 
 
-def main():
+def _year_paths(year: int | str, family: ReportFamily = LEGACY) -> tuple[Path, Path]:
+    return family.csv_path(year), partition_path(family.dataset_dir, year)
+
+
+def validate_year_parquet(parquet_path: Path, year: int) -> int:
+    """Verifica che il Parquet annuale sia leggibile e coerente con l'anno.
+
+    Ritorna il numero di righe; solleva ValueError se il file e' vuoto, non
+    ha la colonna data o contiene date fuori dall'anno atteso.
+    """
+    table = pq.read_table(parquet_path, columns=[REPORT_DATE])
+    if table.num_rows == 0:
+        raise ValueError(f"{parquet_path.name}: nessuna riga")
+    dates = table.column(REPORT_DATE).to_pandas()
+    years = pd.to_datetime(dates).dt.year.dropna().unique()
+    if len(years) == 0 or any(int(y) != year for y in years):
+        raise ValueError(f"{parquet_path.name}: date fuori dall'anno {year} ({sorted(years)})")
+    return table.num_rows
+
+
+def backfill_year(year: int, source_dir: Path | None = None, force: bool = False,
+                  family: ReportFamily = LEGACY) -> int:
+    """Scarica, converte e valida un singolo anno. Ritorna le righe convertite.
+
+    Ogni file viene scritto su un .tmp e rinominato solo a scrittura
+    completata, quindi un'interruzione non lascia mai file parziali; un CSV
+    gia' scaricato viene solo convertito. Se la validazione fallisce vengono
+    rimossi il Parquet e il CSV scaricato in questa chiamata, cosi' il
+    resume riparte dall'archivio.
+    """
+    csv_path, parquet_path = _year_paths(year, family)
+
+    fetched = not csv_path.exists() or force
+    if fetched:
+        df = read_archive(fetch_year_archive(year, source_dir, url_template=family.archive_template))
+        tmp_path = csv_path.with_name(csv_path.name + ".tmp")
+        try:
+            df.to_csv(tmp_path, index=False, sep="\t")
+            os.replace(tmp_path, csv_path)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+
+    csv_to_dataset(csv_path, family.dataset_dir, year, schema=family.schema)
+    try:
+        return validate_year_parquet(parquet_path, year)
+    except Exception:
+        # Non lasciare un anno invalido che il resume considererebbe completo
+        parquet_path.unlink()
+        if fetched:
+            csv_path.unlink()
+        raise
+
+
+def backfill(from_year: int, to_year: int, workers: int = DEFAULT_BACKFILL_WORKERS,
+             source_dir: Path | None = None, force: bool = False,
+             families: list[ReportFamily] | None = None) -> int:
+    """Backfill storico parallelo degli anni ``from_year..to_year`` inclusi.
+
+    Con piu' famiglie tutte le coppie (famiglia, anno) condividono lo stesso
+    pool di ``workers`` thread.
+    """
+    ensure_directories()
+    families = families or [LEGACY]
+    years = list(range(min(from_year, to_year), max(from_year, to_year) + 1))
+    print(f"[BACKFILL] Anni {years[0]}-{years[-1]} con {workers} worker "
+          f"({', '.join(family.name for family in families)})")
+    if source_dir is not None:
+        print(f"[BACKFILL] Sorgente locale: {source_dir}")
+
+    # Il manifest viene letto e aggiornato solo da questo thread
+    manifest = load_manifest()
+    pending = []
+    for family in families:
+        for year in years:
+            csv_path, parquet_path = _year_paths(year, family)
+            done = parquet_path.exists() and (
+                not csv_path.exists() or not needs_conversion(manifest, csv_path, parquet_path)
+            )
+            if done and not force:
+                entry = manifest["parquet"].get(parquet_path.name)
+                rows = entry["rows"] if entry else parquet_stats(parquet_path)[0]
+                print(f"[CHECK] {family.name} {year}: gia presente ({format_number_ascii(rows)} righe)")
+                run_metrics.count("manifest_cache_hits")
+            else:
+                pending.append((family, year))
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {
+            pool.submit(backfill_year, year, source_dir, force, family): (family, year)
+            for family, year in pending
+        }
+        for future in as_completed(futures):
+            family, year = futures[future]
+            try:
+                rows = future.result()
+            except Exception as e:
+                failed.append((family.name, year))
+                print(f"[ERROR] {family.name} {year}: {e}")
+                run_metrics.event("backfill_failed", "error", family=family.name, year=year,
+                                  error=f"{type(e).__name__}: {e}")
+                continue
+            csv_path, parquet_path = _year_paths(year, family)
+            record_parquet(manifest, parquet_path, csv_path)
+            save_manifest(manifest)
+            print(f"[OK] {family.name} {year}: {format_number_ascii(rows)} righe")
+
+    total = len(years) * len(families)
+    print(f"\n[SUMMARY] Backfill: {total - len(failed)}/{total} anni completati")
+    if failed:
+        print(f"[ERROR] Anni falliti (rilancia per riprendere): {sorted(failed)}")
+        return 1
+    return 0
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Download, convert and sync CFTC COT reports")
+    parser.add_argument(
+        "--backfill",
+        nargs=2,
+        type=int,
+        metavar=("FROM_YEAR", "TO_YEAR"),
+        help="Scarica e converte in parallelo tutti gli anni dell'intervallo (riprende dagli anni mancanti)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_BACKFILL_WORKERS,
+        help="Numero massimo di anni elaborati in parallelo (backfill e conversione)",
+    )
+    parser.add_argument(
+        "--family",
+        action="append",
+        choices=FAMILY_CHOICES,
+        help="Famiglia di report (ripetibile; 'all' = legacy, combined, disaggregated, tff). Default: legacy",
+    )
+    parser.add_argument(
+        "--source-dir",
+        type=Path,
+        help="Directory locale con gli archivi annuali (es. deacot{year}.zip) da usare al posto della CFTC",
+    )
+    parser.add_argument(
+        "--archive-url",
+        help="Template URL degli archivi annuali ({year}) per una sola famiglia; utile per mirror "
+             "o server di test locali",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Riscarica e riconverte anche gli anni gia presenti",
+    )
+    parser.add_argument(
+        "--fused",
+        action="store_true",
+        help="Archivio -> Parquet -> DuckDB in un'unica passata per anno, senza CSV intermedio",
+    )
+    parser.add_argument(
+        "--keep-raw",
+        action="store_true",
+        help="Con --fused conserva anche il file originale dell'archivio in data/cot/csv",
+    )
+    parser.add_argument(
+        "--database",
+        type=Path,
+        default=COT_DUCKDB_PATH,
+        help="Database DuckDB aggiornato da --fused (default %(default)s)",
+    )
+    # Con --fused girano anche gli stadi di sync_complete.sync_stream
+    run_metrics.add_arguments(parser, STAGES + tuple(f"sync_{name}" for name in FAMILIES)
+                              + ("metrics", "snapshot"))
+    args = parser.parse_args(argv)
+    args.families = resolve_families(args.family)
+    if args.archive_url and len(args.families) > 1:
+        parser.error("--archive-url richiede una sola --family")
+    if args.fused and args.backfill:
+        parser.error("--fused non si combina con --backfill")
+    if args.keep_raw and not args.fused:
+        parser.error("--keep-raw richiede --fused")
+    return args
+
+
+def main(argv: list[str] | None = None):
     """Pipeline principale."""
+    args = parse_args(argv)
     print("=== COT UPDATE PIPELINE ===\n")
-    
-    # Step 1: Verifica disponibilita
-    if not COT_LIB_AVAILABLE:
-        print("[ERROR] Libreria cot_reports non installata")
-        print("Installa con: pip install cot-reports")
-        return 1
-    
-    # Step 2: Controlla date
-    latest_online = get_latest_available_date()
-    latest_downloaded = get_latest_downloaded_date()
-    
-    print(f"Ultima data online: {latest_online or 'N/A'}")
-    print(f"Ultima data scaricata: {latest_downloaded or 'Nessuna'}\n")
-    
-    # Step 3: Download
-    if latest_online and latest_downloaded:
-        if latest_online <= latest_downloaded:
-            print("[OK] Gia scaricati i piu recenti COT report")
-            downloaded = None
-        else:
-            downloaded = download_latest_year()
-    else:
-        downloaded = download_latest_year()
-    
+
+    with run_metrics.from_args("update", args) as metrics:
+        code = run(args)
+        metrics.failed = code != 0
+    return code
+
+
+def run(args: argparse.Namespace) -> int:
+    if args.backfill:
+        with run_metrics.stage("backfill"):
+            return backfill(*args.backfill, workers=args.workers, source_dir=args.source_dir,
+                            force=args.force, families=args.families)
+
+    # Step 1: Verifica con richiesta condizionale (304 = nessun dato nuovo),
+    # in parallelo per tutte le famiglie
+    templates = [args.archive_url or family.archive_template for family in args.families]
+    with run_metrics.stage("probe"), ThreadPoolExecutor(max_workers=len(args.families)) as pool:
+        probes = list(pool.map(probe_latest_archive, templates))
+
+    ensure_directories()
+    if args.fused:
+        return run_fused(args, probes, templates)
+
+    # Step 2-3: Controllo date e download (riusa il payload della verifica)
+    with run_metrics.stage("download"):
+        manifest = load_manifest()
+        for family, probe, template in zip(args.families, probes, templates):
+            update_family(family, probe, manifest, template)
+            print()
+        save_manifest(manifest)
+
     # Step 4: Conversione Parquet
-    print("\n[CHECK] Verifica conversione Parquet...")
-    converted, skipped = check_and_convert_parquet()
-    
+    print("[CHECK] Verifica conversione Parquet...")
+    with run_metrics.stage("convert"):
+        converted, skipped = check_and_convert_parquet(args.families, workers=args.workers)
+
     if converted > 0:
         print(f"[OK] Convertiti {converted} file in Parquet")
     else:
         print("[OK] Verifica parquet eseguita senza integrazioni")
-    
+
     print(f"\n[SUMMARY] CSV->Parquet: {skipped} gia presenti, {converted} convertiti")
-    
+
     return 0
 
 
+def run_fused(args: argparse.Namespace, probes: list[ProbeResult | None], templates: list[str]) -> int:
+    """Passi 2-4 in streaming: ogni anno va dall'archivio a Parquet e DuckDB."""
+    # Import qui: sync_complete carica duckdb, non serve al percorso classico
+    from scripts.cot.sync_complete import sync_stream
+
+    manifest = load_manifest()
+    years = fused_years(args.families, probes, templates, manifest, args.keep_raw)
+    try:
+        code = sync_stream(years, database=args.database)
+    finally:
+        years.close()
+        save_manifest(manifest)
+    failed = any(probe is None for probe in probes)
+    return 1 if code or failed else 0
+
+
 if __name__ == "__main__":
     sys.exit(main())
\ No newline at end of file
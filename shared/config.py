@@ -17,10 +17,17 @@ DATA_DIR = REPO_ROOT / "data"
 COT_DATA_DIR = DATA_DIR / "cot"
 COT_CSV_DIR = COT_DATA_DIR / "csv"  # Downloaded CSV files
 COT_PARQUET_DIR = COT_DATA_DIR / "parquet"  # Converted Parquet files
+COT_DATASET_DIR = COT_PARQUET_DIR / "legacy_futures"  # Dataset partizionato year=YYYY/
+COT_NORMALIZED_DIR = COT_PARQUET_DIR / "legacy_normalized"  # Metriche per mercato, market=CODE/
+COT_HTTP_CACHE_PATH = COT_DATA_DIR / "http_cache.json"  # ETag/Last-Modified per URL
+COT_MANIFEST_PATH = COT_DATA_DIR / "manifest.json"  # Metadati file CSV/Parquet
+COT_MARKET_RESOLVER_PATH = COT_DATA_DIR / "market_resolver.json"  # Cache simbolo -> market code
+COT_RUN_LOG_PATH = COT_DATA_DIR / "runs" / "runs.jsonl"  # Tempi e contatori di ogni run (JSON-lines)
 
 # DuckDB storage
 DUCKDB_DIR = DATA_DIR / "duckdb"
 COT_DUCKDB_PATH = DUCKDB_DIR / "cot.db"
+COT_SNAPSHOT_DIR = DUCKDB_DIR / "snapshots"  # Copie read-only pubblicate dopo ogni sync
 
 
 # Official CFTC endpoints (Legacy Futures Only format)
@@ -28,15 +35,18 @@ CFTC_LEGACY_FUTURES_ZIP = (
     "https://www.cftc.gov/dea/newcot/CotHistAllFutures.txt"
 )
 CFTC_LEGACY_FUTURES_TXT_TEMPLATE = (
-    "https://www.cftc.gov/files/dea/history/deacot_{year}.zip"
+    "https://www.cftc.gov/files/dea/history/deacot{year}.zip"
 )
 
-# Disaggregated endpoints (alternative format)
-CFTC_DISAGGREGATED_FUTURES_ZIP = (
-    "https://www.cftc.gov/files/dea/history/deacotdisagg_{date}.zip"
+# Archivi annuali delle altre famiglie di report (vedi shared.cot_families)
+CFTC_LEGACY_COMBINED_TXT_TEMPLATE = (
+    "https://www.cftc.gov/files/dea/history/deahistfo{year}.zip"
 )
-CFTC_DISAGGREGATED_FUTURES_ARCHIVE_TEMPLATE = (
-    "https://www.cftc.gov/files/dea/history/deacotdisaggTFF_{year}.zip"
+CFTC_DISAGGREGATED_FUTURES_TXT_TEMPLATE = (
+    "https://www.cftc.gov/files/dea/history/fut_disagg_txt_{year}.zip"
+)
+CFTC_TFF_FUTURES_TXT_TEMPLATE = (
+    "https://www.cftc.gov/files/dea/history/fut_fin_txt_{year}.zip"
 )
 
 
@@ -53,12 +63,20 @@ __all__ = [
     "COT_DATA_DIR",
     "COT_CSV_DIR",
     "COT_PARQUET_DIR",
+    "COT_DATASET_DIR",
+    "COT_NORMALIZED_DIR",
+    "COT_HTTP_CACHE_PATH",
+    "COT_MANIFEST_PATH",
+    "COT_MARKET_RESOLVER_PATH",
+    "COT_RUN_LOG_PATH",
     "DUCKDB_DIR",
     "COT_DUCKDB_PATH",
+    "COT_SNAPSHOT_DIR",
     "CFTC_LEGACY_FUTURES_ZIP",
     "CFTC_LEGACY_FUTURES_TXT_TEMPLATE",
-    "CFTC_DISAGGREGATED_FUTURES_ZIP",
-    "CFTC_DISAGGREGATED_FUTURES_ARCHIVE_TEMPLATE",
+    "CFTC_LEGACY_COMBINED_TXT_TEMPLATE",
+    "CFTC_DISAGGREGATED_FUTURES_TXT_TEMPLATE",
+    "CFTC_TFF_FUTURES_TXT_TEMPLATE",
     "ensure_directories",
 ]
 
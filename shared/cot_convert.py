@@ -0,0 +1,364 @@
+# -*- coding: utf-8 -*-
+"""Conversione CSV->Parquet dei report COT (tutte le famiglie).
+
+Il CSV viene letto a blocchi con ``pyarrow.csv.open_csv`` usando lo schema
+canonico della famiglia (``shared.cot_schema``, default Legacy) invece dei
+tipi inferiti da pandas: le
+intestazioni CFTC vengono rinominate (``report_date``,
+``contract_market_code``, ...) e tipizzate qui, una volta sola. Il Parquet
+viene scritto con ``ParquetWriter`` a row group di dimensione fissa,
+compressione zstd e statistiche per colonna. Senza ordinamento
+(``csv_to_parquet`` senza ``sort_by``) la memoria usata resta limitata a un
+row group indipendentemente dalla dimensione del file.
+
+``csv_to_dataset`` scrive l'anno nel dataset partizionato stile Hive
+(``{dataset}/year=YYYY/{dataset}_YYYY.parquet``, es. ``legacy_futures``) ordinato per
+``(contract_market_code, report_date)`` con row group piccoli: le
+statistiche min/max di ogni row group permettono a DuckDB e
+``pyarrow.dataset`` di saltare file (filtro su ``year`` o sulla data) e row
+group (filtro sul market code) invece di leggere tutto. L'ordinamento e'
+globale sul file (un ordinamento per blocco lascerebbe ogni market code
+sparso su tutti i row group), quindi la conversione nel dataset non e' in
+streaming: il CSV viene letto a blocchi ma l'anno intero resta in memoria
+fino alla scrittura (~15k righe, pochi MB per la Legacy).
+"""
+
+from __future__ import annotations
+
+import csv
+import os
+from pathlib import Path
+from typing import BinaryIO, Optional, Sequence
+
+from shared import run_metrics
+from shared.cot_schema import LEGACY_SCHEMA, MARKET_CODE, REPORT_DATE, ReportSchema, arrow_schema
+from shared.lazy_import import lazy_import
+
+pa = lazy_import("pyarrow")
+pc = lazy_import("pyarrow.compute")
+pacsv = lazy_import("pyarrow.csv")
+pq = lazy_import("pyarrow.parquet")
+
+
+DEFAULT_BLOCK_SIZE = 4 << 20  # byte di CSV letti per blocco
+DEFAULT_ROW_GROUP_SIZE = 65_536  # righe per row group Parquet
+DATASET_ROW_GROUP_SIZE = 8_192  # righe per row group nel dataset ordinato
+COMPRESSION = "zstd"
+COMPRESSION_LEVEL = 6
+
+# Valori che la CFTC (o pandas.to_csv) usa per celle mancanti
+NULL_VALUES = ["", ".", "NA", "N/A", "NaN", "nan", "NULL", "null"]
+
+# Ordinamento del dataset: i row group coprono pochi mercati ciascuno
+SORT_COLUMNS = (MARKET_CODE, REPORT_DATE)
+
+
+def _read_type(target: pa.DataType) -> pa.DataType:
+    """Tipo usato in lettura CSV, poi convertito nel tipo dichiarato.
+
+    Gli interi vengono letti come float64 perche' ``DataFrame.to_csv`` scrive
+    le colonne intere con valori mancanti come ``1234.0``; le date come
+    timestamp per accettare anche ``YYYY-MM-DD HH:MM:SS``.
+    """
+    if pa.types.is_integer(target):
+        return pa.float64()
+    if pa.types.is_date(target):
+        return pa.timestamp("s")
+    return target
+
+
+def _typed_arrays(arrays: list, schema: pa.Schema) -> list:
+    """Converte le colonne nei tipi dello schema e scarta le righe senza campi obbligatori."""
+    arrays = [pc.cast(array, field.type) for array, field in zip(arrays, schema)]
+    mask = None
+    for array, field in zip(arrays, schema):
+        if not field.nullable and array.null_count:
+            valid = pc.is_valid(array)
+            mask = valid if mask is None else pc.and_(mask, valid)
+    if mask is not None:
+        arrays = [pc.filter(array, mask) for array in arrays]
+    return arrays
+
+
+def conform_table(table: pa.Table, schema: ReportSchema = LEGACY_SCHEMA) -> pa.Table:
+    """Rinomina e tipizza secondo lo schema canonico una tabella con intestazioni CFTC.
+
+    Per i Parquet scritti prima dello schema condiviso; su una tabella gia'
+    canonica non cambia nulla.
+    """
+    resolved = schema.resolve_headers(table.column_names)
+    target = arrow_schema(column for column in resolved if column is not None)
+    arrays = [table.column(i) for i, column in enumerate(resolved) if column is not None]
+    return pa.Table.from_arrays(_typed_arrays(arrays, target), schema=target)
+
+
+def _parse_header(first_line: str) -> tuple[list[str], str]:
+    delimiter = "\t" if "\t" in first_line else ","
+    names = next(csv.reader([first_line], delimiter=delimiter))
+    return [name.strip() for name in names], delimiter
+
+
+def read_header(csv_path: Path) -> tuple[list[str], str]:
+    """Legge l'intestazione e individua il separatore (tab o virgola)."""
+    with open(csv_path, "r", encoding="utf-8-sig", newline="") as f:
+        return _parse_header(f.readline())
+
+
+def partition_path(dataset_dir: Path, year: int | str) -> Path:
+    """File Parquet dell'anno nel dataset partizionato (``{dataset}/year=Y/{dataset}_Y.parquet``)."""
+    dataset_dir = Path(dataset_dir)
+    return dataset_dir / f"year={year}" / f"{dataset_dir.name}_{year}.parquet"
+
+
+def dataset_glob(dataset_dir: Path) -> str:
+    """Pattern dei file annuali relativo a ``dataset_dir``."""
+    return f"year=*/{Path(dataset_dir).name}_*.parquet"
+
+
+def dataset_files(dataset_dir: Path) -> list[Path]:
+    """File annuali del dataset partizionato, in ordine di anno."""
+    return sorted(Path(dataset_dir).glob(dataset_glob(dataset_dir)))
+
+
+def _parquet_writer(path: Path, schema: pa.Schema, sort_keys: list) -> pq.ParquetWriter:
+    """Writer con le impostazioni comuni (zstd, dizionario sulle stringhe, statistiche)."""
+    return pq.ParquetWriter(
+        path,
+        schema,
+        compression=COMPRESSION,
+        compression_level=COMPRESSION_LEVEL,
+        use_dictionary=[field.name for field in schema if pa.types.is_string(field.type)],
+        write_statistics=True,
+        sorting_columns=pq.SortingColumn.from_ordering(schema, sort_keys) if sort_keys else None,
+    )
+
+
+def _open_csv(source: Path | BinaryIO, block_size: int,
+              report_schema: ReportSchema) -> tuple[pacsv.CSVStreamingReader, pa.Schema]:
+    """Lettore a blocchi con colonne canoniche; i duplicati (stesso nome canonico) restano fuori.
+
+    ``source`` e' un percorso oppure uno stream binario (es. il membro di uno
+    zip CFTC), di cui l'intestazione viene consumata qui.
+    """
+    if isinstance(source, (str, Path)):
+        names, delimiter = read_header(source)
+        skip_rows = 1
+    else:
+        names, delimiter = _parse_header(source.readline().decode("utf-8-sig"))
+        skip_rows = 0
+    resolved = report_schema.resolve_headers(names)
+    columns = [column for column in resolved if column is not None]
+    present = {column.name for column in columns}
+    for name in report_schema.required:
+        if name not in present:
+            raise ValueError(f"'{report_schema.by_name[name].sources[0]}' not found")
+
+    schema = arrow_schema(columns)
+    reader = pacsv.open_csv(
+        source,
+        read_options=pacsv.ReadOptions(
+            column_names=[column.name if column is not None else f"__dup{index}"
+                          for index, column in enumerate(resolved)],
+            skip_rows=skip_rows,
+            block_size=block_size,
+        ),
+        parse_options=pacsv.ParseOptions(delimiter=delimiter),
+        convert_options=pacsv.ConvertOptions(
+            column_types={field.name: _read_type(field.type) for field in schema},
+            include_columns=schema.names,
+            null_values=NULL_VALUES,
+        ),
+    )
+    return reader, schema
+
+
+def read_report_csv(source: Path | BinaryIO, *, block_size: int = DEFAULT_BLOCK_SIZE,
+                    schema: ReportSchema = LEGACY_SCHEMA) -> pa.Table:
+    """Legge un CSV CFTC (percorso o stream binario) in una tabella Arrow con nomi e tipi canonici."""
+    reader, schema = _open_csv(source, block_size, schema)
+    batches = [pa.RecordBatch.from_arrays(_typed_arrays(batch.columns, schema), schema=schema)
+               for batch in reader]
+    return pa.Table.from_batches(batches, schema=schema)
+
+
+def csv_to_parquet(
+    csv_path: Path,
+    parquet_path: Path,
+    *,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+    row_group_size: int = DEFAULT_ROW_GROUP_SIZE,
+    sort_by: Optional[Sequence[str]] = None,
+    schema: ReportSchema = LEGACY_SCHEMA,
+) -> int:
+    """Converte un CSV CFTC in Parquet (in streaming senza ``sort_by``). Ritorna le righe.
+
+    Le colonne hanno nomi e tipi canonici (``schema``), le righe
+    senza data, mercato o market code vengono scartate e il file di
+    destinazione viene sostituito atomicamente solo a conversione completata.
+    Con ``sort_by`` le righe vengono ordinate per quelle colonne prima della
+    scrittura (l'intero file passa in memoria) e l'ordinamento viene
+    dichiarato nei metadati Parquet (``sorting_columns``).
+    """
+    reader, schema = _open_csv(csv_path, block_size, schema)
+
+    parquet_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = parquet_path.with_name(parquet_path.name + ".tmp")
+    sort_keys = [(name, "ascending") for name in sort_by or () if name in schema.names]
+    rows = 0
+    pending: list[pa.RecordBatch] = []
+    pending_rows = 0
+
+    try:
+        with _parquet_writer(tmp_path, schema, sort_keys) as writer:
+            for batch in reader:
+                batch = pa.RecordBatch.from_arrays(_typed_arrays(batch.columns, schema), schema=schema)
+                pending.append(batch)
+                pending_rows += batch.num_rows
+                # Con sort_by l'ordinamento e' globale: si scrive tutto alla fine
+                if not sort_keys and pending_rows >= row_group_size:
+                    # Solo row group pieni; il resto passa al giro successivo
+                    table = pa.Table.from_batches(pending, schema=schema)
+                    full = (table.num_rows // row_group_size) * row_group_size
+                    writer.write_table(table.slice(0, full), row_group_size=row_group_size)
+                    rows += full
+                    remainder = table.slice(full)
+                    pending, pending_rows = remainder.to_batches(), remainder.num_rows
+            if pending:
+                table = pa.Table.from_batches(pending, schema=schema)
+                if sort_keys:
+                    table = table.sort_by(sort_keys)
+                writer.write_table(table, row_group_size=row_group_size)
+                rows += table.num_rows
+        os.replace(tmp_path, parquet_path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+    run_metrics.count("converted_rows", rows)
+    run_metrics.count("converted_files")
+    return rows
+
+
+def csv_to_dataset(
+    csv_path: Path,
+    dataset_dir: Path,
+    year: int | str,
+    *,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+    row_group_size: int = DATASET_ROW_GROUP_SIZE,
+    schema: ReportSchema = LEGACY_SCHEMA,
+) -> int:
+    """Converte il CSV di un anno nella sua partizione del dataset. Ritorna le righe.
+
+    L'anno viene ordinato per ``SORT_COLUMNS`` e quindi tenuto tutto in
+    memoria prima della scrittura (``block_size`` limita solo la lettura del
+    CSV). Il vecchio file annuale non partizionato (es.
+    ``legacy_futures_YYYY.parquet`` nella directory padre del dataset) viene
+    rimosso: il dataset lo sostituisce.
+    """
+    target = partition_path(dataset_dir, year)
+    rows = csv_to_parquet(
+        csv_path, target, block_size=block_size, row_group_size=row_group_size,
+        sort_by=SORT_COLUMNS, schema=schema,
+    )
+    flat = Path(dataset_dir).parent / target.name
+    if flat.exists():
+        flat.unlink()
+    return rows
+
+
+def table_to_dataset(
+    table: pa.Table,
+    dataset_dir: Path,
+    year: int | str,
+    *,
+    row_group_size: int = DATASET_ROW_GROUP_SIZE,
+    schema: ReportSchema = LEGACY_SCHEMA,
+) -> Path:
+    """Scrive nella partizione dell'anno una tabella gia' in memoria. Ritorna il file.
+
+    Per il percorso senza CSV intermedio (``read_report_csv`` sullo stream
+    dell'archivio): stesso ordinamento, row group e sostituzione atomica di
+    ``csv_to_dataset``.
+    """
+    target = partition_path(dataset_dir, year)
+    _rewrite_sorted(table, target, row_group_size, schema)
+    flat = Path(dataset_dir).parent / target.name
+    if flat.exists():
+        flat.unlink()
+    run_metrics.count("converted_rows", table.num_rows)
+    run_metrics.count("converted_files")
+    return target
+
+
+def _rewrite_sorted(table: pa.Table, target: Path, row_group_size: int,
+                    schema: ReportSchema) -> None:
+    """Scrive ``table`` con lo schema canonico, ordinata, sostituendo ``target`` atomicamente."""
+    table = conform_table(table, schema)
+    sort_keys = [(name, "ascending") for name in SORT_COLUMNS if name in table.column_names]
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = target.with_name(target.name + ".tmp")
+    try:
+        with _parquet_writer(tmp_path, table.schema, sort_keys) as writer:
+            writer.write_table(table.sort_by(sort_keys) if sort_keys else table,
+                               row_group_size=row_group_size)
+        os.replace(tmp_path, target)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+def migrate_flat_files(dataset_dir: Path, row_group_size: int = DATASET_ROW_GROUP_SIZE,
+                       schema: ReportSchema = LEGACY_SCHEMA) -> list[Path]:
+    """Sposta nel dataset i vecchi ``{dataset}_YYYY.parquet`` non partizionati.
+
+    Serve per gli anni senza CSV locale (che quindi non verrebbero
+    riconvertiti): il file viene riscritto con lo schema canonico, ordinato,
+    nella sua partizione e l'originale rimosso. Ritorna i file del dataset creati.
+    """
+    dataset_dir = Path(dataset_dir)
+    migrated = []
+    for flat in sorted(dataset_dir.parent.glob(f"{dataset_dir.name}_*.parquet")):
+        year = flat.stem.split("_")[-1]
+        if not year.isdigit():
+            continue
+        target = partition_path(dataset_dir, year)
+        if not target.exists():
+            _rewrite_sorted(pq.read_table(flat), target, row_group_size, schema)
+            migrated.append(target)
+        flat.unlink()
+    return migrated
+
+
+def migrate_legacy_schema(dataset_dir: Path, row_group_size: int = DATASET_ROW_GROUP_SIZE,
+                          schema: ReportSchema = LEGACY_SCHEMA) -> list[Path]:
+    """Riscrive con lo schema canonico i file del dataset con intestazioni CFTC.
+
+    Come ``migrate_flat_files``, per gli anni senza CSV locale convertiti
+    prima dello schema condiviso. Ritorna i file riscritti.
+    """
+    migrated = []
+    for path in dataset_files(dataset_dir):
+        if REPORT_DATE not in pq.read_schema(path).names:
+            _rewrite_sorted(pq.read_table(path), path, row_group_size, schema)
+            migrated.append(path)
+    return migrated
+
+
+__all__ = [
+    "DEFAULT_BLOCK_SIZE",
+    "DEFAULT_ROW_GROUP_SIZE",
+    "DATASET_ROW_GROUP_SIZE",
+    "SORT_COLUMNS",
+    "conform_table",
+    "read_header",
+    "read_report_csv",
+    "partition_path",
+    "dataset_glob",
+    "dataset_files",
+    "csv_to_parquet",
+    "csv_to_dataset",
+    "table_to_dataset",
+    "migrate_flat_files",
+    "migrate_legacy_schema",
+]
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""Famiglie di report COT gestite dalla pipeline.
+
+Ogni famiglia ha il proprio archivio annuale CFTC, il proprio schema
+canonico (``shared.cot_schema``), i propri CSV (``cot_{name}_{year}.txt``),
+il proprio dataset Parquet partizionato (``{dataset}/year=YYYY/``) e la
+propria tabella DuckDB, ma condivide con le altre download condizionale,
+manifest, conversione e sync incrementale: aggiungere una famiglia non
+cambia il costo di aggiornamento delle altre (solo i file cambiati vengono
+riscaricati, riconvertiti e risincronizzati).
+
+La famiglia ``legacy`` e' quella storica: dataset ``legacy_futures`` e
+tabella ``cot_disagg`` (nome mantenuto per report, serve e query), l'unica
+con ``cot_metrics`` e ``market_catalog``.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Optional
+
+from shared.config import (
+    COT_CSV_DIR,
+    COT_DATASET_DIR,
+    COT_PARQUET_DIR,
+    CFTC_DISAGGREGATED_FUTURES_TXT_TEMPLATE,
+    CFTC_LEGACY_COMBINED_TXT_TEMPLATE,
+    CFTC_LEGACY_FUTURES_TXT_TEMPLATE,
+    CFTC_TFF_FUTURES_TXT_TEMPLATE,
+)
+from shared.cot_schema import DISAGGREGATED_SCHEMA, LEGACY_SCHEMA, TFF_SCHEMA, ReportSchema
+
+
+@dataclass(frozen=True)
+class ReportFamily:
+    """Famiglia di report: sorgente, schema, dataset Parquet e tabella DuckDB."""
+
+    name: str
+    label: str
+    schema: ReportSchema
+    archive_template: str  # URL dell'archivio annuale ({year})
+    dataset_dir: Path
+    table: str
+    metrics: bool = False  # cot_metrics e market_catalog (solo Legacy futures)
+
+    @property
+    def dataset(self) -> str:
+        """Nome del dataset, anche prefisso dei file annuali."""
+        return self.dataset_dir.name
+
+    def csv_path(self, year: int | str) -> Path:
+        return COT_CSV_DIR / f"cot_{self.name}_{year}.txt"
+
+    def csv_files(self) -> list[Path]:
+        """CSV annuali scaricati per questa famiglia."""
+        return sorted(
+            path for path in COT_CSV_DIR.glob(f"cot_{self.name}_*.txt")
+            if path.stem.rsplit("_", 1)[-1].isdigit()
+        )
+
+
+LEGACY = ReportFamily(
+    name="legacy",
+    label="Legacy Futures Only",
+    schema=LEGACY_SCHEMA,
+    archive_template=CFTC_LEGACY_FUTURES_TXT_TEMPLATE,
+    dataset_dir=COT_DATASET_DIR,
+    table="cot_disagg",
+    metrics=True,
+)
+COMBINED = ReportFamily(
+    name="combined",
+    label="Legacy Futures + Options Combined",
+    schema=LEGACY_SCHEMA,
+    archive_template=CFTC_LEGACY_COMBINED_TXT_TEMPLATE,
+    dataset_dir=COT_PARQUET_DIR / "legacy_combined",
+    table="cot_combined",
+)
+DISAGGREGATED = ReportFamily(
+    name="disaggregated",
+    label="Disaggregated Futures Only",
+    schema=DISAGGREGATED_SCHEMA,
+    archive_template=CFTC_DISAGGREGATED_FUTURES_TXT_TEMPLATE,
+    dataset_dir=COT_PARQUET_DIR / "disaggregated_futures",
+    table="cot_disaggregated",
+)
+TFF = ReportFamily(
+    name="tff",
+    label="Traders in Financial Futures",
+    schema=TFF_SCHEMA,
+    archive_template=CFTC_TFF_FUTURES_TXT_TEMPLATE,
+    dataset_dir=COT_PARQUET_DIR / "tff_futures",
+    table="cot_tff",
+)
+
+FAMILIES = {family.name: family for family in (LEGACY, COMBINED, DISAGGREGATED, TFF)}
+FAMILY_CHOICES = (*FAMILIES, "all")
+
+
+def resolve_families(names: Optional[Iterable[str]],
+                     default: Iterable[ReportFamily] = (LEGACY,)) -> list[ReportFamily]:
+    """Famiglie indicate da ``--family`` (ripetibile, ``all`` = tutte), nell'ordine di FAMILIES."""
+    names = set(names or ())
+    if not names:
+        return list(default)
+    if "all" in names:
+        return list(FAMILIES.values())
+    return [family for family in FAMILIES.values() if family.name in names]
+
+
+__all__ = [
+    "ReportFamily",
+    "LEGACY",
+    "COMBINED",
+    "DISAGGREGATED",
+    "TFF",
+    "FAMILIES",
+    "FAMILY_CHOICES",
+    "resolve_families",
+]
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""Download degli archivi annuali CFTC.
+
+Gli archivi (``deacot{year}.zip`` per Legacy Futures, gli altri template in
+``shared.config`` / ``shared.cot_families``) vengono scaricati dagli endpoint
+CFTC; passando ``source_dir`` vengono invece letti da una directory locale
+con gli stessi nomi file (fixture per test offline o mirror).
+
+``probe_year_archive`` verifica se un archivio e' cambiato con una richiesta
+condizionale (``If-None-Match`` / ``If-Modified-Since``) usando i validatori
+salvati in ``COT_HTTP_CACHE_PATH``: se il server risponde 304 non viene
+trasferito nulla, altrimenti il payload della risposta e' gia' l'archivio
+aggiornato e va riusato per il download.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import io
+import json
+import os
+import urllib.error
+import urllib.request
+import zipfile
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import IO, Iterator, Optional
+
+from shared.config import COT_HTTP_CACHE_PATH, CFTC_LEGACY_FUTURES_TXT_TEMPLATE
+from shared import run_metrics
+from shared.lazy_import import lazy_import
+
+pd = lazy_import("pandas")
+
+
+DEFAULT_TIMEOUT = 120  # secondi
+USER_AGENT = "Cot_Report_MIC/1.0 (+https://github.com/michaelbertaggia2001-bot/Cot_Report_MIC)"
+
+
+@dataclass
+class ProbeResult:
+    """Esito di una richiesta condizionale su un archivio annuale."""
+
+    year: int
+    url: str
+    modified: bool
+    payload: Optional[bytes] = None
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    cached_max_date: Optional[str] = None
+
+
+def archive_url(year: int, url_template: str = CFTC_LEGACY_FUTURES_TXT_TEMPLATE) -> str:
+    """URL dell'archivio annuale (default Legacy Futures Only)."""
+    return url_template.format(year=year)
+
+
+def archive_name(year: int, url_template: str = CFTC_LEGACY_FUTURES_TXT_TEMPLATE) -> str:
+    """Nome file dell'archivio annuale (ultimo segmento dell'URL)."""
+    return archive_url(year, url_template).rsplit("/", 1)[-1]
+
+
+def _request(url: str, headers: Optional[dict] = None) -> urllib.request.Request:
+    return urllib.request.Request(url, headers={"User-Agent": USER_AGENT, **(headers or {})})
+
+
+def fetch_year_archive(year: int, source_dir: Optional[Path] = None,
+                       timeout: int = DEFAULT_TIMEOUT,
+                       url_template: str = CFTC_LEGACY_FUTURES_TXT_TEMPLATE) -> bytes:
+    """Restituisce i byte dello zip annuale, da rete o da ``source_dir``."""
+    if source_dir is not None:
+        payload = (Path(source_dir) / archive_name(year, url_template)).read_bytes()
+        run_metrics.count("local_archive_bytes", len(payload))
+        return payload
+
+    with urllib.request.urlopen(_request(archive_url(year, url_template)), timeout=timeout) as response:
+        payload = response.read()
+    run_metrics.count("downloaded_bytes", len(payload))
+    return payload
+
+
+def load_validator_cache(cache_path: Path = COT_HTTP_CACHE_PATH) -> dict:
+    """Legge la cache dei validatori HTTP (vuota se assente o illeggibile)."""
+    try:
+        return json.loads(Path(cache_path).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def save_validator_cache(cache: dict, cache_path: Path = COT_HTTP_CACHE_PATH) -> None:
+    """Scrive la cache dei validatori in modo atomico."""
+    cache_path = Path(cache_path)
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_name(cache_path.name + ".tmp")
+    tmp_path.write_text(json.dumps(cache, indent=2, sort_keys=True), encoding="utf-8")
+    os.replace(tmp_path, cache_path)
+
+
+def probe_year_archive(year: int, cache_path: Path = COT_HTTP_CACHE_PATH,
+                       timeout: int = DEFAULT_TIMEOUT,
+                       url_template: str = CFTC_LEGACY_FUTURES_TXT_TEMPLATE) -> ProbeResult:
+    """GET condizionale sull'archivio annuale.
+
+    Con risposta 304 ``modified`` e' False e ``cached_max_date`` riporta
+    l'ultima data vista; con 200 ``payload`` contiene l'archivio completo.
+    Gli errori HTTP diversi da 304 vengono propagati (``HTTPError``).
+    """
+    url = archive_url(year, url_template)
+    entry = load_validator_cache(cache_path).get(url, {})
+    headers = {}
+    if entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+
+    try:
+        with urllib.request.urlopen(_request(url, headers), timeout=timeout) as response:
+            payload = response.read()
+            run_metrics.count("downloaded_bytes", len(payload))
+            return ProbeResult(
+                year=year,
+                url=url,
+                modified=True,
+                payload=payload,
+                etag=response.headers.get("ETag"),
+                last_modified=response.headers.get("Last-Modified"),
+                cached_max_date=entry.get("max_report_date"),
+            )
+    except urllib.error.HTTPError as e:
+        if e.code != 304:
+            raise
+        run_metrics.count("http_cache_hits")
+        return ProbeResult(
+            year=year,
+            url=url,
+            modified=False,
+            etag=entry.get("etag"),
+            last_modified=entry.get("last_modified"),
+            cached_max_date=entry.get("max_report_date"),
+        )
+
+
+def remember_validators(probe: ProbeResult, max_report_date: Optional[str],
+                        cache_path: Path = COT_HTTP_CACHE_PATH) -> None:
+    """Salva i validatori di una risposta gia' elaborata con successo.
+
+    Va chiamata solo dopo aver scritto i dati: se il salvataggio fallisse a
+    meta', il run successivo non deve ricevere un 304 su dati mai scritti.
+    """
+    if not probe.modified:
+        return
+    cache = load_validator_cache(cache_path)
+    cache[probe.url] = {
+        "etag": probe.etag,
+        "last_modified": probe.last_modified,
+        "max_report_date": max_report_date,
+        "checked_at": datetime.now().isoformat(timespec="seconds"),
+    }
+    save_validator_cache(cache, cache_path)
+
+
+@contextlib.contextmanager
+def open_archive_member(payload: bytes) -> Iterator[IO[bytes]]:
+    """Stream binario del report contenuto nello zip CFTC (primo file .txt/.csv).
+
+    Il file viene decompresso a blocchi mentre lo si legge: nessuna copia
+    completa del testo in memoria.
+    """
+    with zipfile.ZipFile(io.BytesIO(payload)) as archive:
+        members = [
+            name for name in archive.namelist()
+            if name.lower().endswith((".txt", ".csv"))
+        ]
+        if not members:
+            raise ValueError("Archivio CFTC senza file di testo")
+        with archive.open(members[0]) as f:
+            yield f
+
+
+def read_archive(payload: bytes) -> pd.DataFrame:
+    """Legge il report contenuto nello zip CFTC (primo file .txt/.csv).
+
+    Tutte le celle restano stringhe: il contenuto viene riscritto tale e quale
+    (niente codici mercato numerici troncati o interi diventati ``1234.0``)
+    e i tipi vengono assegnati una sola volta dal convertitore Parquet.
+    """
+    with open_archive_member(payload) as f:
+        return pd.read_csv(f, dtype=str, keep_default_na=False)
+
+
+__all__ = [
+    "DEFAULT_TIMEOUT",
+    "ProbeResult",
+    "archive_url",
+    "archive_name",
+    "fetch_year_archive",
+    "load_validator_cache",
+    "save_validator_cache",
+    "probe_year_archive",
+    "remember_validators",
+    "open_archive_member",
+    "read_archive",
+]
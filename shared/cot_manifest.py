@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""Manifest di ingestione dei file COT (CSV scaricati e Parquet convertiti).
+
+Per ogni file registra size, mtime, sha256, numero di righe e intervallo di
+``report_date``; per ogni Parquet anche l'hash del CSV da cui e' stato
+generato. Cosi' "qual e' l'ultima data scaricata?" e "quali CSV vanno
+riconvertiti?" diventano letture di metadati, O(numero di file), invece di
+scansioni complete dei dati. Un CSV riscaricato con contenuto diverso rende
+obsoleto il suo Parquet anche se il file esiste gia'.
+
+L'hash viene ricalcolato solo quando size o mtime cambiano. I Parquet
+registrano anche la versione dello schema canonico (``shared.cot_schema``)
+con cui sono stati scritti: cambiando schema vengono riconvertiti.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Optional
+
+from shared.config import COT_MANIFEST_PATH
+from shared.cot_convert import read_header
+from shared.cot_schema import REPORT_DATE, SCHEMA_VERSION, report_date_header
+from shared.lazy_import import lazy_import
+
+pacsv = lazy_import("pyarrow.csv")
+pq = lazy_import("pyarrow.parquet")
+
+
+MANIFEST_VERSION = 1
+
+
+def load_manifest(path: Path = COT_MANIFEST_PATH) -> dict:
+    """Legge il manifest (vuoto se assente, illeggibile o di un'altra versione)."""
+    try:
+        manifest = json.loads(Path(path).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        manifest = {}
+    if manifest.get("version") != MANIFEST_VERSION:
+        manifest = {"version": MANIFEST_VERSION, "csv": {}, "parquet": {}}
+    return manifest
+
+
+def save_manifest(manifest: dict, path: Path = COT_MANIFEST_PATH) -> None:
+    """Scrive il manifest in modo atomico."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_text(json.dumps(manifest, indent=2, sort_keys=True), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def sha256_file(path: Path, chunk_size: int = 1 << 20) -> str:
+    """SHA-256 del contenuto del file (letto a blocchi)."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _is_current(entry: Optional[dict], path: Path) -> bool:
+    """True se size e mtime del file coincidono con quelli registrati."""
+    if not entry:
+        return False
+    stat = path.stat()
+    return entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns
+
+
+def _fingerprint(path: Path, previous: Optional[dict] = None) -> dict:
+    stat = path.stat()
+    digest = previous["sha256"] if _is_current(previous, path) else sha256_file(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest}
+
+
+def csv_stats(csv_path: Path) -> tuple[int, Optional[str], Optional[str]]:
+    """Righe e intervallo date di un CSV (legge solo la colonna data)."""
+    names, delimiter = read_header(csv_path)
+    date_column = report_date_header(names)
+    if date_column is None:
+        raise ValueError(f"{csv_path.name}: colonna data non trovata")
+    table = pacsv.read_csv(
+        csv_path,
+        parse_options=pacsv.ParseOptions(delimiter=delimiter),
+        convert_options=pacsv.ConvertOptions(
+            include_columns=[date_column], column_types={date_column: "string"}
+        ),
+    )
+    dates = [d for d in table.column(date_column).to_pylist() if d]
+    return table.num_rows, (min(dates) if dates else None), (max(dates) if dates else None)
+
+
+def _column_names(metadata: pq.FileMetaData) -> list[str]:
+    return [metadata.schema.column(i).name for i in range(metadata.num_columns)]
+
+
+def parquet_stats(parquet_path: Path) -> tuple[int, Optional[str], Optional[str]]:
+    """Righe e intervallo date di un Parquet dalle sole statistiche del footer."""
+    metadata = pq.ParquetFile(parquet_path).metadata
+    names = _column_names(metadata)
+    if REPORT_DATE not in names:
+        return metadata.num_rows, None, None
+    index = names.index(REPORT_DATE)
+    low = high = None
+    for rg in range(metadata.num_row_groups):
+        stats = metadata.row_group(rg).column(index).statistics
+        if stats is None or not stats.has_min_max:
+            continue
+        low = stats.min if low is None else min(low, stats.min)
+        high = stats.max if high is None else max(high, stats.max)
+    return metadata.num_rows, (str(low)[:10] if low else None), (str(high)[:10] if high else None)
+
+
+def record_csv(manifest: dict, csv_path: Path, rows: Optional[int] = None,
+               min_date: Optional[str] = None, max_date: Optional[str] = None) -> dict:
+    """Registra (o aggiorna) un CSV. Senza statistiche le calcola dal file."""
+    previous = manifest["csv"].get(csv_path.name)
+    entry = _fingerprint(csv_path, previous)
+    if rows is None:
+        if previous and previous.get("sha256") == entry["sha256"] and "rows" in previous:
+            rows, min_date, max_date = (
+                previous["rows"], previous["min_report_date"], previous["max_report_date"]
+            )
+        else:
+            rows, min_date, max_date = csv_stats(csv_path)
+    entry.update({"rows": rows, "min_report_date": min_date, "max_report_date": max_date})
+    manifest["csv"][csv_path.name] = entry
+    return entry
+
+
+def record_parquet(manifest: dict, parquet_path: Path, csv_path: Optional[Path] = None, *,
+                   source_name: Optional[str] = None, source_sha256: Optional[str] = None) -> dict:
+    """Registra un Parquet appena generato dal CSV indicato.
+
+    Senza ``csv_path`` (update ``--fused``: archivio convertito senza CSV
+    intermedio) la sorgente e' l'archivio, con nome e hash passati dal
+    chiamante.
+    """
+    if csv_path is not None:
+        source_name, source_sha256 = csv_path.name, record_csv(manifest, csv_path)["sha256"]
+    rows, min_date, max_date = parquet_stats(parquet_path)
+    # Un Parquet senza colonne canoniche (intestazioni CFTC) non ha versione
+    canonical = REPORT_DATE in _column_names(pq.ParquetFile(parquet_path).metadata)
+    entry = _fingerprint(parquet_path)
+    entry.update({
+        "source": source_name,
+        "source_sha256": source_sha256,
+        "schema_version": SCHEMA_VERSION if canonical else None,
+        "rows": rows,
+        "min_report_date": min_date,
+        "max_report_date": max_date,
+    })
+    manifest["parquet"][parquet_path.name] = entry
+    return entry
+
+
+def needs_conversion(manifest: dict, csv_path: Path, parquet_path: Path) -> bool:
+    """True se il Parquet manca o non corrisponde al contenuto attuale del CSV.
+
+    Un Parquet gia' presente ma non ancora nel manifest (installazioni
+    precedenti) viene adottato se non e' piu' vecchio del CSV. Un Parquet
+    scritto con un'altra versione dello schema va sempre riconvertito.
+    """
+    if not parquet_path.exists():
+        return True
+    entry = manifest["parquet"].get(parquet_path.name)
+    if entry is None:
+        if parquet_path.stat().st_mtime_ns < csv_path.stat().st_mtime_ns:
+            return True
+        entry = record_parquet(manifest, parquet_path, csv_path)
+    if entry.get("schema_version") != SCHEMA_VERSION:
+        return True
+    source = record_csv(manifest, csv_path)
+    return entry.get("source_sha256") != source["sha256"]
+
+
+def latest_report_date(manifest: dict, csv_files: list[Path]) -> Optional[str]:
+    """Ultima ``report_date`` tra i CSV indicati, aggiornando il manifest se serve."""
+    latest = None
+    for csv_path in csv_files:
+        entry = manifest["csv"].get(csv_path.name)
+        if not _is_current(entry, csv_path):
+            entry = record_csv(manifest, csv_path)
+        max_date = entry.get("max_report_date")
+        if max_date and (latest is None or max_date > latest):
+            latest = max_date
+    return latest
+
+
+def latest_parquet_date(manifest: dict, parquet_files: list[Path]) -> Optional[str]:
+    """Ultima ``report_date`` tra i Parquet indicati (manifest, altrimenti footer)."""
+    latest = None
+    for parquet_path in parquet_files:
+        entry = manifest["parquet"].get(parquet_path.name)
+        if _is_current(entry, parquet_path):
+            max_date = entry.get("max_report_date")
+        else:
+            max_date = parquet_stats(parquet_path)[2]
+        if max_date and (latest is None or max_date > latest):
+            latest = max_date
+    return latest
+
+
+__all__ = [
+    "load_manifest",
+    "save_manifest",
+    "sha256_file",
+    "csv_stats",
+    "parquet_stats",
+    "record_csv",
+    "record_parquet",
+    "needs_conversion",
+    "latest_report_date",
+    "latest_parquet_date",
+]
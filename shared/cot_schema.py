@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""Schema canonici dei report COT (Legacy, Disaggregated, TFF): nomi, tipi, alias.
+
+Un'unica definizione per famiglia di report usata da converter
+(``shared.cot_convert``), normalizzatore e sync: le colonne vengono
+rinominate e tipizzate una sola volta, alla conversione CSV->Parquet, e a
+valle si leggono gia' con il nome canonico (``report_date``,
+``contract_market_code``, ``noncommercial_long``...) e il tipo dichiarato.
+
+Le intestazioni CFTC (con spazi nel formato Legacy, con underscore in
+Disaggregated e TFF, es. ``M_Money_Positions_Long_All``) vengono ricondotte
+a una chiave normalizzata (minuscole, separatori -> ``_``): la ricerca
+dell'alias e' un lookup in un dict precompilato per schema. Una colonna non
+prevista dallo schema non viene scartata: prende come nome la propria chiave
+e un tipo dedotto dall'intestazione.
+"""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+
+from shared.lazy_import import lazy_import
+
+pa = lazy_import("pyarrow")
+
+
+# Incrementare quando cambiano nomi o tipi: i Parquet vanno riconvertiti
+SCHEMA_VERSION = 1
+
+REPORT_DATE = "report_date"
+MARKET_CODE = "contract_market_code"
+
+# Tipo logico -> tipo DuckDB (i tipi Arrow hanno lo stesso nome del tipo logico)
+DUCKDB_TYPES = {"string": "VARCHAR", "date32": "DATE", "int32": "INTEGER", "float32": "FLOAT"}
+
+
+@dataclass(frozen=True)
+class SchemaColumn:
+    """Colonna canonica con le intestazioni sorgente che la alimentano."""
+
+    name: str
+    dtype: str  # "string", "date32", "int32" o "float32"
+    nullable: bool = True
+    sources: tuple[str, ...] = ()
+
+    @property
+    def arrow_type(self) -> pa.DataType:
+        return getattr(pa, self.dtype)()
+
+    @property
+    def duckdb_type(self) -> str:
+        return DUCKDB_TYPES[self.dtype]
+
+
+def _column(name: str, dtype: str, *sources: str, nullable: bool = True) -> SchemaColumn:
+    return SchemaColumn(name, dtype, nullable, sources)
+
+
+# Identificativi comuni a tutte le famiglie (intestazioni Legacy e Disaggregated/TFF)
+_IDENTIFIER_COLUMNS = (
+    _column("market_and_exchange", "string", "Market and Exchange Names", nullable=False),
+    _column("report_date_yymmdd", "int32", "As of Date in Form YYMMDD"),
+    _column(REPORT_DATE, "date32", "As of Date in Form YYYY-MM-DD", "Report_Date_as_YYYY-MM-DD",
+            nullable=False),
+    _column(MARKET_CODE, "string", "CFTC Contract Market Code", nullable=False),
+    _column("market_code", "string", "CFTC Market Code in Initials", "CFTC_Market_Code"),
+    _column("region_code", "string", "CFTC Region Code"),
+    _column("commodity_code", "string", "CFTC Commodity Code"),
+)
+
+_TRAILING_COLUMNS = (
+    _column("contract_units", "string", "Contract Units"),
+    _column("contract_market_code_quotes", "string", "CFTC Contract Market Code (Quotes)"),
+    _column("market_code_quotes", "string", "CFTC Market Code in Initials (Quotes)",
+            "CFTC_Market_Code_Quotes"),
+    _column("commodity_code_quotes", "string", "CFTC Commodity Code (Quotes)"),
+    _column("subgroup_code", "string", "CFTC SubGroup Code"),
+    _column("futonly_or_combined", "string", "FutOnly_or_Combined"),
+)
+
+# Gruppi di trader: (prefisso canonico, nome CFTC, lati, ha il numero di trader)
+_LEGACY_GROUPS = (
+    ("noncommercial", "Noncommercial", ("long", "short", "spreading"), True),
+    ("commercial", "Commercial", ("long", "short"), True),
+    ("total_reportable", "Total Reportable", ("long", "short"), True),
+    ("nonreportable", "Nonreportable", ("long", "short"), False),
+)
+_DISAGGREGATED_GROUPS = (
+    ("producer_merchant", "Prod_Merc", ("long", "short"), True),
+    ("swap_dealer", "Swap", ("long", "short", "spreading"), True),
+    ("managed_money", "M_Money", ("long", "short", "spreading"), True),
+    ("other_reportable", "Other_Rept", ("long", "short", "spreading"), True),
+    ("total_reportable", "Tot_Rept", ("long", "short"), True),
+    ("nonreportable", "NonRept", ("long", "short"), False),
+)
+_TFF_GROUPS = (
+    ("dealer", "Dealer", ("long", "short", "spreading"), True),
+    ("asset_manager", "Asset_Mgr", ("long", "short", "spreading"), True),
+    ("leveraged_funds", "Lev_Money", ("long", "short", "spreading"), True),
+    ("other_reportable", "Other_Rept", ("long", "short", "spreading"), True),
+    ("total_reportable", "Tot_Rept", ("long", "short"), True),
+    ("nonreportable", "NonRept", ("long", "short"), False),
+)
+
+
+def _legacy_columns() -> tuple[SchemaColumn, ...]:
+    """Colonne Legacy (futures e futures+options combined hanno le stesse intestazioni)."""
+    columns = list(_IDENTIFIER_COLUMNS)
+
+    # Blocchi ripetuti per raccolto: (All), (Old), (Other)
+    for crop, suffix in (("All", ""), ("Old", "_old"), ("Other", "_other")):
+        columns.append(_column(f"open_interest{suffix}", "int32", f"Open Interest ({crop})"))
+        for prefix, label, sides, _ in _LEGACY_GROUPS:
+            for side in sides:
+                raw_side = side.capitalize()
+                sources = [f"{label} Positions-{raw_side} ({crop})"]
+                if label == "Total Reportable":
+                    # Variante senza "Positions" usata da alcune fonti
+                    sources.append(f"{label}-{raw_side} ({crop})")
+                columns.append(_column(f"{prefix}_{side}{suffix}", "int32", *sources))
+        columns.append(_column(f"pct_oi{suffix}", "float32", f"% of Open Interest (OI) ({crop})"))
+        for prefix, label, sides, _ in _LEGACY_GROUPS:
+            for side in sides:
+                columns.append(_column(f"pct_oi_{prefix}_{side}{suffix}", "float32",
+                                       f"% of OI-{label}-{side.capitalize()} ({crop})"))
+        columns.append(_column(f"traders_total{suffix}", "int32", f"Traders-Total ({crop})"))
+        for prefix, label, sides, has_traders in _LEGACY_GROUPS:
+            for side in sides if has_traders else ():
+                columns.append(_column(f"traders_{prefix}_{side}{suffix}", "int32",
+                                       f"Traders-{label}-{side.capitalize()} ({crop})"))
+        for kind in ("Gross", "Net"):
+            for top in (4, 8):
+                for side in ("Long", "Short"):
+                    columns.append(_column(
+                        f"concentration_{kind.lower()}_top{top}_{side.lower()}{suffix}", "float32",
+                        f"Concentration-{kind} LT = {top} TDR-{side} ({crop})",
+                    ))
+
+    # Variazioni settimanali: solo (All)
+    columns.append(_column("open_interest_change", "int32", "Change in Open Interest (All)"))
+    for prefix, label, sides, _ in _LEGACY_GROUPS:
+        for side in sides:
+            columns.append(_column(f"{prefix}_{side}_change", "int32",
+                                   f"Change in {label}-{side.capitalize()} (All)"))
+
+    return tuple(columns) + _TRAILING_COLUMNS
+
+
+def _underscore_columns(groups: tuple, crops: tuple[str, ...]) -> tuple[SchemaColumn, ...]:
+    """Colonne dei report Disaggregated/TFF (intestazioni ``Gruppo_Positions_Long_All``)."""
+    raw_sides = {"long": "Long", "short": "Short", "spreading": "Spread"}
+    columns = list(_IDENTIFIER_COLUMNS)
+
+    for crop in crops:
+        suffix = "" if crop == "All" else f"_{crop.lower()}"
+        columns.append(_column(f"open_interest{suffix}", "int32", f"Open_Interest_{crop}"))
+        for prefix, label, sides, _ in groups:
+            for side in sides:
+                columns.append(_column(f"{prefix}_{side}{suffix}", "int32",
+                                       f"{label}_Positions_{raw_sides[side]}_{crop}"))
+        columns.append(_column(f"pct_oi{suffix}", "float32", f"Pct_of_Open_Interest_{crop}"))
+        for prefix, label, sides, _ in groups:
+            for side in sides:
+                columns.append(_column(f"pct_oi_{prefix}_{side}{suffix}", "float32",
+                                       f"Pct_of_OI_{label}_{raw_sides[side]}_{crop}"))
+        columns.append(_column(f"traders_total{suffix}", "int32", f"Traders_Tot_{crop}"))
+        for prefix, label, sides, has_traders in groups:
+            for side in sides if has_traders else ():
+                columns.append(_column(f"traders_{prefix}_{side}{suffix}", "int32",
+                                       f"Traders_{label}_{raw_sides[side]}_{crop}"))
+        for kind in ("Gross", "Net"):
+            for top in (4, 8):
+                for side in ("Long", "Short"):
+                    columns.append(_column(
+                        f"concentration_{kind.lower()}_top{top}_{side.lower()}{suffix}", "float32",
+                        f"Conc_{kind}_LE_{top}_TDR_{side}_{crop}",
+                    ))
+
+    columns.append(_column("open_interest_change", "int32", "Change_in_Open_Interest_All"))
+    for prefix, label, sides, _ in groups:
+        for side in sides:
+            columns.append(_column(f"{prefix}_{side}_change", "int32",
+                                   f"Change_in_{label}_{raw_sides[side]}_All"))
+
+    return tuple(columns) + _TRAILING_COLUMNS
+
+
+_KEY_SEPARATORS = re.compile(r"[^0-9a-z]+")
+_STRING_MARKERS = ("names", "code", "initials", "units")
+
+
+def alias_key(header: str) -> str:
+    """Chiave di confronto di un'intestazione: minuscole, separatori -> ``_``."""
+    return _KEY_SEPARATORS.sub("_", header.strip().lower().replace("%", "pct")).strip("_")
+
+
+def infer_dtype(header: str) -> str:
+    """Tipo di una colonna non prevista dallo schema, dedotto dall'intestazione."""
+    key = alias_key(header)
+    if any(marker in key for marker in _STRING_MARKERS):
+        return "string"
+    if "yyyy_mm_dd" in key:
+        return "date32"
+    if key.startswith("pct") or key.startswith("concentration"):
+        return "float32"
+    # Posizioni, variazioni e numero di trader
+    return "int32"
+
+
+@dataclass(frozen=True)
+class ReportSchema:
+    """Colonne canoniche di una famiglia di report con gli alias precompilati."""
+
+    name: str
+    columns: tuple[SchemaColumn, ...]
+    by_name: dict = field(init=False, repr=False, compare=False)
+    aliases: dict = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        aliases: dict[str, str] = {}
+        for column in self.columns:
+            for source in (column.name, *column.sources):
+                aliases.setdefault(alias_key(source), column.name)
+        object.__setattr__(self, "by_name", {column.name: column for column in self.columns})
+        object.__setattr__(self, "aliases", aliases)
+
+    @property
+    def required(self) -> tuple[str, ...]:
+        return tuple(column.name for column in self.columns if not column.nullable)
+
+    def canonical_name(self, header: str) -> str:
+        """Nome canonico di un'intestazione (la sua chiave se non e' nello schema)."""
+        key = alias_key(header)
+        return self.aliases.get(key, key)
+
+    def column_for(self, header: str) -> SchemaColumn:
+        """Colonna canonica per un'intestazione sorgente."""
+        name = self.canonical_name(header)
+        known = self.by_name.get(name)
+        return known if known is not None else SchemaColumn(name, infer_dtype(header), True, (header,))
+
+    def resolve_headers(self, headers: Iterable[str]) -> list[Optional[SchemaColumn]]:
+        """Colonna canonica per ogni intestazione; None per i duplicati (vince la prima)."""
+        seen: set[str] = set()
+        resolved = []
+        for header in headers:
+            column = self.column_for(header)
+            if column.name in seen:
+                resolved.append(None)
+                continue
+            seen.add(column.name)
+            resolved.append(column)
+        return resolved
+
+
+LEGACY_SCHEMA = ReportSchema("legacy", _legacy_columns())
+DISAGGREGATED_SCHEMA = ReportSchema("disaggregated", _underscore_columns(
+    _DISAGGREGATED_GROUPS, ("All", "Old", "Other")))
+TFF_SCHEMA = ReportSchema("tff", _underscore_columns(_TFF_GROUPS, ("All",)))
+
+
+def report_date_header(headers: Iterable[str]) -> Optional[str]:
+    """Intestazione della data di report tra ``headers`` (stessi alias in ogni famiglia)."""
+    keys = {alias_key(source) for source in _IDENTIFIER_COLUMNS[2].sources}
+    return next((header for header in headers if alias_key(header) in keys), None)
+
+
+def arrow_schema(columns: Iterable[SchemaColumn]) -> pa.Schema:
+    """Schema Arrow (tipi e nullabilita') per le colonne indicate."""
+    return pa.schema([pa.field(c.name, c.arrow_type, nullable=c.nullable) for c in columns])
+
+
+__all__ = [
+    "SCHEMA_VERSION",
+    "REPORT_DATE",
+    "MARKET_CODE",
+    "DUCKDB_TYPES",
+    "SchemaColumn",
+    "ReportSchema",
+    "LEGACY_SCHEMA",
+    "DISAGGREGATED_SCHEMA",
+    "TFF_SCHEMA",
+    "alias_key",
+    "infer_dtype",
+    "report_date_header",
+    "arrow_schema",
+]
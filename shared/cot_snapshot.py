@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""Snapshot read-only del database DuckDB per i lettori di lunga durata.
+
+DuckDB non permette a un processo di scrivere ``cot.db`` mentre un altro lo
+tiene aperto (anche in sola lettura). Dopo ogni sync ``sync_complete.py``
+pubblica quindi una copia immutabile del database in ``COT_SNAPSHOT_DIR``
+(``cot-<timestamp>.db``) e aggiorna il puntatore ``CURRENT``; il servizio
+(``scripts/cot/serve.py``) legge solo dagli snapshot e passa al nuovo appena
+il puntatore cambia, senza mai bloccare il sync.
+"""
+
+from __future__ import annotations
+
+import os
+import shutil
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from shared.config import COT_DUCKDB_PATH, COT_SNAPSHOT_DIR
+
+
+POINTER_NAME = "CURRENT"
+DEFAULT_KEEP = 3
+
+
+def pointer_path(snapshot_dir: Path = COT_SNAPSHOT_DIR) -> Path:
+    return Path(snapshot_dir) / POINTER_NAME
+
+
+def current_snapshot(snapshot_dir: Path = COT_SNAPSHOT_DIR) -> Optional[Path]:
+    """Snapshot attualmente pubblicato (None se non ancora creato)."""
+    try:
+        name = pointer_path(snapshot_dir).read_text(encoding="utf-8").strip()
+    except OSError:
+        return None
+    path = Path(snapshot_dir) / name
+    return path if name and path.exists() else None
+
+
+def publish_snapshot(database: Path = COT_DUCKDB_PATH,
+                     snapshot_dir: Path = COT_SNAPSHOT_DIR,
+                     keep: int = DEFAULT_KEEP) -> Path:
+    """Copia ``database`` (gia' chiuso) in un nuovo snapshot e lo rende corrente.
+
+    La copia avviene su un file temporaneo rinominato a fine scrittura; il
+    puntatore viene aggiornato solo dopo. Restano al massimo ``keep``
+    snapshot: quelli ancora aperti da un lettore (Windows) vengono saltati.
+    """
+    snapshot_dir = Path(snapshot_dir)
+    snapshot_dir.mkdir(parents=True, exist_ok=True)
+    name = f"cot-{datetime.now():%Y%m%dT%H%M%S%f}.db"
+    target = snapshot_dir / name
+    tmp_path = target.with_name(name + ".tmp")
+    shutil.copyfile(database, tmp_path)
+    os.replace(tmp_path, target)
+
+    pointer = pointer_path(snapshot_dir)
+    tmp_pointer = pointer.with_name(POINTER_NAME + ".tmp")
+    tmp_pointer.write_text(name, encoding="utf-8")
+    os.replace(tmp_pointer, pointer)
+
+    for old in sorted(snapshot_dir.glob("cot-*.db"))[:-keep]:
+        try:
+            old.unlink()
+        except OSError:
+            pass  # Ancora in uso: verra' rimosso al prossimo sync
+    return target
+
+
+__all__ = [
+    "POINTER_NAME",
+    "pointer_path",
+    "current_snapshot",
+    "publish_snapshot",
+]
@@ -10,8 +10,9 @@ affidabile che può essere copiato/incollato senza mutazioni di caratteri.
 
 from __future__ import annotations
 
-import sys
 import io
+import os
+import sys
 from pathlib import Path
 from typing import Optional
 import unicodedata
@@ -68,10 +69,11 @@ def _setup_utf8_encoding_fallback() -> None:
 def format_number_ascii(num: int | float) -> str:
     """Formatta un numero con separatori delle migliaia ASCII puri (virgola).
     
-    Evita problemi di locale su Windows che possono inserire caratteri non-ASCII.
+    Evita problemi di locale su Windows che possono inserire caratteri non-ASCII:
+    il format spec ``,`` usa sempre la virgola ASCII, indipendentemente dal locale.
     
     Args:
-        num: Numero da formattare
+        num: Numero da formattare (i float vengono troncati a intero)
         
     Returns:
         Stringa con numero formattato usando solo ASCII (es: "12,345")
@@ -82,29 +84,23 @@ def format_number_ascii(num: int | float) -> str:
         >>> format_number_ascii(-12345678)
         '-12,345,678'
     """
-    if isinstance(num, float):
-        num = int(num)
-    
-    # Gestione segno
-    sign = '-' if num < 0 else ''
-    num = abs(num)
-    
-    # Converti in stringa e aggiungi virgole manualmente
-    num_str = str(num)
-    
-    # Aggiungi virgole ogni 3 cifre da destra
-    parts = []
-    for i, digit in enumerate(reversed(num_str)):
-        if i > 0 and i % 3 == 0:
-            parts.append(',')
-        parts.append(digit)
-    
-    return sign + ''.join(reversed(parts))
+    return f"{int(num):,}"
+
+
+# Caratteri di controllo ASCII (eccetto tab, newline, carriage return) -> spazio
+# (tabella bytes: la traduzione avviene in C, senza lookup per carattere)
+_CONTROL_TABLE = bytes(
+    0x20 if (code < 0x20 or code == 0x7F) and chr(code) not in "\t\n\r" else code
+    for code in range(256)
+)
 
 
 def sanitize_ascii(text: str) -> str:
     """Conserva solo ASCII stampabile, rimuovendo caratteri non ASCII.
     
+    Il testo gia' ASCII (caso comune) viene solo ripulito dai caratteri di
+    controllo; funziona anche su un intero report in una sola chiamata.
+    
     Args:
         text: Stringa da sanificare
         
@@ -114,22 +110,15 @@ def sanitize_ascii(text: str) -> str:
     if not isinstance(text, str):
         text = str(text)
     
-    # Rimuovi BOM e caratteri invisibili
-    text = text.replace('\ufeff', '').replace('\u200b', '').replace('\u200c', '').replace('\u200d', '')
-    
-    # Normalizza Unicode
-    normalized = unicodedata.normalize("NFKD", text)
-    
-    # Rimuovi caratteri di controllo (0x00-0x1F eccetto tab, newline, carriage return)
-    cleaned = ''.join(c for c in normalized if ord(c) < 128 or c in '\t\n\r')
-    
-    # Converte in ASCII puro (rimuove caratteri non ASCII)
-    result = cleaned.encode("ascii", "ignore").decode("ascii")
-    
-    # Rimuovi eventuali spazi multipli o caratteri strani rimasti
-    result = ''.join(c if ord(c) < 128 and (c.isprintable() or c in '\t\n\r') else ' ' for c in result)
+    if text.isascii():
+        data = text.encode("ascii")
+    else:
+        # Normalizza Unicode (NFKD) e scarta tutto cio' che resta fuori da
+        # ASCII: accenti separati, BOM e caratteri invisibili (zero-width)
+        data = unicodedata.normalize("NFKD", text).encode("ascii", "ignore")
     
-    return result
+    # Caratteri di controllo -> spazio
+    return data.translate(_CONTROL_TABLE).decode("ascii")
 
 
 def safe_print(text: str = "",
@@ -193,6 +182,78 @@ def safe_print(text: str = "",
             pass  # Fallback silenzioso in caso di errori
 
 
+class ReportSink:
+    """Scrittore bufferizzato per report (console + file UTF-8/ASCII).
+
+    Alternativa a ``safe_print(..., tee_file_utf8=...)`` per report con molte
+    righe: i file vengono aperti una sola volta alla chiusura, la copia per la
+    console e' sanificata in un unico passaggio e ogni file viene scritto su un
+    temporaneo e poi rinominato, quindi un report interrotto non lascia mai un
+    file a meta' (e il BOM compare solo all'inizio).
+
+    Uso::
+
+        with ReportSink(tee_file_utf8="report.txt", ascii_only=True) as sink:
+            sink.write("riga 1")
+            sink.write("riga 2")
+
+    Se il blocco termina con un'eccezione non viene scritto nulla.
+    """
+
+    def __init__(self,
+                 *,
+                 console: bool = True,
+                 ascii_only: bool = False,
+                 tee_file_utf8: Optional[str | Path] = None,
+                 tee_file_ascii: Optional[str | Path] = None):
+        self.console = console
+        self.ascii_only = ascii_only
+        self.tee_file_utf8 = Path(tee_file_utf8) if tee_file_utf8 else None
+        self.tee_file_ascii = Path(tee_file_ascii) if tee_file_ascii else None
+        self.lines: list[str] = []
+        self._printed = 0
+
+    def write(self, text: str = "") -> None:
+        """Accoda una riga (senza newline finale, come ``safe_print``)."""
+        self.lines.append(text)
+
+    def writelines(self, lines) -> None:
+        self.lines.extend(lines)
+
+    @staticmethod
+    def _replace(path: Path, content: str, encoding: str, errors: str) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".tmp")
+        try:
+            with open(tmp_path, "w", encoding=encoding, errors=errors, newline="\n") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+    def flush(self) -> None:
+        """Stampa le righe nuove e riscrive i file con tutto il contenuto."""
+        pending = self.lines[self._printed:]
+        if self.console and pending:
+            text = "\n".join(pending) + "\n"
+            sys.stdout.write(sanitize_ascii(text) if self.ascii_only else text)
+            sys.stdout.flush()
+        self._printed = len(self.lines)
+        content = "\n".join(self.lines) + "\n" if self.lines else ""
+        # BOM (utf-8-sig) per compatibilita' con vecchie app che non rilevano UTF-8
+        if self.tee_file_utf8:
+            self._replace(self.tee_file_utf8, content, "utf-8-sig", "replace")
+        if self.tee_file_ascii:
+            self._replace(self.tee_file_ascii, content, "ascii", "backslashreplace")
+
+    def __enter__(self) -> "ReportSink":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.flush()
+
+
 # Backward compatibility: alias per codice esistente
 setup_utf8_encoding = force_utf8_stdout
 
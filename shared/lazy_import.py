@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""Import differito dei moduli pesanti (pandas, pyarrow, duckdb).
+
+``pd = lazy_import("pandas")`` sostituisce ``import pandas as pd``: il modulo
+viene importato solo al primo accesso a un suo attributo. Cosi' ``--help``,
+errori di argomenti e sottocomandi che non usano una libreria non ne pagano
+il tempo di import (vedi ``benchmarks/bench_startup.py``).
+
+Va usato solo per moduli non referenziati a livello di modulo (costanti,
+classi base, default di argomenti): le annotazioni di tipo sono sicure con
+``from __future__ import annotations``.
+"""
+
+from __future__ import annotations
+
+import sys
+import types
+
+
+class LazyModule(types.ModuleType):
+    """Segnaposto che importa il modulo reale al primo accesso."""
+
+    def __getattr__(self, attr: str):
+        # Chiamato solo per attributi non ancora presenti: importa e copia
+        # il namespace, gli accessi successivi non passano piu' da qui.
+        # __import__ (non importlib.import_module) cosi' -X importtime lo registra
+        __import__(self.__name__)
+        module = sys.modules[self.__name__]
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+    def __repr__(self) -> str:
+        return f"<lazy module {self.__name__!r}>"
+
+
+def lazy_import(name: str) -> types.ModuleType:
+    """Modulo ``name`` se gia' importato, altrimenti un ``LazyModule``."""
+    module = sys.modules.get(name)
+    return module if module is not None else LazyModule(name)
+
+
+__all__ = ["LazyModule", "lazy_import"]
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""Catalogo dei mercati COT e risoluzione simbolo -> ``contract_market_code``.
+
+``build_market_catalog`` materializza in DuckDB la tabella ``market_catalog``
+(un record per codice: nome attuale, mercato, exchange, prima/ultima data e
+tutti i nomi storici come alias), o la definisce come vista, ed e' chiamata
+da ``sync_complete.py``.
+
+``resolve_symbols`` risolve i simboli del report con lookup esatto sul nome
+mercato o, in alternativa, intersecando un indice token -> codici costruito
+dagli alias: nessuna scansione ``LIKE`` sulla tabella dei dati. Il risultato
+viene salvato in ``COT_MARKET_RESOLVER_PATH`` insieme alla versione del
+catalogo e ricalcolato solo quando la versione o le regole cambiano. La
+versione non legge mai i dati: in modo table e' l'hash di codici e alias
+della tabella (un record per mercato), in modo view l'impronta (nome,
+dimensione, mtime) dei file Parquet letti dalla vista.
+"""
+
+from __future__ import annotations
+
+import glob
+import hashlib
+import json
+import os
+import re
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+from shared.config import COT_MARKET_RESOLVER_PATH
+from shared.lazy_import import lazy_import
+
+duckdb = lazy_import("duckdb")
+
+
+CATALOG_TABLE = "market_catalog"
+
+_NAME_PATTERN = r"^(.*) - (.*)$"
+_TOKEN_SPLIT = re.compile(r"[\s,()/]+")
+
+
+def catalog_query(source_table: str = "cot_disagg") -> str:
+    """SELECT del catalogo (un record per market code) su ``source_table``."""
+    return f"""
+        WITH latest AS (
+            SELECT
+                contract_market_code,
+                arg_max(market_and_exchange, report_date) AS market_and_exchange,
+                MIN(report_date) AS first_seen,
+                MAX(report_date) AS last_seen,
+                list_sort(list(DISTINCT market_and_exchange)) AS aliases
+            FROM {source_table}
+            WHERE contract_market_code IS NOT NULL
+            GROUP BY contract_market_code
+        )
+        SELECT
+            contract_market_code,
+            market_and_exchange,
+            COALESCE(NULLIF(regexp_extract(market_and_exchange, '{_NAME_PATTERN}', 1), ''),
+                     market_and_exchange) AS market_name,
+            NULLIF(regexp_extract(market_and_exchange, '{_NAME_PATTERN}', 2), '') AS exchange,
+            first_seen,
+            last_seen,
+            aliases
+        FROM latest
+        ORDER BY contract_market_code
+    """
+
+
+def build_market_catalog(con: duckdb.DuckDBPyConnection, source_table: str = "cot_disagg",
+                         view: bool = False, source_glob: Optional[str] = None) -> int:
+    """(Ri)costruisce ``market_catalog`` da ``source_table``. Ritorna i mercati.
+
+    Con ``view`` il catalogo e' una vista calcolata a ogni lettura;
+    ``source_glob`` (i file Parquet letti dalla vista) resta nel commento
+    della vista e serve a ``catalog_version``.
+    """
+    kind = "VIEW" if view else "TABLE"
+    con.execute(f"CREATE OR REPLACE {kind} {CATALOG_TABLE} AS {catalog_query(source_table)}")
+    if view and source_glob:
+        comment = source_glob.replace("'", "''")
+        con.execute(f"COMMENT ON VIEW {CATALOG_TABLE} IS '{comment}'")
+    return con.execute(f"SELECT COUNT(*) FROM {CATALOG_TABLE}").fetchone()[0]
+
+
+def _files_version(pattern: str) -> str:
+    """Impronta di nome, dimensione e mtime dei file che corrispondono a ``pattern``."""
+    digest = hashlib.sha256()
+    for name in sorted(glob.glob(pattern)):
+        stat = os.stat(name)
+        digest.update(f"{name}|{stat.st_size}|{stat.st_mtime_ns}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def catalog_version(con: duckdb.DuckDBPyConnection) -> Optional[str]:
+    """Versione del catalogo senza scansionare i dati.
+
+    Tabella: hash di codici e alias (cambia solo con mercati o nomi nuovi).
+    Vista: impronta dei file Parquet del glob salvato da
+    ``build_market_catalog``, che cambia a ogni file riscritto o aggiunto.
+    """
+    view = con.execute(
+        "SELECT comment FROM duckdb_views() WHERE view_name = ? AND NOT internal",
+        [CATALOG_TABLE],
+    ).fetchone()
+    if view is not None:
+        # Viste create prima del glob nel commento: nessuna cache finche' non si risincronizza
+        return f"files:{_files_version(view[0])}" if view[0] else None
+    return con.execute(f"""
+        SELECT md5(string_agg(contract_market_code || '=' || array_to_string(aliases, '|'),
+                              ';' ORDER BY contract_market_code))
+        FROM {CATALOG_TABLE}
+    """).fetchone()[0]
+
+
+def tokenize(text: str) -> list[str]:
+    """Token maiuscoli di un nome mercato (``E-MINI``, ``S&P``, ``NASDAQ-100``...)."""
+    return [token for token in _TOKEN_SPLIT.split(text.upper()) if token]
+
+
+def _market_part(name: str) -> str:
+    """Nome mercato senza la parte ``- EXCHANGE`` finale."""
+    match = re.match(_NAME_PATTERN, name)
+    return match.group(1) if match else name
+
+
+class MarketResolver:
+    """Indice in memoria del catalogo per risolvere simboli in market code."""
+
+    def __init__(self, con: duckdb.DuckDBPyConnection):
+        rows = con.execute(f"""
+            SELECT contract_market_code, market_name, aliases, last_seen
+            FROM {CATALOG_TABLE}
+        """).fetchall()
+        self.latest = max((row[3] for row in rows if row[3] is not None), default=None)
+        self.names: dict[str, str] = {}
+        self.by_exact: dict[str, set[str]] = {}
+        self.by_token: dict[str, set[str]] = {}
+        self.last_seen: dict[str, object] = {}
+        for code, market_name, aliases, last_seen in rows:
+            self.names[code] = market_name
+            self.last_seen[code] = last_seen
+            for alias in aliases or [market_name]:
+                market = _market_part(alias)
+                self.by_exact.setdefault(market.upper(), set()).add(code)
+                for token in tokenize(market):
+                    self.by_token.setdefault(token, set()).add(code)
+
+    def _best(self, codes: set[str]) -> Optional[str]:
+        """Preferisce i mercati ancora attivi, poi l'ordine alfabetico del nome."""
+        if not codes:
+            return None
+        return min(codes, key=lambda code: (self.last_seen[code] != self.latest, self.names[code], code))
+
+    def resolve(self, phrase: str, exclude: Optional[str] = None) -> Optional[str]:
+        """Codice per ``phrase``: nome esatto, altrimenti tutti i token presenti.
+
+        ``exclude`` scarta i mercati che contengono tutti i suoi token.
+        """
+        exact = self.by_exact.get(phrase.upper())
+        if exact:
+            return self._best(exact)
+
+        tokens = tokenize(phrase)
+        if not tokens:
+            return None
+        candidates = set.intersection(*(self.by_token.get(token, set()) for token in tokens))
+        if exclude:
+            excluded_tokens = tokenize(exclude)
+            candidates -= set.intersection(
+                *(self.by_token.get(token, set()) for token in excluded_tokens)
+            )
+        return self._best(candidates)
+
+
+def _rules_key(rules: dict[str, tuple[str, Optional[str]]]) -> str:
+    return hashlib.sha256(json.dumps(rules, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def resolve_symbols(con: duckdb.DuckDBPyConnection,
+                    rules: dict[str, tuple[str, Optional[str]]],
+                    cache_path: Path = COT_MARKET_RESOLVER_PATH) -> dict[str, Optional[str]]:
+    """Risolve ``{simbolo: (frase, esclusione)}`` usando la cache se ancora valida."""
+    version = catalog_version(con)
+    rules_key = _rules_key(rules)
+    cache_path = Path(cache_path)
+    try:
+        cached = json.loads(cache_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        cached = {}
+    if version is not None and cached.get("catalog_version") == version \
+            and cached.get("rules") == rules_key:
+        return cached["codes"]
+
+    resolver = MarketResolver(con)
+    codes = {symbol: resolver.resolve(phrase, exclude) for symbol, (phrase, exclude) in rules.items()}
+
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    # File temporaneo univoco: serve e auto_report possono scrivere insieme
+    handle = tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=cache_path.parent,
+                                         prefix=cache_path.name + ".", suffix=".tmp",
+                                         delete=False)
+    tmp_path = Path(handle.name)
+    try:
+        with handle:
+            json.dump({"catalog_version": version, "rules": rules_key, "codes": codes},
+                      handle, indent=2, sort_keys=True)
+        os.replace(tmp_path, cache_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    return codes
+
+
+__all__ = [
+    "CATALOG_TABLE",
+    "catalog_query",
+    "build_market_catalog",
+    "catalog_version",
+    "tokenize",
+    "MarketResolver",
+    "resolve_symbols",
+]
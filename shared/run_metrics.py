@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""Strumentazione leggera dei run della pipeline COT.
+
+Un ``RunMetrics`` raccoglie per un run (``update``, ``sync``...):
+
+- la durata degli stadi (``with stage("convert"):``), con esito ed eventuale
+  errore;
+- contatori (byte scaricati, righe convertite/sincronizzate, cache hit...)
+  incrementati con ``count()`` anche dai thread dei worker;
+- eventi puntuali (``event()``), ad esempio i warning che prima finivano
+  solo in un ``print``.
+
+Le funzioni di modulo (``stage``, ``count``, ``event``) scrivono sul run
+attivo (``recording()``) e non fanno nulla se non ce n'e' uno, quindi le
+librerie in ``shared/`` possono riportare i propri numeri senza dipendere
+dallo script chiamante. A fine run ogni record viene aggiunto al log
+JSON-lines (``COT_RUN_LOG_PATH``) e, se richiesto, i valori finali vengono
+scritti in un textfile Prometheus (node_exporter textfile collector).
+
+Con ``profile`` uno stadio gira sotto cProfile (solo il thread chiamante) e
+tracemalloc (tutti i thread): il profilo ``.prof`` viene salvato accanto al
+log e il picco di memoria Python entra nel record dello stadio.
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+from shared.config import COT_RUN_LOG_PATH
+
+
+def peak_rss_mb() -> float | None:
+    """Picco di memoria residente del processo in MB (None se non misurabile)."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux riporta KB, macOS byte
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class RunMetrics:
+    """Tempi, contatori ed eventi di un singolo run."""
+
+    def __init__(self, run: str, profile: Iterable[str] = (), profile_dir: Optional[Path] = None):
+        self.run = run
+        self.run_id = f"{datetime.now():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:6]}"
+        self.started = time.perf_counter()
+        self.counters: dict[str, int] = {}
+        self.stages: dict[str, float] = {}
+        self.records: list[dict] = []
+        self.failed = False
+        self.profile = set(profile)
+        self.profile_dir = Path(profile_dir) if profile_dir else COT_RUN_LOG_PATH.parent
+        self._lock = threading.Lock()
+
+    def _record(self, kind: str, **fields) -> dict:
+        record = {
+            "ts": datetime.now().isoformat(timespec="milliseconds"),
+            "run": self.run,
+            "run_id": self.run_id,
+            "type": kind,
+            **fields,
+        }
+        with self._lock:
+            self.records.append(record)
+        return record
+
+    def count(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def event(self, name: str, level: str = "info", **fields) -> None:
+        if level == "error":
+            self.count("errors")
+        self._record("event", event=name, level=level, **fields)
+
+    @contextlib.contextmanager
+    def stage(self, name: str, **fields) -> Iterator[dict]:
+        """Misura uno stadio; il dict restituito accetta campi extra per il record."""
+        extra: dict = {}
+        profiler = _StageProfiler(name, self.profile_dir, self.run_id) if name in self.profile else None
+        started = time.perf_counter()
+        status = "ok"
+        error = None
+        if profiler:
+            profiler.start()
+        try:
+            yield extra
+        except BaseException as e:
+            status = "error"
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            seconds = time.perf_counter() - started
+            if profiler:
+                extra.update(profiler.stop())
+            with self._lock:
+                self.stages[name] = self.stages.get(name, 0.0) + seconds
+            if status == "error":
+                self.count("errors")
+            self._record("stage", stage=name, seconds=round(seconds, 4), status=status,
+                         **({"error": error} if error else {}), **fields, **extra)
+
+    def summary(self) -> dict:
+        peak = peak_rss_mb()
+        return self._record(
+            "summary",
+            status="error" if self.failed else "ok",
+            seconds=round(time.perf_counter() - self.started, 4),
+            stages={name: round(seconds, 4) for name, seconds in self.stages.items()},
+            counters=dict(self.counters),
+            peak_rss_mb=round(peak, 1) if peak is not None else None,
+        )
+
+    def stats_line(self) -> str:
+        """Riga ``[STATS]`` con durata degli stadi e contatori."""
+        parts = [f"{name}={seconds:.2f}s" for name, seconds in self.stages.items()]
+        parts += [f"{name}={value}" for name, value in sorted(self.counters.items())]
+        return f"[STATS] run={self.run} time={time.perf_counter() - self.started:.2f}s " + " ".join(parts)
+
+    def write_jsonl(self, path: Path = COT_RUN_LOG_PATH) -> None:
+        """Aggiunge i record del run al log JSON-lines."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            for record in self.records:
+                f.write(json.dumps(record, default=str) + "\n")
+
+    def write_prometheus(self, path: Path) -> None:
+        """Scrive i valori del run in un textfile Prometheus (atomico)."""
+        summary = next((r for r in reversed(self.records) if r["type"] == "summary"), None) or self.summary()
+        run = _label(self.run)
+        lines = [
+            "# HELP cot_run_success 1 se l'ultimo run e' terminato senza errori",
+            "# TYPE cot_run_success gauge",
+            f'cot_run_success{{run="{run}"}} {int(summary["status"] == "ok")}',
+            "# HELP cot_run_timestamp_seconds Fine dell'ultimo run (epoch)",
+            "# TYPE cot_run_timestamp_seconds gauge",
+            f'cot_run_timestamp_seconds{{run="{run}"}} {time.time():.0f}',
+            "# HELP cot_run_duration_seconds Durata dell'ultimo run",
+            "# TYPE cot_run_duration_seconds gauge",
+            f'cot_run_duration_seconds{{run="{run}"}} {summary["seconds"]}',
+            "# HELP cot_stage_duration_seconds Durata di ogni stadio dell'ultimo run",
+            "# TYPE cot_stage_duration_seconds gauge",
+        ]
+        lines += [f'cot_stage_duration_seconds{{run="{run}",stage="{_label(name)}"}} {seconds}'
+                  for name, seconds in summary["stages"].items()]
+        for name, value in sorted(summary["counters"].items()):
+            metric = f"cot_{name}"
+            lines += [f"# TYPE {metric} gauge", f'{metric}{{run="{run}"}} {value}']
+        if summary["peak_rss_mb"] is not None:
+            lines += ["# TYPE cot_run_peak_rss_bytes gauge",
+                      f'cot_run_peak_rss_bytes{{run="{run}"}} {int(summary["peak_rss_mb"] * 1024 * 1024)}']
+
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".tmp")
+        tmp_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+        os.replace(tmp_path, path)
+
+
+class _StageProfiler:
+    """cProfile + tracemalloc attorno a uno stadio."""
+
+    def __init__(self, stage: str, output_dir: Path, run_id: str):
+        self.stage = stage
+        self.output = Path(output_dir) / f"profile_{stage}_{run_id}.prof"
+        self.profiler = cProfile.Profile()
+        self.tracing = False
+
+    def start(self) -> None:
+        self.tracing = not tracemalloc.is_tracing()
+        if self.tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        self.profiler.enable()
+
+    def stop(self) -> dict:
+        self.profiler.disable()
+        _, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, tracemalloc.__file__),
+        ])
+        top = snapshot.statistics("lineno")[:5]
+        if self.tracing:
+            tracemalloc.stop()
+
+        self.output.parent.mkdir(parents=True, exist_ok=True)
+        self.profiler.dump_stats(str(self.output))
+        report = io.StringIO()
+        pstats.Stats(self.profiler, stream=report).sort_stats("cumulative").print_stats(15)
+        print(f"[PROFILE] {self.stage}: picco memoria Python {peak / 1e6:.1f}MB, profilo {self.output}")
+        print(report.getvalue())
+        return {
+            "profile": str(self.output),
+            "tracemalloc_peak_mb": round(peak / 1e6, 1),
+            "tracemalloc_top": [f"{stat.traceback[0]}: {stat.size / 1e6:.1f}MB" for stat in top],
+        }
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+_ACTIVE: Optional[RunMetrics] = None
+
+
+@contextlib.contextmanager
+def recording(metrics: RunMetrics, log_path: Optional[Path] = COT_RUN_LOG_PATH,
+              prometheus_path: Optional[Path] = None) -> Iterator[RunMetrics]:
+    """Rende ``metrics`` il run attivo e a fine run scrive log e textfile."""
+    global _ACTIVE
+    previous, _ACTIVE = _ACTIVE, metrics
+    try:
+        yield metrics
+    except BaseException:
+        metrics.failed = True
+        raise
+    finally:
+        _ACTIVE = previous
+        metrics.summary()
+        print(metrics.stats_line())
+        try:
+            if log_path is not None:
+                metrics.write_jsonl(log_path)
+            if prometheus_path is not None:
+                metrics.write_prometheus(prometheus_path)
+        except OSError as e:
+            print(f"[WARN] Scrittura metriche del run fallita: {e}")
+
+
+def active() -> Optional[RunMetrics]:
+    return _ACTIVE
+
+
+def count(name: str, value: int = 1) -> None:
+    """Incrementa un contatore del run attivo (nessun effetto senza run)."""
+    if _ACTIVE is not None:
+        _ACTIVE.count(name, value)
+
+
+def event(name: str, level: str = "info", **fields) -> None:
+    """Registra un evento nel run attivo (nessun effetto senza run)."""
+    if _ACTIVE is not None:
+        _ACTIVE.event(name, level, **fields)
+
+
+def stage(name: str, **fields):
+    """Timer di uno stadio del run attivo (``nullcontext`` senza run)."""
+    if _ACTIVE is None:
+        return contextlib.nullcontext({})
+    return _ACTIVE.stage(name, **fields)
+
+
+def add_arguments(parser: argparse.ArgumentParser, stages: Iterable[str]) -> None:
+    """Opzioni comuni degli script: log del run, textfile Prometheus, profiling."""
+    parser.add_argument("--run-log", type=Path, default=COT_RUN_LOG_PATH,
+                        help="Log JSON-lines di tempi e contatori del run (default %(default)s)")
+    parser.add_argument("--no-run-log", action="store_true", help="Non scrive il log del run")
+    parser.add_argument("--prometheus", type=Path, metavar="FILE.prom",
+                        help="Scrive i valori del run in un textfile Prometheus")
+    parser.add_argument("--profile", action="append", choices=list(stages), default=[], metavar="STAGE",
+                        help=f"Esegue uno stadio sotto cProfile e tracemalloc ({', '.join(stages)})")
+
+
+def from_args(run: str, args: argparse.Namespace):
+    """``recording()`` configurato dalle opzioni di ``add_arguments``."""
+    log_path = None if args.no_run_log else args.run_log
+    metrics = RunMetrics(run, profile=args.profile,
+                         profile_dir=(log_path or COT_RUN_LOG_PATH).parent)
+    return recording(metrics, log_path, args.prometheus)
+
+
+__all__ = [
+    "RunMetrics",
+    "peak_rss_mb",
+    "recording",
+    "active",
+    "count",
+    "event",
+    "stage",
+    "add_arguments",
+    "from_args",
+]
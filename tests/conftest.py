@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+"""Fixture comuni: dataset Legacy sintetico (``benchmarks/synthetic.py``) convertito in Parquet."""
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.append(str(REPO_ROOT))
+
+
+@pytest.fixture
+def legacy_dataset(tmp_path: Path) -> Path:
+    """Dataset ``legacy_futures/year=*/`` di 3 anni x 6 mercati."""
+    from benchmarks.synthetic import write_fixtures
+    from shared.cot_convert import csv_to_dataset
+
+    dataset_dir = tmp_path / "legacy_futures"
+    for csv_path in write_fixtures(tmp_path / "csv", range(2022, 2025), markets=6):
+        csv_to_dataset(csv_path, dataset_dir, csv_path.stem.split("_")[-1])
+    return dataset_dir
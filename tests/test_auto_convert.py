@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""Conversione CSV -> Parquet di auto_convert_csv_to_parquet.py con un CSV illeggibile."""
+from __future__ import annotations
+
+import dataclasses
+from pathlib import Path
+
+from benchmarks.synthetic import write_fixtures
+from scripts.cot import auto_convert_csv_to_parquet as auto_convert
+from shared import cot_families
+from shared.cot_convert import partition_path
+from shared.cot_families import LEGACY
+from shared.cot_manifest import load_manifest, save_manifest
+
+
+def test_failed_csv_is_skipped(tmp_path: Path, monkeypatch):
+    csv_dir = tmp_path / "csv"
+    write_fixtures(csv_dir, range(2022, 2025), markets=4)
+    (csv_dir / "cot_legacy_2023.txt").write_text("non,un,report\n1,2,3\n", encoding="utf-8")
+    family = dataclasses.replace(LEGACY, dataset_dir=tmp_path / "legacy_futures")
+    manifest_path = tmp_path / "manifest.json"
+    events = []
+
+    monkeypatch.setattr(cot_families, "COT_CSV_DIR", csv_dir)
+    monkeypatch.setattr(auto_convert, "ensure_directories", lambda: None)
+    monkeypatch.setattr(auto_convert, "load_manifest", lambda: load_manifest(manifest_path))
+    monkeypatch.setattr(auto_convert, "save_manifest",
+                        lambda manifest: save_manifest(manifest, manifest_path))
+    monkeypatch.setattr(auto_convert.run_metrics, "event",
+                        lambda name, level="info", **fields: events.append((name, level, fields)))
+
+    converted = auto_convert.convert_all_csvs(families=[family])
+
+    assert converted == [partition_path(family.dataset_dir, year) for year in ("2022", "2024")]
+    assert all(path.exists() for path in converted)
+    assert not partition_path(family.dataset_dir, "2023").exists()
+    assert [(name, level, fields["file"]) for name, level, fields in events] == [
+        ("convert_failed", "error", "cot_legacy_2023.txt"),
+    ]
+
+    # Il manifest conserva i file convertiti: il giro successivo riprova solo il 2023
+    events.clear()
+    assert auto_convert.convert_all_csvs(families=[family]) == []
+    assert len(events) == 1
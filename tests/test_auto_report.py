@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""File consolidato del backtest (``auto_report.write_consolidated``)."""
+from __future__ import annotations
+
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from scripts.cot.auto_report import write_consolidated
+
+FORMATS = [".csv", ".parquet"]
+
+
+def _frame() -> pd.DataFrame:
+    return pd.DataFrame({
+        "report_date": pd.to_datetime(["2024-01-02", "2024-01-02"]),
+        "symbol": ["EUR", "GOLD"],
+        "delta": [10, -5],
+    })
+
+
+@pytest.mark.parametrize("suffix", FORMATS)
+def test_empty_range_creates_no_file(tmp_path: Path, suffix: str):
+    output = tmp_path / f"storico{suffix}"
+    assert write_consolidated(iter([]), output) == (0, 0)
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.parametrize("suffix", FORMATS)
+def test_failed_write_keeps_previous_output(tmp_path: Path, suffix: str):
+    output = tmp_path / f"storico{suffix}"
+    output.write_bytes(b"precedente")
+
+    def batches():
+        yield _frame()
+        raise RuntimeError("query interrotta")
+
+    with pytest.raises(RuntimeError):
+        write_consolidated(batches(), output)
+    assert output.read_bytes() == b"precedente"
+    assert list(tmp_path.iterdir()) == [output]
+
+
+@pytest.mark.parametrize("suffix", FORMATS)
+def test_rows_are_written(tmp_path: Path, suffix: str):
+    output = tmp_path / f"storico{suffix}"
+    assert write_consolidated(iter([_frame(), _frame()]), output) == (1, 4)
+    written = pd.read_parquet(output) if suffix == ".parquet" else pd.read_csv(output)
+    assert len(written) == 4
+    assert list(tmp_path.iterdir()) == [output]
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""Backfill offline di update_cot_pipeline.py da archivi ``deacotYYYY.zip`` locali."""
+from __future__ import annotations
+
+import dataclasses
+import os
+import zipfile
+from pathlib import Path
+
+import pandas as pd
+
+from benchmarks.synthetic import write_fixtures
+from scripts.cot import update_cot_pipeline as pipeline
+from shared import cot_families
+from shared.cot_convert import partition_path
+from shared.cot_families import LEGACY
+from shared.cot_manifest import load_manifest, save_manifest
+
+
+def _write_archive(source_dir: Path, year: int, csv_path: Path) -> None:
+    """Zip come quelli CFTC: ``annual.txt`` separato da virgole."""
+    frame = pd.read_csv(csv_path, sep="\t", dtype=str, keep_default_na=False)
+    with zipfile.ZipFile(source_dir / f"deacot{year}.zip", "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("annual.txt", frame.to_csv(index=False))
+
+
+def test_backfill_resumes_and_discards_invalid_years(tmp_path: Path, monkeypatch, capsys):
+    csv_files = {int(path.stem.split("_")[-1]): path
+                 for path in write_fixtures(tmp_path / "fixtures", range(2021, 2024), markets=4)}
+    source_dir = tmp_path / "archives"
+    source_dir.mkdir()
+    for year, csv_path in csv_files.items():
+        _write_archive(source_dir, year, csv_path)
+    # Archivio 2022 con i dati del 2021: la validazione dell'anno fallisce
+    _write_archive(source_dir, 2022, csv_files[2021])
+
+    csv_dir = tmp_path / "csv"
+    csv_dir.mkdir()
+    family = dataclasses.replace(LEGACY, dataset_dir=tmp_path / "parquet" / "legacy_futures")
+    manifest_path = tmp_path / "manifest.json"
+    monkeypatch.setattr(cot_families, "COT_CSV_DIR", csv_dir)
+    monkeypatch.setattr(pipeline, "ensure_directories", lambda: None)
+    monkeypatch.setattr(pipeline, "load_manifest", lambda: load_manifest(manifest_path))
+    monkeypatch.setattr(pipeline, "save_manifest",
+                        lambda manifest: save_manifest(manifest, manifest_path))
+    events = []
+    monkeypatch.setattr(pipeline.run_metrics, "event",
+                        lambda name, level="info", **fields: events.append((name, fields["year"])))
+    replaced = []
+    real_replace = os.replace
+    monkeypatch.setattr(os, "replace",
+                        lambda src, dst: replaced.append((Path(src), Path(dst))) or real_replace(src, dst))
+    fetched = []
+    real_fetch = pipeline.fetch_year_archive
+    monkeypatch.setattr(pipeline, "fetch_year_archive",
+                        lambda year, *args, **kwargs: fetched.append(year) or real_fetch(year, *args, **kwargs))
+
+    assert pipeline.backfill(2021, 2023, workers=2, source_dir=source_dir, families=[family]) == 1
+    assert "[ERROR] legacy 2022" in capsys.readouterr().out
+    assert events == [("backfill_failed", 2022)]
+
+    outputs = [path for year in (2021, 2023)
+               for path in (family.csv_path(year), partition_path(family.dataset_dir, year))]
+    assert all(path.exists() for path in outputs)
+    # Ogni file finale nasce dal rename di un .tmp completo
+    destinations = {dst: src for src, dst in replaced}
+    assert all(destinations[path].name == path.name + ".tmp" for path in outputs)
+    # L'anno invalido non lascia ne' CSV ne' Parquet, e nessun .tmp resta in giro
+    assert not family.csv_path(2022).exists()
+    assert not partition_path(family.dataset_dir, 2022).exists()
+    assert not list(tmp_path.rglob("*.tmp"))
+
+    # Rilancio con l'archivio corretto: si rifa' solo il 2022
+    _write_archive(source_dir, 2022, csv_files[2022])
+    fetched.clear()
+    assert pipeline.backfill(2021, 2023, workers=2, source_dir=source_dir, families=[family]) == 0
+    assert fetched == [2022]
+    out = capsys.readouterr().out
+    assert "[CHECK] legacy 2021: gia presente" in out
+    assert "[CHECK] legacy 2023: gia presente" in out
+    assert partition_path(family.dataset_dir, 2022).exists()
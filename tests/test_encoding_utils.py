@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+"""Scrittura atomica dei file di ReportSink (shared/encoding_utils.py)."""
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+import pytest
+
+from shared.encoding_utils import ReportSink
+
+
+def test_failed_replace_keeps_previous_report(tmp_path: Path, monkeypatch):
+    report = tmp_path / "report.txt"
+    with ReportSink(console=False, tee_file_utf8=report) as sink:
+        sink.write("riga 1")
+
+    def fail(src, dst):
+        raise OSError("disco pieno")
+
+    monkeypatch.setattr(os, "replace", fail)
+    with pytest.raises(OSError):
+        with ReportSink(console=False, tee_file_utf8=report) as sink:
+            sink.write("riga 2")
+
+    assert report.read_text(encoding="utf-8-sig") == "riga 1\n"
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["report.txt"]
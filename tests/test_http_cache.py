@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""Richieste condizionali di shared/cot_fetch.py e update_family contro un server HTTP locale."""
+from __future__ import annotations
+
+import dataclasses
+import io
+import threading
+import zipfile
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic import write_fixtures
+from scripts.cot import update_cot_pipeline as pipeline
+from shared import cot_families
+from shared.cot_families import LEGACY
+from shared.cot_fetch import load_validator_cache, probe_year_archive, remember_validators
+from shared.cot_manifest import load_manifest
+
+ETAG = '"deacot2024-v1"'
+LAST_MODIFIED = "Tue, 08 Oct 2024 19:30:00 GMT"
+
+
+@pytest.fixture
+def cftc_server(tmp_path: Path):
+    """Server con ``/deacot2024.zip``: ETag/Last-Modified e 304 se il client li rimanda."""
+    csv_path = write_fixtures(tmp_path / "fixtures", range(2024, 2025), markets=4)[0]
+    frame = pd.read_csv(csv_path, sep="\t", dtype=str, keep_default_na=False)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("annual.txt", frame.to_csv(index=False))
+    payload = buffer.getvalue()
+    requests = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests.append(dict(self.headers))
+            if self.path != "/deacot2024.zip":
+                self.send_error(404)
+                return
+            if self.headers.get("If-None-Match") == ETAG:
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("ETag", ETAG)
+            self.send_header("Last-Modified", LAST_MODIFIED)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}/deacot{{year}}.zip", requests
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_conditional_download(cftc_server, tmp_path: Path, monkeypatch):
+    url_template, requests = cftc_server
+    csv_dir = tmp_path / "csv"
+    cache_path = tmp_path / "http_cache.json"
+    family = dataclasses.replace(LEGACY, archive_template=url_template,
+                                 dataset_dir=tmp_path / "parquet" / "legacy_futures")
+    manifest = load_manifest(tmp_path / "manifest.json")
+    monkeypatch.setattr(cot_families, "COT_CSV_DIR", csv_dir)
+    monkeypatch.setattr(pipeline, "ensure_directories", lambda: None)
+    csv_path = family.csv_path(2024)
+
+    saved_with_csv = []
+
+    def remember(probe, max_report_date):
+        saved_with_csv.append(csv_path.exists())
+        remember_validators(probe, max_report_date, cache_path=cache_path)
+
+    monkeypatch.setattr(pipeline, "remember_validators", remember)
+    probe = partial(probe_year_archive, 2024, cache_path=cache_path, url_template=url_template)
+
+    # Scrittura del CSV fallita (directory assente): nessun validatore salvato
+    assert pipeline.update_family(family, probe(), manifest) is None
+    assert saved_with_csv == []
+    assert load_validator_cache(cache_path) == {}
+
+    # 200: il corpo del probe e' il download, niente seconda GET
+    csv_dir.mkdir()
+    result = probe()
+    assert result.modified and "If-None-Match" not in requests[-1]
+    assert pipeline.update_family(family, result, manifest) == csv_path
+    assert len(requests) == 2
+    assert saved_with_csv == [True]
+    entry = load_validator_cache(cache_path)[url_template.format(year=2024)]
+    assert (entry["etag"], entry["last_modified"]) == (ETAG, LAST_MODIFIED)
+
+    # 304: nessun trasferimento e nessun download
+    written = csv_path.stat().st_mtime_ns
+    result = probe()
+    assert not result.modified and result.payload is None
+    assert requests[-1]["If-None-Match"] == ETAG
+    assert requests[-1]["If-Modified-Since"] == LAST_MODIFIED
+    assert pipeline.update_family(family, result, manifest) is None
+    assert len(requests) == 3
+    assert csv_path.stat().st_mtime_ns == written
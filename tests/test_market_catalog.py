@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""Versione del catalogo e cache del resolver di shared/market_catalog.py."""
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+import duckdb
+
+from scripts.cot.sync_complete import sync
+from shared import market_catalog
+from shared.market_catalog import catalog_version, resolve_symbols
+
+RULES = {"AUD": ("AUSTRALIAN DOLLAR", None), "GBP": ("BRITISH POUND", None)}
+
+
+def test_view_version_follows_dataset_files(legacy_dataset: Path, tmp_path: Path):
+    database = tmp_path / "view.db"
+    assert sync(database=database, dataset_dir=legacy_dataset, mode="view", snapshot=False) == 0
+
+    con = duckdb.connect(str(database))
+    try:
+        version = catalog_version(con)
+        assert version and version == catalog_version(con)
+
+        # File riscritto (mtime diverso): la versione cambia senza leggere i dati
+        path = legacy_dataset / "year=2024" / "legacy_futures_2024.parquet"
+        stat = path.stat()
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+        assert catalog_version(con) != version
+    finally:
+        con.close()
+
+
+def test_resolver_cache_is_reused(legacy_dataset: Path, tmp_path: Path, monkeypatch):
+    database = tmp_path / "table.db"
+    assert sync(database=database, dataset_dir=legacy_dataset, snapshot=False) == 0
+    cache_path = tmp_path / "cache" / "market_resolver.json"
+
+    con = duckdb.connect(str(database))
+    try:
+        codes = resolve_symbols(con, RULES, cache_path)
+        assert codes == {"AUD": "232741", "GBP": "096742"}
+        # Solo la cache: nessun file temporaneo rimasto accanto
+        assert [path.name for path in cache_path.parent.iterdir()] == [cache_path.name]
+
+        def no_resolver(_con):
+            raise AssertionError("cache valida ignorata")
+
+        monkeypatch.setattr(market_catalog, "MarketResolver", no_resolver)
+        assert resolve_symbols(con, RULES, cache_path) == codes
+    finally:
+        con.close()
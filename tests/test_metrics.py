@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+"""Parita' di normalize_legacy_cot._compute_metrics con l'implementazione per gruppo."""
+from __future__ import annotations
+
+from benchmarks.bench_metrics import check_parity, reference_compute_metrics, synthetic_frame
+from scripts.cot.normalize_legacy_cot import _compute_metrics
+
+
+def test_compute_metrics_matches_reference():
+    # 60 mercati x 300 settimane: storie che iniziano in settimane diverse
+    # (i % 5), NaN nelle posizioni (i % 7) e net costante (i % 50)
+    frame = synthetic_frame(markets=60, weeks=300)
+    first_dates = frame.groupby("contract_market_code")["report_date"].min()
+    assert first_dates.nunique() > 1
+    assert frame["noncommercial_long"].isna().any()
+    constant = frame["noncommercial_long"] == frame["noncommercial_short"]
+    assert constant.groupby(frame["contract_market_code"]).all().any()
+
+    expected = reference_compute_metrics(frame.copy())
+    actual = _compute_metrics(frame.copy())
+    assert check_parity(expected, actual) == []
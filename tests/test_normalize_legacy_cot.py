@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""Normalizzazione incrementale di normalize_legacy_cot.py contro il ricalcolo completo."""
+from __future__ import annotations
+
+import shutil
+from pathlib import Path
+
+import pandas as pd
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from scripts.cot import normalize_legacy_cot
+from scripts.cot.normalize_legacy_cot import market_parts, normalize
+from shared.cot_convert import dataset_files
+
+
+def _read(output: Path) -> pd.DataFrame:
+    frames = [pd.read_parquet(path) for path in sorted(output.glob("market=*/*.parquet"))]
+    frame = pd.concat(frames, ignore_index=True)
+    return frame.sort_values(["contract_market_code", "report_date"]).reset_index(drop=True)
+
+
+def test_incremental_reads_and_appends_only_new_weeks(legacy_dataset: Path, tmp_path: Path,
+                                                       monkeypatch):
+    # Dataset della settimana precedente: il 2024 si ferma a fine ottobre
+    previous = tmp_path / "previous" / legacy_dataset.name
+    shutil.copytree(legacy_dataset, previous)
+    last_year = previous / "year=2024" / "legacy_futures_2024.parquet"
+    table = pq.read_table(last_year)
+    pq.write_table(table.filter(pc.less(table["report_date"], pd.Timestamp("2024-11-01").date())),
+                   last_year)
+
+    output = tmp_path / "legacy_normalized"
+    normalize(dataset_files(previous), output, workers=1)
+    base_files = {path: path.stat().st_mtime_ns for path in output.glob("market=*/*.parquet")}
+
+    loaded = []
+    load_markets = normalize_legacy_cot._load_markets
+    monkeypatch.setattr(normalize_legacy_cot, "_load_markets",
+                        lambda paths, markets: loaded.extend(paths) or load_markets(paths, markets))
+    normalize(dataset_files(legacy_dataset), output, incremental=True, workers=1)
+
+    # Solo l'anno con settimane nuove; la storia gia' scritta resta intatta
+    assert {path.name for path in loaded} == {"legacy_futures_2024.parquet"}
+    assert {path: path.stat().st_mtime_ns for path in base_files} == base_files
+    code = _read(output)["contract_market_code"].iloc[0]
+    assert len(market_parts(output, code)) == 2
+
+    full = tmp_path / "full"
+    normalize(dataset_files(legacy_dataset), full, workers=1)
+    # Lo z-score incrementale puo' differire nell'ultima cifra decimale
+    pd.testing.assert_frame_equal(_read(output), _read(full), check_exact=False, rtol=1e-9)
+
+    # Un ricalcolo completo torna a un file per mercato
+    monkeypatch.undo()
+    normalize(dataset_files(legacy_dataset), output, workers=1)
+    assert len(market_parts(output, code)) == 1